@@ -0,0 +1,9 @@
+# Performance benchmarks for loopy's compile pipeline and generated code,
+# in the format of airspeed velocity (asv). Run them from the root of the
+# source tree using
+#
+#     asv run
+#
+# or compare two revisions using, e.g.,
+#
+#     asv continuous master HEAD
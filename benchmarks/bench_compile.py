@@ -0,0 +1,84 @@
+from __future__ import division, absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Compile pipeline benchmarks. The individual stages are timed with loopy's
+# disk caches disabled. Each timed call works on a fresh copy of the input
+# kernel, so that results memoized on the kernel object do not carry over
+# between repetitions.
+
+import loopy as lp
+
+from .kernels import KERNELS
+
+
+class CompileStages(object):
+    params = sorted(KERNELS)
+    param_names = ["kernel"]
+    timeout = 600
+
+    def setup(self, name):
+        self.kernel, _ = KERNELS[name]()
+
+        with lp.CacheMode(False):
+            self.preprocessed = lp.preprocess_kernel(self.kernel)
+            self.scheduled = lp.get_one_scheduled_kernel(self.preprocessed)
+
+    def time_preprocess(self, name):
+        with lp.CacheMode(False):
+            lp.preprocess_kernel(self.kernel.copy())
+
+    def time_schedule(self, name):
+        with lp.CacheMode(False):
+            lp.get_one_scheduled_kernel(self.preprocessed.copy())
+
+    def time_codegen(self, name):
+        with lp.CacheMode(False):
+            lp.generate_code(self.scheduled.copy())
+
+
+class CacheHit(object):
+    """Time a full trip through the compile pipeline when every stage is
+    found in the disk caches.
+    """
+
+    params = sorted(KERNELS)
+    param_names = ["kernel"]
+    timeout = 600
+
+    def setup(self, name):
+        self.kernel, _ = KERNELS[name]()
+
+        with lp.CacheMode(True):
+            self._compile(self.kernel)
+
+    def _compile(self, kernel):
+        kernel = lp.preprocess_kernel(kernel)
+        kernel = lp.get_one_scheduled_kernel(kernel)
+        return lp.generate_code(kernel)
+
+    def time_cache_hit(self, name):
+        with lp.CacheMode(True):
+            self._compile(self.kernel.copy())
+
+# vim: foldmethod=marker
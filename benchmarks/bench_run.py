@@ -0,0 +1,92 @@
+from __future__ import division, absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Execution benchmarks. These run on the CPU device of POCL so that results
+# are comparable across machines of the same type, and are skipped if POCL
+# is not available.
+
+import loopy as lp
+
+from .kernels import KERNELS
+
+
+def get_pocl_cpu_device():
+    import pyopencl as cl
+
+    for platform in cl.get_platforms():
+        if "Portable Computing Language" not in platform.name:
+            continue
+
+        for dev in platform.get_devices():
+            if dev.type & cl.device_type.CPU:
+                return dev
+
+    return None
+
+
+class Execution(object):
+    params = sorted(KERNELS)
+    param_names = ["kernel"]
+    timeout = 600
+
+    timing_rounds = 10
+
+    def setup(self, name):
+        import pyopencl as cl
+
+        dev = get_pocl_cpu_device()
+        if dev is None:
+            # asv: skip benchmark
+            raise NotImplementedError("POCL CPU device not available")
+
+        self.ctx = cl.Context([dev])
+        self.queue = cl.CommandQueue(self.ctx,
+                properties=cl.command_queue_properties.PROFILING_ENABLE)
+
+        kernel, self.parameters = KERNELS[name]()
+        self.compiled = lp.CompiledKernel(self.ctx, kernel)
+
+        from loopy.auto_test import make_ref_args
+        kernel_info = self.compiled.cl_kernel_info(frozenset())
+        self.args, _ = make_ref_args(kernel_info.kernel,
+                kernel_info.impl_arg_info, self.queue, self.parameters)
+        self.args["out_host"] = False
+
+        # build and warm up
+        self.compiled(self.queue, **self.args)
+        self.queue.finish()
+
+    def time_execute(self, name):
+        self.compiled(self.queue, **self.args)
+        self.queue.finish()
+
+    def track_device_time(self, name):
+        from loopy.benchmark import time_compiled_kernel
+        timing_data = time_compiled_kernel(self.queue, self.compiled, self.args,
+                warmup_rounds=0, timing_rounds=self.timing_rounds)
+        return float(timing_data.event_elapsed.min())
+
+    track_device_time.unit = "seconds"
+
+# vim: foldmethod=marker
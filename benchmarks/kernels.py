@@ -0,0 +1,280 @@
+from __future__ import division, absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# The kernels in this file follow those in test/test_linalg.py,
+# test/test_nbody.py, test/test_dg.py, test/test_sem_reagan.py and
+# proto-tests/test_fem_assembly.py. Each entry of KERNELS maps a name to a
+# function returning a tuple *(kernel, parameters)*, where *parameters* gives
+# values for the kernel's ValueArgs suitable for execution benchmarks.
+
+import numpy as np
+import loopy as lp
+
+
+# {{{ axpy
+
+def axpy():
+    dtype = np.float32
+    n = 2**22
+
+    knl = lp.make_kernel(
+            "[n] -> {[i]: 0<=i<n}",
+            "z[i] = a*x[i]+b*y[i]",
+            [
+                lp.ValueArg("a", dtype),
+                lp.GlobalArg("x", dtype, shape="n,"),
+                lp.ValueArg("b", dtype),
+                lp.GlobalArg("y", dtype, shape="n,"),
+                lp.GlobalArg("z", dtype, shape="n,"),
+                lp.ValueArg("n", np.int32, approximately=n),
+                ],
+            name="axpy", assumptions="n>=1")
+
+    knl = lp.split_iname(knl, "i", 256, outer_tag="g.0", inner_tag="l.0")
+
+    return knl, {"a": dtype(5), "b": dtype(7), "n": n}
+
+# }}}
+
+
+# {{{ matrix multiplication
+
+def matmul():
+    dtype = np.float32
+    n = 512
+
+    knl = lp.make_kernel(
+            "{[i,j,k]: 0<=i,j,k<n}",
+            "c[i, j] = sum(k, a[i, k]*b[k, j])",
+            [
+                lp.GlobalArg("a,b,c", dtype, shape=("n", "n"), order="C"),
+                lp.ValueArg("n", np.int32),
+                ],
+            name="matmul", assumptions="n>=16 and n mod 16 = 0")
+
+    knl = lp.split_iname(knl, "i", 16,
+            outer_tag="g.0", inner_tag="l.1")
+    knl = lp.split_iname(knl, "j", 16,
+            outer_tag="g.1", inner_tag="l.0")
+    knl = lp.split_iname(knl, "k", 16)
+    knl = lp.add_prefetch(knl, "a", ["k_inner", "i_inner"])
+    knl = lp.add_prefetch(knl, "b", ["j_inner", "k_inner"])
+
+    return knl, {"n": n}
+
+# }}}
+
+
+# {{{ n-body
+
+def nbody():
+    dtype = np.float32
+    n = 3000
+
+    knl = lp.make_kernel(
+            "[N] -> {[i,j,k]: 0<=i,j<N and 0<=k<3 }",
+            [
+                "axdist(k) := x[i,k]-x[j,k]",
+                "invdist := rsqrt(sum_float32(k, axdist(k)**2))",
+                "pot[i] = sum_float32(j, if(i != j, invdist, 0))",
+            ], [
+                lp.GlobalArg("x", dtype, shape="N,3", order="C"),
+                lp.GlobalArg("pot", dtype, shape="N", order="C"),
+                lp.ValueArg("N", np.int32),
+            ], name="nbody", assumptions="N>=1")
+
+    knl = lp.expand_subst(knl)
+    knl = lp.split_iname(knl, "i", 256,
+            outer_tag="g.0", inner_tag="l.0")
+    knl = lp.split_iname(knl, "j", 256)
+    knl = lp.add_prefetch(knl, "x[j,k]", ["j_inner", "k"],
+            ["x_fetch_j", "x_fetch_k"])
+    knl = lp.add_prefetch(knl, "x[i,k]", ["k"], default_tag=None)
+    knl = lp.tag_inames(knl, dict(x_fetch_k="unr"))
+    knl = lp.set_loop_priority(knl, ["j_outer", "j_inner"])
+
+    return knl, {"N": n}
+
+# }}}
+
+
+# {{{ DG volume term
+
+def dg_volume():
+    import pyopencl.array as cl_array
+
+    dtype = np.float32
+    dtype4 = cl_array.vec.float4
+
+    N = 3  # noqa
+    Np = (N+1)*(N+2)*(N+3)//6  # noqa
+
+    knl = lp.make_kernel(
+            "{[n,m,k]: 0<= n,m < Np and 0<= k < K}",
+            """
+                <> du_drst = sum(m, DrDsDt[n,m]*u[k,m])
+                <> dv_drst = sum(m, DrDsDt[n,m]*v[k,m])
+                <> dw_drst = sum(m, DrDsDt[n,m]*w[k,m])
+                <> dp_drst = sum(m, DrDsDt[n,m]*p[k,m])
+
+                # volume flux
+                rhsu[k,n] = dot(drst_dx[k],dp_drst)
+                rhsv[k,n] = dot(drst_dy[k],dp_drst)
+                rhsw[k,n] = dot(drst_dz[k],dp_drst)
+                rhsp[k,n] = dot(drst_dx[k], du_drst) + dot(drst_dy[k], dv_drst) \
+                    + dot(drst_dz[k], dw_drst)
+                """,
+            [
+                lp.GlobalArg("u,v,w,p,rhsu,rhsv,rhsw,rhsp",
+                    dtype, shape="K, Np", order="C"),
+                lp.GlobalArg("DrDsDt", dtype4, shape="Np, Np", order="C"),
+                lp.GlobalArg("drst_dx,drst_dy,drst_dz", dtype4, shape="K",
+                    order="F"),
+                lp.ValueArg("K", np.int32, approximately=1000),
+                ],
+            name="dg_volume", assumptions="K>=1",
+            defines=dict(Np=Np))
+
+    knl = lp.tag_inames(knl, dict(n="l.0"))
+    knl = lp.split_iname(knl, "k", 3, outer_tag="g.0", inner_tag="l.1")
+    knl = lp.add_prefetch(knl, "DrDsDt[:,:]")
+
+    return knl, {"K": 10000}
+
+# }}}
+
+
+# {{{ spectral element 2D Laplacian
+
+def sem_laplacian_2d():
+    dtype = np.float32
+    n = 8
+
+    from pymbolic import var
+    K_sym = var("K")  # noqa
+
+    field_shape = (K_sym, n, n)
+
+    knl = lp.make_kernel(
+            "[K] -> {[i,j,e,m,o,gi]: 0<=i,j,m,o<%d and 0<=e<K and 0<=gi<3}" % n,
+            [
+                "ur(a,b) := sum(o, D[a,o]*u[e,o,b])",
+                "us(a,b) := sum(o, D[b,o]*u[e,a,o])",
+                "Gux(a,b) := G$x[0,e,a,b]*ur(a,b)+G$x[1,e,a,b]*us(a,b)",
+                "Guy(a,b) := G$y[1,e,a,b]*ur(a,b)+G$y[2,e,a,b]*us(a,b)",
+                "lap[e,i,j]  = "
+                "  sum(m, D[m,i]*Gux(m,j))"
+                "+ sum(m, D[m,j]*Guy(i,m))"
+            ],
+            [
+                lp.GlobalArg("u", dtype, shape=field_shape, order="C"),
+                lp.GlobalArg("lap", dtype, shape=field_shape, order="C"),
+                lp.GlobalArg("G", dtype, shape=(3,)+field_shape, order="C"),
+                lp.GlobalArg("D", dtype, shape=(n, n), order="C"),
+                lp.ValueArg("K", np.int32, approximately=1000),
+                ],
+            name="semlap2D", assumptions="K>=1")
+
+    knl = lp.duplicate_inames(knl, "o", within="id:ur")
+    knl = lp.duplicate_inames(knl, "o", within="id:us")
+
+    knl = lp.tag_inames(knl, dict(i="l.0", j="l.1", e="g.0"))
+
+    knl = lp.add_prefetch(knl, "D[:,:]")
+    knl = lp.add_prefetch(knl, "u[e, :, :]")
+
+    knl = lp.precompute(knl, "ur(m,j)", ["m", "j"])
+    knl = lp.precompute(knl, "us(i,m)", ["i", "m"])
+
+    knl = lp.precompute(knl, "Gux(m,j)", ["m", "j"])
+    knl = lp.precompute(knl, "Guy(i,m)", ["i", "m"])
+
+    knl = lp.add_prefetch(knl, "G$x[:,e,:,:]")
+    knl = lp.add_prefetch(knl, "G$y[:,e,:,:]")
+
+    knl = lp.tag_inames(knl, dict(o="unr"))
+    knl = lp.tag_inames(knl, dict(m="unr"))
+
+    knl = lp.set_instruction_priority(knl, "id:D_fetch", 5)
+
+    return knl, {"K": 1000}
+
+# }}}
+
+
+# {{{ FEM assembly
+
+def fem_assembly():
+    dtype = np.float32
+
+    dim = 2
+    nq = 40
+    nb = 20
+
+    from pymbolic import var
+    nc_sym = var("Nc")
+
+    knl = lp.make_kernel(
+            "[Nc] -> {[K,i,j,q,dx_axis,ax_b,ax_c]: 0<=K<Nc and 0<=i,j<%(Nb)d "
+            "and 0<=q<%(Nq)d and 0<=dx_axis,ax_b,ax_c<%(dim)d}"
+            % dict(Nb=nb, Nq=nq, dim=dim),
+            [
+                "dPsi_i(dxi) := sum_float32(ax_b,"
+                "  jacInv[ax_b,dxi,K,q] * DPsi[ax_b,i,q])",
+                "dPsi_j(dxi) := sum_float32(ax_c,"
+                "  jacInv[ax_c,dxi,K,q] * DPsi[ax_c,j,q])",
+                "A[K, i, j] = sum_float32(q, w[q] * jacDet[K,q] * ("
+                "sum_float32(dx_axis, dPsi_i(dx_axis)*dPsi_j(dx_axis))))"
+                ],
+            [
+                lp.GlobalArg("jacInv", dtype, shape=(dim, dim, nc_sym, nq),
+                    order="C"),
+                lp.GlobalArg("DPsi", dtype, shape=(dim, nb, nq), order="C"),
+                lp.GlobalArg("jacDet", dtype, shape=(nc_sym, nq), order="C"),
+                lp.GlobalArg("w", dtype, shape=(nq,), order="C"),
+                lp.GlobalArg("A", dtype, shape=(nc_sym, nb, nb), order="C"),
+                lp.ValueArg("Nc", np.int32, approximately=1000),
+                ],
+            name="lapquad", assumptions="Nc>=1")
+
+    knl = lp.tag_inames(knl, dict(ax_b="unr", ax_c="unr", dx_axis="unr"))
+    knl = lp.split_iname(knl, "K", 16, outer_iname="Ko", inner_iname="Kloc",
+            outer_tag="g.0")
+    knl = lp.tag_inames(knl, {"i": "l.1", "j": "l.0"})
+
+    return knl, {"Nc": 1000}
+
+# }}}
+
+
+KERNELS = {
+        "axpy": axpy,
+        "matmul": matmul,
+        "nbody": nbody,
+        "dg_volume": dg_volume,
+        "sem_laplacian_2d": sem_laplacian_2d,
+        "fem_assembly": fem_assembly,
+        }
+
+# vim: foldmethod=marker
@@ -58,15 +58,21 @@ from loopy.subst import extract_subst, expand_subst, temporary_to_subst
 from loopy.precompute import precompute
 from loopy.buffer import buffer_array
 from loopy.fusion import fuse_kernels
+from loopy.batch import to_batched
+from loopy.tiling import tile, choose_tile_sizes, TileSizes
 from loopy.padding import (split_arg_axis, find_padding_multiple,
         add_padding)
 from loopy.preprocess import (preprocess_kernel, realize_reduction,
         infer_unknown_types)
 from loopy.schedule import generate_loop_schedules, get_one_scheduled_kernel
 from loopy.codegen import generate_code, generate_body
-from loopy.compiled import CompiledKernel
+from loopy.compiled import (CompiledKernel, CompiledProgram,
+        EventDependencyTracker)
+from loopy.global_reduction import (split_reduction_across_groups,
+        TwoStageReductionKernel)
 from loopy.options import Options
 from loopy.auto_test import auto_test_vs_ref
+from loopy.autotune import autotune, tune_auto_local_size
 from loopy.frontend.fortran import (c_preprocess, parse_transformed_fortran,
         parse_fortran)
 
@@ -91,6 +97,8 @@ __all__ = [
         "extract_subst", "expand_subst", "temporary_to_subst",
         "precompute", "buffer_array",
         "fuse_kernels",
+        "to_batched",
+        "tile", "choose_tile_sizes", "TileSizes",
         "split_arg_axis", "find_padding_multiple", "add_padding",
 
         "get_dot_dependency_graph",
@@ -102,9 +110,11 @@ __all__ = [
         "generate_loop_schedules", "get_one_scheduled_kernel",
         "generate_code", "generate_body",
 
-        "CompiledKernel",
+        "CompiledKernel", "CompiledProgram", "EventDependencyTracker",
+        "split_reduction_across_groups", "TwoStageReductionKernel",
 
         "auto_test_vs_ref",
+        "autotune", "tune_auto_local_size",
 
         "Options",
 
@@ -117,7 +127,7 @@ __all__ = [
 
         "split_iname", "join_inames", "tag_inames", "duplicate_inames",
         "rename_iname", "link_inames", "remove_unused_inames",
-        "set_loop_priority", "add_prefetch"
+        "set_loop_priority", "add_prefetch", "register_tile",
         "find_instructions", "map_instructions",
         "set_instruction_priority", "add_dependency",
         "change_arg_to_image", "tag_data_axes",
@@ -184,6 +194,14 @@ def split_iname(kernel, split_iname, inner_length,
         slabs=(0, 0), do_tagged_check=True,
         within=None):
     """
+    :arg slabs: A tuple ``(head_it_count, tail_it_count)`` indicating the
+        number of leading/trailing iterations of *outer_iname*
+        for which separate code should be generated, or the string
+        ``"auto"`` to have these determined during code generation
+        such that the remaining 'bulk' iterations need no bounds checks
+        on *inner_iname* (e.g. if the loop length is not known to be
+        divisible by *inner_length*).
+        See :attr:`LoopKernel.iname_slab_increments`.
     :arg within: a stack match as understood by
         :func:`loopy.context_matching.parse_stack_match`.
     """
@@ -471,8 +489,12 @@ def tag_inames(kernel, iname_to_tag, force=False):
     iname_to_tag = dict((iname, parse_tag(tag))
             for iname, tag in six.iteritems(iname_to_tag))
 
-    from loopy.kernel.data import (ParallelTag, AutoLocalIndexTagBase,
-            ForceSequentialTag)
+    from loopy.kernel.data import (ParallelTag, LocalIndexTag,
+            AutoLocalIndexTagBase, ForceSequentialTag)
+
+    reduction_inames = set()
+    for insn in kernel.instructions:
+        reduction_inames.update(insn.reduction_inames())
 
     new_iname_to_tag = kernel.iname_to_tag.copy()
     for iname, new_tag in six.iteritems(iname_to_tag):
@@ -492,7 +514,10 @@ def tag_inames(kernel, iname_to_tag, force=False):
         if iname not in kernel.all_inames():
             raise ValueError("cannot tag '%s'--not known" % iname)
 
+        # Reductions over local inames are realized in parallel.
         if isinstance(new_tag, ParallelTag) \
+                and not (isinstance(new_tag, LocalIndexTag)
+                    and iname in reduction_inames) \
                 and isinstance(old_tag, ForceSequentialTag):
             raise ValueError("cannot tag '%s' as parallel--"
                     "iname requires sequential execution" % iname)
@@ -946,9 +971,87 @@ def _process_footprint_subscripts(kernel, rule_name, sweep_inames,
 # }}}
 
 
+def _vectorize_fetch(kernel, insn_id, vector_width):
+    """Split the iname of the last storage axis of the fetch instruction
+    *insn_id* so that each of its iterations fetches *vector_width*
+    contiguous entries using a vector load and store.
+
+    Note that the latter is enabled through a kernel-wide option.
+    """
+
+    from pymbolic.primitives import Subscript, Variable
+
+    insn = kernel.id_to_insn[insn_id]
+
+    if not isinstance(insn.assignee, Subscript):
+        raise LoopyError("cannot use wide loads for fetch '%s': "
+                "fetch has no storage axes" % insn_id)
+
+    fetch_iname = insn.assignee.index[-1]
+    if not (isinstance(fetch_iname, Variable)
+            and fetch_iname.name in kernel.all_inames()):
+        raise LoopyError("cannot use wide loads for fetch '%s': "
+                "last storage axis does not have a fetch iname" % insn_id)
+
+    fetch_iname = fetch_iname.name
+
+    # {{{ check footprint length
+
+    from loopy.isl_helpers import static_max_of_pw_aff
+    from loopy.symbolic import pw_aff_to_expr
+
+    bounds = kernel.get_iname_bounds(fetch_iname, constants_only=True)
+    length = pw_aff_to_expr(
+            static_max_of_pw_aff(bounds.size, constants_only=True))
+
+    if length % vector_width:
+        raise LoopyError("cannot use wide loads for fetch '%s': "
+                "fetch length %d along '%s' is not divisible by %d"
+                % (insn_id, length, fetch_iname, vector_width))
+
+    # }}}
+
+    fetch_tag = kernel.iname_to_tag.get(fetch_iname)
+    new_iname_to_tag = kernel.iname_to_tag.copy()
+    new_iname_to_tag.pop(fetch_iname, None)
+    kernel = kernel.copy(iname_to_tag=new_iname_to_tag)
+
+    inner_iname = kernel.get_var_name_generator()(fetch_iname+"_inner")
+    kernel = split_iname(kernel, fetch_iname, vector_width,
+            inner_iname=inner_iname,
+            outer_tag=fetch_tag, inner_tag="vec")
+
+    # {{{ check contiguity of the global access
+
+    from loopy.kernel.array import get_vector_memory_access_info
+    from pymbolic import evaluate
+
+    fetch_expr = kernel.id_to_insn[insn_id].expression
+    if not isinstance(fetch_expr, Subscript):
+        raise LoopyError("cannot use wide loads for fetch '%s': "
+                "fetched expression is not an array access" % insn_id)
+
+    index = fetch_expr.index
+    if not isinstance(index, tuple):
+        index = (index,)
+
+    if get_vector_memory_access_info(kernel.target,
+            kernel.arg_dict[fetch_expr.aggregate.name], index,
+            lambda expr: evaluate(expr, {}),
+            inner_iname, vector_width) is None:
+        raise LoopyError("cannot use wide loads for fetch '%s': "
+                "'%s' is not accessed contiguously along the last "
+                "storage axis" % (insn_id, fetch_expr.aggregate.name))
+
+    # }}}
+
+    return set_options(kernel, use_vload_vstore=True)
+
+
 def add_prefetch(kernel, var_name, sweep_inames=[], dim_arg_names=None,
         default_tag="l.auto", rule_name=None, footprint_subscripts=None,
-        fetch_bounding_box=False):
+        fetch_bounding_box=False, fetch_vector_width=None,
+        async_copy=False, double_buffer_iname=None, rolling_iname=None):
     """Prefetch all accesses to the variable *var_name*, with all accesses
     being swept through *sweep_inames*.
 
@@ -961,6 +1064,32 @@ def add_prefetch(kernel, var_name, sweep_inames=[], dim_arg_names=None,
         directly by putting an index expression into *var_name*. Substitutions
         such as those occurring in dimension splits are recorded and also
         applied to these indices.
+    :ivar fetch_vector_width: If not *None*, have each iteration of the fetch
+        load this many contiguous entries along the last storage axis as a
+        vector (and store them to the temporary the same way). This requires
+        the fetch length along that axis to be divisible by
+        *fetch_vector_width* and the fetched array to be contiguous along it.
+
+        .. note::
+
+            This sets :attr:`loopy.Options.use_vload_vstore` for the whole
+            kernel, not just for the fetch. Other vectorized instructions
+            will then also use ``vloadn``/``vstoren`` for their contiguous
+            accesses to scalar-typed arrays.
+    :ivar async_copy: If *True*, perform the fetch using
+        ``async_work_group_copy`` and ``wait_group_events`` instead of
+        per-work-item copy instructions. The fetched array must be contiguous
+        along the last storage axis, and the fetch may not be nested inside
+        local-parallel inames. *default_tag* is ignored, as the fetch
+        inames are removed. See :func:`loopy.async_copy.make_fetch_async`.
+    :ivar double_buffer_iname: If not *None* (requires *async_copy*), double-
+        buffer the fetched data along this sequential iname enclosing the
+        fetch, issuing the fetch for its next iteration while the current
+        one is computed.
+    :ivar rolling_iname: If not *None*, keep the fetched data in a rolling
+        buffer along this sequential iname, fetching only the part of the
+        footprint not already fetched in its previous iteration. See the
+        argument of the same name of :func:`precompute`.
 
     This function combines :func:`extract_subst` and :func:`precompute`.
     """
@@ -1040,10 +1169,20 @@ def add_prefetch(kernel, var_name, sweep_inames=[], dim_arg_names=None,
             _process_footprint_subscripts(
                     kernel,  rule_name, sweep_inames,
                     footprint_subscripts, arg)
+    if double_buffer_iname is not None and not async_copy:
+        raise LoopyError("double_buffer_iname requires async_copy")
+    if async_copy and fetch_vector_width is not None:
+        raise LoopyError("async_copy and fetch_vector_width may not be "
+                "used together")
+    if async_copy:
+        default_tag = None
+
+    fetch_insn_id = kernel.make_unique_instruction_id(based_on=rule_name)
     new_kernel = precompute(kernel, subst_use, sweep_inames,
             precompute_inames=dim_arg_names,
             default_tag=default_tag, dtype=arg.dtype,
-            fetch_bounding_box=fetch_bounding_box)
+            fetch_bounding_box=fetch_bounding_box,
+            insn_id=fetch_insn_id, rolling_iname=rolling_iname)
 
     # {{{ remove inames that were temporarily added by slice sweeps
 
@@ -1062,6 +1201,15 @@ def add_prefetch(kernel, var_name, sweep_inames=[], dim_arg_names=None,
 
     # }}}
 
+    if fetch_vector_width is not None:
+        new_kernel = _vectorize_fetch(
+                new_kernel, fetch_insn_id, fetch_vector_width)
+
+    if async_copy:
+        from loopy.async_copy import make_fetch_async
+        new_kernel = make_fetch_async(
+                new_kernel, fetch_insn_id, double_buffer_iname)
+
     # If the rule survived past precompute() (i.e. some accesses fell outside
     # the footprint), get rid of it before moving on.
     if rule_name in new_kernel.substitutions:
@@ -1072,6 +1220,92 @@ def add_prefetch(kernel, var_name, sweep_inames=[], dim_arg_names=None,
 # }}}
 
 
+# {{{ convenience: register_tile
+
+def register_tile(kernel, inames, inner_length, operands=None,
+        outer_tags={}):
+    """Have each work item compute a tile of *inner_length* points along
+    each of *inames*, keeping the values computed and read for the tile in
+    private memory (i.e. registers).
+
+    Each of *inames* is split using :func:`split_iname`, the inner inames
+    are tagged ``ilp.unr``, and the outer inames are given priority over
+    the remaining sequential loops (such as those of reductions), which
+    thereby end up outside the tile. Private temporaries written within
+    the tile, such as reduction accumulators, then obtain an entry for each
+    point of the tile (see
+    :func:`loopy.preprocess.duplicate_private_temporaries_for_ilp_and_vec`).
+    Lastly, each of *operands* is fetched (using :func:`add_prefetch`,
+    sweeping over the inner inames its accesses depend on) into a private
+    temporary, once per iteration of the loops surrounding the tile.
+
+    :arg inames: a list of inames, or a comma-separated string of them.
+    :arg operands: a list of names of arrays read within the tile, or
+        *None* to choose the arrays read within the tile whose accesses
+        depend on some, but not all, of *inames*, so that each value
+        fetched is used at multiple points of the tile.
+    :arg outer_tags: a :class:`dict` mapping (some of) *inames* to tags for
+        their outer parts, e.g. ``"g.0"``.
+    """
+
+    if isinstance(inames, str):
+        inames = [s.strip() for s in inames.split(",")]
+
+    inames = list(inames)
+    for iname in inames:
+        if iname not in kernel.all_inames():
+            raise LoopyError("unknown iname '%s'" % iname)
+
+    from loopy.kernel.tools import find_tile_operands
+    tile_operands = find_tile_operands(kernel, frozenset(inames))
+    if operands is None:
+        operands = sorted(
+                name for name, operand_inames in six.iteritems(tile_operands)
+                if operand_inames and operand_inames != frozenset(inames))
+    else:
+        if isinstance(operands, str):
+            operands = [s.strip() for s in operands.split(",")]
+
+        for name in operands:
+            if name not in tile_operands:
+                raise LoopyError("'%s' is not a read-only array read within "
+                        "the register tile" % name)
+
+    # {{{ split inames
+
+    iname_to_inner = {}
+    outer_inames = []
+    for iname in inames:
+        vng = kernel.get_var_name_generator()
+        outer_iname = vng(iname+"_outer")
+        inner_iname = vng(iname+"_inner")
+
+        kernel = split_iname(kernel, iname, inner_length,
+                outer_iname=outer_iname, inner_iname=inner_iname,
+                outer_tag=outer_tags.get(iname), inner_tag="ilp.unr")
+
+        iname_to_inner[iname] = inner_iname
+        outer_inames.append(outer_iname)
+
+    # }}}
+
+    kernel = set_loop_priority(kernel,
+            outer_inames + [
+                iname for iname in kernel.loop_priority
+                if iname not in outer_inames])
+
+    for name in operands:
+        kernel = add_prefetch(kernel, name,
+                sweep_inames=[
+                    iname_to_inner[iname] for iname in inames
+                    if iname in tile_operands[name]],
+                default_tag="ilp.unr")
+
+    return kernel
+
+# }}}
+
+
 # {{{ instruction processing
 
 def find_instructions(kernel, insn_match):
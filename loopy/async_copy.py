@@ -0,0 +1,460 @@
+from __future__ import division
+from __future__ import absolute_import
+from six.moves import range, zip
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+from islpy import dim_type
+from pymbolic import var
+from pymbolic.primitives import Subscript, Variable, Remainder
+
+from loopy.symbolic import IdentityMapper, get_dependencies
+from loopy.diagnostic import LoopyError
+
+
+# {{{ copy code generation
+
+class _CopyAxis(object):
+    def __init__(self, length, src_stride, dst_stride):
+        self.length = length
+        self.src_stride = src_stride
+        self.dst_stride = dst_stride
+
+
+def _merge_contiguous_axes(axes):
+    """Merge trailing axes of *axes* (a list of :class:`_CopyAxis`) into the
+    last one as long as both source and destination are contiguous across
+    them.
+    """
+    axes = axes[:]
+
+    while len(axes) > 1:
+        outer, inner = axes[-2:]
+        if not (outer.src_stride == inner.length*inner.src_stride
+                and outer.dst_stride == inner.length*inner.dst_stride):
+            break
+
+        axes[-2:] = [_CopyAxis(outer.length*inner.length,
+            inner.src_stride, inner.dst_stride)]
+
+    return axes
+
+
+def _get_copy_code(dst_name, dst_base, src_name, src_base, axes,
+        src_stride_names, row_names, event):
+    """Return C code copying the box described by *axes* (whose last entry
+    describes the contiguous rows) from *src_name* to *dst_name* using
+    ``async_work_group_copy``, chaining the copies into the event lvalue
+    *event*.
+    """
+
+    row_axes = axes[:-1]
+    last_axis = axes[-1]
+
+    dst_offset = [dst_base] if dst_base != "0" else []
+    src_offset = [src_base]
+    for row_axis, src_stride_name, row_name in zip(
+            row_axes, src_stride_names, row_names):
+        dst_offset.append("%s*%d" % (row_name, row_axis.dst_stride))
+        src_offset.append("%s*%s" % (row_name, src_stride_name))
+
+    lines = ["%s = (event_t) 0;" % event]
+
+    indent = ""
+    for row_axis, row_name in zip(row_axes, row_names):
+        lines.append("%sfor (int %s = 0; %s < %d; ++%s)" % (
+            indent, row_name, row_name, row_axis.length, row_name))
+        indent += "  "
+
+    lines.extend([
+        "%s%s = async_work_group_copy(" % (indent, event),
+        "%s    %s," % (indent, " + ".join([dst_name] + dst_offset)),
+        "%s    %s + %s," % (indent, src_name, " + ".join(src_offset)),
+        "%s    %d, %s);" % (indent, last_axis.length, event),
+        ])
+
+    return "\n".join(lines)
+
+# }}}
+
+
+class _SlotIndexAdder(IdentityMapper):
+    def __init__(self, temporary_name, slot_expr):
+        self.temporary_name = temporary_name
+        self.slot_expr = slot_expr
+
+    def map_variable(self, expr):
+        if expr.name == self.temporary_name:
+            raise LoopyError("unsubscripted use of '%s' cannot be "
+                    "double-buffered" % self.temporary_name)
+
+        return expr
+
+    def map_subscript(self, expr):
+        index = self.rec(expr.index)
+        if expr.aggregate.name != self.temporary_name:
+            return type(expr)(expr.aggregate, index)
+
+        if not isinstance(index, tuple):
+            index = (index,)
+
+        return type(expr)(expr.aggregate, (self.slot_expr,) + index)
+
+
+def make_fetch_async(kernel, insn_id, double_buffer_iname=None):
+    """Replace the instruction *insn_id*, which must copy a box of a global
+    array into a local temporary (such as the ones created by
+    :func:`loopy.add_prefetch`) with C instructions that perform the copy
+    using OpenCL's ``async_work_group_copy`` and wait for it using
+    ``wait_group_events``. The box must be contiguous in the global array
+    along its last axis, and the inames sweeping it must not be tagged. They
+    are removed from the kernel.
+
+    :arg double_buffer_iname: If not *None*, the name of a sequential iname
+        of the fetch. The temporary gets an additional leading axis of
+        length two, and the copy for the next iteration of
+        *double_buffer_iname* is issued before the computation of the current
+        one, so that the copy may overlap with it. Any other sequential
+        inames of the fetch must be nested outside of *double_buffer_iname*
+        (see :func:`loopy.kernel.tools.check_innermost_sequential_iname`).
+    """
+
+    from loopy.target.opencl import OpenCLTarget, event_dtype
+    if not isinstance(kernel.target, OpenCLTarget):
+        raise LoopyError("asynchronous copies are only available on "
+                "OpenCL targets")
+
+    from loopy.kernel.data import (
+            ExpressionInstruction, CInstruction, TemporaryVariable, GlobalArg,
+            LocalIndexTagBase)
+
+    insn = kernel.id_to_insn[insn_id]
+
+    def fail(msg):
+        raise LoopyError("cannot make fetch '%s' asynchronous: %s"
+                % (insn_id, msg))
+
+    # {{{ check fetch
+
+    if not isinstance(insn, ExpressionInstruction):
+        fail("not an expression instruction")
+
+    if not isinstance(insn.assignee, Subscript):
+        fail("fetch has no storage axes")
+
+    tv = kernel.temporary_variables.get(insn.assignee.aggregate.name)
+    if tv is None or tv.is_local is False:
+        fail("fetch does not write a local temporary")
+
+    storage_index = insn.assignee.index
+    if not isinstance(storage_index, tuple):
+        storage_index = (storage_index,)
+
+    if not all(isinstance(idx, Variable) for idx in storage_index):
+        fail("storage axes are not indexed by plain inames")
+
+    storage_inames = [idx.name for idx in storage_index]
+    if len(set(storage_inames)) != len(storage_inames):
+        fail("storage axes do not have distinct inames")
+
+    for iname in storage_inames:
+        if kernel.iname_to_tag.get(iname) is not None:
+            fail("storage iname '%s' is tagged" % iname)
+
+    if not isinstance(insn.expression, Subscript):
+        fail("fetched expression is not an array access")
+
+    ary = kernel.arg_dict.get(insn.expression.aggregate.name)
+    if not isinstance(ary, GlobalArg):
+        fail("fetched array is not a global argument")
+
+    if ary.dtype != tv.dtype:
+        fail("data types of '%s' and '%s' differ" % (ary.name, tv.name))
+
+    other_inames = kernel.insn_inames(insn) - frozenset(storage_inames)
+    for iname in other_inames:
+        if isinstance(kernel.iname_to_tag.get(iname), LocalIndexTagBase):
+            fail("fetch is nested inside local-parallel iname '%s'" % iname)
+
+    # }}}
+
+    # {{{ find copy geometry
+
+    from loopy.isl_helpers import static_max_of_pw_aff
+    from loopy.symbolic import pw_aff_to_expr, CoefficientCollector
+    from loopy.kernel.array import get_access_info
+    from pymbolic import evaluate
+
+    lengths = []
+    for iname in storage_inames:
+        bounds = kernel.get_iname_bounds(iname, constants_only=True)
+        lbound = pw_aff_to_expr(
+                static_max_of_pw_aff(bounds.lower_bound_pw_aff,
+                    constants_only=True))
+        length = pw_aff_to_expr(
+                static_max_of_pw_aff(bounds.size, constants_only=True))
+
+        if lbound != 0:
+            fail("storage iname '%s' does not start at zero" % iname)
+
+        lengths.append(length)
+
+    def get_strides(ary, index):
+        access_info = get_access_info(kernel.target, ary, index,
+                lambda expr: evaluate(expr, {}), None)
+        if len(access_info.subscripts) != 1:
+            fail("'%s' has more than one linear subscript" % ary.name)
+
+        coeffs = CoefficientCollector(storage_inames)(
+                access_info.subscripts[0])
+
+        strides = [coeffs.get(var(iname), 0) for iname in storage_inames]
+        if any(get_dependencies(stride) & set(storage_inames)
+                for stride in strides):
+            fail("subscript of '%s' is not linear" % ary.name)
+
+        return access_info.array_name, coeffs.get(1, 0), strides
+
+    src_index = insn.expression.index
+    if not isinstance(src_index, tuple):
+        src_index = (src_index,)
+
+    src_name, src_base, src_strides = get_strides(ary, src_index)
+    _, dst_base, dst_strides = get_strides(tv, storage_index)
+
+    if src_strides[-1] != 1 or dst_strides[-1] != 1:
+        fail("'%s' is not contiguous along the last storage axis" % ary.name)
+
+    if dst_base != 0 or not all(isinstance(s, int) for s in dst_strides):
+        fail("unexpected layout of '%s'" % tv.name)
+
+    axes = _merge_contiguous_axes([
+        _CopyAxis(length, src_stride, dst_stride)
+        for length, src_stride, dst_stride
+        in zip(lengths, src_strides, dst_strides)])
+
+    # }}}
+
+    var_name_gen = kernel.get_var_name_generator()
+    src_base_name = var_name_gen(tv.name + "_src_base")
+    src_stride_names = [
+            var_name_gen(tv.name + "_src_stride_%d" % i)
+            for i in range(len(axes) - 1)]
+    row_names = [
+            var_name_gen(tv.name + "_row_%d" % i)
+            for i in range(len(axes) - 1)]
+
+    src_stride_exprs = [
+            (name, axis.src_stride)
+            for name, axis in zip(src_stride_names, axes)]
+
+    fetch_deps = insn.insn_deps or frozenset()
+    new_temporary_variables = kernel.temporary_variables.copy()
+
+    if double_buffer_iname is None:
+        new_temporary_variables[tv.name] = tv.copy(is_local=True)
+
+        event = var_name_gen(tv.name + "_event")
+        new_insns = [CInstruction(
+            [(src_base_name, src_base)] + src_stride_exprs,
+            "event_t %s;\n%s\nwait_group_events(1, &%s);" % (
+                event,
+                _get_copy_code(tv.name, "0", src_name, src_base_name, axes,
+                    src_stride_names, row_names, event),
+                event),
+            read_variables=frozenset([ary.name]),
+            assignees=[var(tv.name)],
+            id=insn.id,
+            insn_deps=insn.insn_deps,
+            forced_iname_deps=other_inames,
+            priority=insn.priority)]
+
+        new_kernel_insns = [
+                other_insn for other_insn in kernel.instructions
+                if other_insn.id != insn_id] + new_insns
+
+    else:
+        # {{{ check double-buffering iname
+
+        dbi = double_buffer_iname
+        if dbi not in other_inames:
+            fail("fetch is not nested inside '%s'" % dbi)
+
+        from loopy.kernel.tools import check_innermost_sequential_iname
+        check_innermost_sequential_iname(kernel, dbi, other_inames)
+
+        dbi_bounds = kernel.get_iname_bounds(dbi)
+        dbi_lbound = pw_aff_to_expr(
+                static_max_of_pw_aff(dbi_bounds.lower_bound_pw_aff,
+                    constants_only=False))
+        dbi_ubound = pw_aff_to_expr(
+                static_max_of_pw_aff(dbi_bounds.upper_bound_pw_aff,
+                    constants_only=False))
+
+        # }}}
+
+        def get_slot(offset):
+            trip = var(dbi)
+            if offset:
+                trip = trip + offset
+            if dbi_lbound != 0:
+                trip = trip - dbi_lbound
+
+            return Remainder(trip, 2)
+
+        slot_stride = 1
+        for length in lengths:
+            slot_stride *= length
+
+        new_tv = TemporaryVariable(
+                name=tv.name,
+                dtype=tv.dtype,
+                shape=(2,) + tv.shape,
+                base_indices=(0,) + tv.base_indices,
+                is_local=True)
+        new_temporary_variables[tv.name] = new_tv
+
+        event = var_name_gen(tv.name + "_event")
+        new_temporary_variables[event] = TemporaryVariable(
+                name=event,
+                dtype=event_dtype,
+                shape=(2,),
+                is_local=False)
+
+        from pymbolic import substitute
+
+        slot_name = var_name_gen(tv.name + "_slot")
+        next_name = var_name_gen(dbi + "_next")
+        last_name = var_name_gen(dbi + "_last")
+
+        first_copy_id = kernel.make_unique_instruction_id(
+                based_on=insn.id + "_first")
+        wait_id = kernel.make_unique_instruction_id(
+                based_on=insn.id + "_wait", extra_used_ids=set([first_copy_id]))
+
+        first_src_base = substitute(src_base, {var(dbi): dbi_lbound})
+        next_src_base = substitute(src_base, {var(dbi): var(dbi) + 1})
+
+        next_copy_code = _get_copy_code(
+                tv.name, "%s*%d" % (slot_name, slot_stride),
+                src_name, src_base_name, axes, src_stride_names, row_names,
+                "%s[%s]" % (event, slot_name))
+
+        new_insns = [
+                CInstruction(
+                    [(src_base_name, first_src_base)] + src_stride_exprs,
+                    _get_copy_code(tv.name, "0", src_name, src_base_name,
+                        axes, src_stride_names, row_names, "%s[0]" % event),
+                    read_variables=frozenset([ary.name]),
+                    assignees=[var(tv.name), var(event)],
+                    id=first_copy_id,
+                    insn_deps=fetch_deps,
+                    forced_iname_deps=other_inames - frozenset([dbi]),
+                    priority=insn.priority),
+                CInstruction(
+                    [(slot_name, get_slot(0))],
+                    "wait_group_events(1, &%s[%s]);" % (event, slot_name),
+                    read_variables=frozenset([event]),
+                    assignees=[var(tv.name)],
+                    id=wait_id,
+                    insn_deps=fetch_deps | frozenset([first_copy_id]),
+                    forced_iname_deps=other_inames,
+                    priority=insn.priority),
+                CInstruction(
+                    [
+                        (next_name, var(dbi) + 1),
+                        (last_name, dbi_ubound),
+                        (slot_name, get_slot(1)),
+                        (src_base_name, next_src_base),
+                        ] + src_stride_exprs,
+                    "if (%s <= %s)\n{\n%s\n}" % (
+                        next_name, last_name,
+                        "\n".join(
+                            "  " + line
+                            for line in next_copy_code.split("\n"))),
+                    read_variables=frozenset([ary.name]),
+                    assignees=[var(tv.name), var(event)],
+                    id=insn.id,
+                    insn_deps=fetch_deps | frozenset([wait_id]),
+                    forced_iname_deps=other_inames,
+                    priority=insn.priority),
+                ]
+
+        # {{{ make users access the current slot
+
+        slot_adder = _SlotIndexAdder(tv.name, get_slot(0))
+
+        new_kernel_insns = []
+        for other_insn in kernel.instructions:
+            if other_insn.id == insn_id:
+                continue
+
+            if tv.name in other_insn.read_dependency_names():
+                if dbi not in (kernel.insn_inames(other_insn)
+                        | other_insn.reduction_inames()):
+                    raise LoopyError("cannot double-buffer fetch '%s': "
+                            "instruction '%s' uses '%s' outside of '%s'"
+                            % (insn_id, other_insn.id, tv.name, dbi))
+
+                other_insn = other_insn.with_transformed_expressions(
+                        slot_adder)
+                other_insn = other_insn.copy(
+                        insn_deps=(
+                            (other_insn.insn_deps or frozenset())
+                            | frozenset([wait_id, insn.id])),
+                        forced_iname_deps=(
+                            other_insn.forced_iname_deps
+                            | kernel.insn_inames(other_insn)))
+
+            new_kernel_insns.append(other_insn)
+
+        new_kernel_insns.extend(new_insns)
+
+        # }}}
+
+    # {{{ remove storage inames
+
+    new_domains = kernel.domains[:]
+    for iname in storage_inames:
+        home_domain_index = kernel.get_home_domain_index(iname)
+        domain = new_domains[home_domain_index]
+
+        dt, idx = domain.get_var_dict()[iname]
+        assert dt == dim_type.set
+
+        new_domains[home_domain_index] = domain.project_out(dt, idx, 1)
+
+    new_loop_priority = [
+            iname for iname in kernel.loop_priority
+            if iname not in storage_inames]
+
+    # }}}
+
+    return kernel.copy(
+            instructions=new_kernel_insns,
+            domains=new_domains,
+            loop_priority=new_loop_priority,
+            temporary_variables=new_temporary_variables)
+
+# vim: foldmethod=marker
@@ -353,7 +353,8 @@ def auto_test_vs_ref(
         ref_knl, ctx, test_knl, op_count=[], op_label=[], parameters={},
         print_ref_code=False, print_code=True, warmup_rounds=2,
         dump_binary=False,
-        fills_entire_output=None, do_check=True, check_result=None
+        fills_entire_output=None, do_check=True, check_result=None,
+        count_ops=False, estimate_traffic=False
         ):
     """Compare results of `ref_knl` to the kernels generated by
     scheduling *test_knl*.
@@ -361,6 +362,12 @@ def auto_test_vs_ref(
     :arg check_result: a callable with :class:`numpy.ndarray` arguments
         *(result, reference_result)* returning a a tuple (class:`bool`,
         message) indicating correctness/acceptability of the result
+    :arg count_ops: whether to count the floating point operations of the
+        test kernels, see :func:`loopy.benchmark.count_flops`.
+    :arg estimate_traffic: whether to estimate the memory traffic of the
+        test kernels, see :func:`loopy.benchmark.estimate_bytes_moved`.
+    :returns: a list of :class:`loopy.benchmark.BenchmarkResult` instances,
+        one for each kernel generated from *test_knl*.
     """
 
     import pyopencl as cl
@@ -508,8 +515,10 @@ def auto_test_vs_ref(
         else:
             test_kernels = [test_knl]
 
+    results = []
+
     from loopy.preprocess import infer_unknown_types
-    for i, kernel in enumerate(test_kernels):
+    for kernel_idx, kernel in enumerate(test_kernels):
         kernel = infer_unknown_types(kernel, expect_completion=True)
 
         compiled = CompiledKernel(ctx, kernel)
@@ -522,7 +531,7 @@ def auto_test_vs_ref(
         args["out_host"] = False
 
         print(75*"-")
-        print("Kernel #%d:" % i)
+        print("Kernel #%d:" % kernel_idx)
         print(75*"-")
         if print_code:
             print(compiled.get_highlighted_code())
@@ -564,75 +573,45 @@ def auto_test_vs_ref(
 
                     need_check = False
 
-        events = []
         queue.finish()
 
         logger.info("%s: warmup done" % (knl.name))
 
-        logger.info("%s: timing run" % (knl.name))
-
-        timing_rounds = warmup_rounds
-
-        while True:
-            from time import time
-            start_time = time()
-
-            evt_start = cl.enqueue_marker(queue)
-
-            for i in range(timing_rounds):
-                if not AUTO_TEST_SKIP_RUN:
-                    evt, _ = compiled(queue, **args)
-                    events.append(evt)
-                else:
-                    events.append(cl.enqueue_marker(queue))
-
-            evt_end = cl.enqueue_marker(queue)
-
-            queue.finish()
-            stop_time = time()
-
-            for evt in events:
-                evt.wait()
-            evt_start.wait()
-            evt_end.wait()
-
-            elapsed = (1e-9*events[-1].profile.END
-                    - 1e-9*events[0].profile.SUBMIT) \
-                    / timing_rounds
-            try:
-                elapsed_evt_2 = "%g" % \
-                        ((1e-9*evt_end.profile.START
-                            - 1e-9*evt_start.profile.START)
-                        / timing_rounds)
-            except cl.RuntimeError:
-                elapsed_evt_2 = "<unavailable>"
+        if AUTO_TEST_SKIP_RUN:
+            continue
 
-            elapsed_wall = (stop_time-start_time)/timing_rounds
+        logger.info("%s: timing run" % (knl.name))
 
-            if elapsed_wall * timing_rounds < 0.3:
-                timing_rounds *= 4
-            else:
-                break
+        from loopy.benchmark import time_compiled_kernel, make_benchmark_result
+        timing_data = time_compiled_kernel(queue, compiled, args,
+                warmup_rounds=0, timing_rounds=None)
 
         logger.info("%s: timing run done" % (knl.name))
 
+        result = make_benchmark_result(
+                "%s #%d" % (test_knl.name, kernel_idx),
+                compiled.cl_kernel_info(frozenset()), queue.device,
+                parameters, timing_data,
+                count_ops=count_ops, estimate_traffic=estimate_traffic)
+        results.append(result)
+
         rates = ""
         for cnt, lbl in zip(op_count, op_label):
-            rates += " %g %s/s" % (cnt/elapsed_wall, lbl)
+            rates += " %g %s/s" % (cnt/result.wall_elapsed, lbl)
 
-        print("elapsed: %g s event, %s s marker-event %g s wall "
-                "(%d rounds)%s" % (
-                    elapsed, elapsed_evt_2, elapsed_wall, timing_rounds, rates))
+        print("%s%s" % (result, rates))
 
         if do_check:
             ref_rates = ""
             for cnt, lbl in zip(op_count, op_label):
-                ref_rates += " %g %s/s" % (cnt/ref_elapsed, lbl)
+                ref_rates += " %g %s/s" % (cnt/ref_elapsed_wall, lbl)
             print("ref: elapsed: %g s event, %g s wall%s" % (
                     ref_elapsed, ref_elapsed_wall, ref_rates))
 
     # }}}
 
+    return results
+
 # }}}
 
 # vim: foldmethod=marker
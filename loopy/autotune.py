@@ -0,0 +1,360 @@
+from __future__ import division, absolute_import, print_function
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from pytools import Record
+
+from loopy.diagnostic import LoopyError
+from loopy.tools import LoopyKeyBuilder
+from loopy.version import DATA_MODEL_VERSION
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ parameter space
+
+def iterate_parameter_space(parameter_space):
+    """Yield all combinations of values in *parameter_space*, a
+    :class:`dict` mapping parameter names to lists of candidate values,
+    as dictionaries mapping parameter names to values.
+    """
+
+    names = sorted(parameter_space)
+
+    from pytools import generate_nonnegative_integer_tuples_below
+    for idx_tuple in generate_nonnegative_integer_tuples_below(
+            [len(parameter_space[name]) for name in names]):
+        yield dict(
+                (name, parameter_space[name][i])
+                for name, i in zip(names, idx_tuple))
+
+# }}}
+
+
+# {{{ device identification
+
+def get_device_key(device):
+    """Return a persistently hashable identifier for *device*, a
+    :class:`pyopencl.Device`.
+    """
+    return (device.platform.name, device.platform.version,
+            device.name, device.driver_version)
+
+# }}}
+
+
+# {{{ tuning database
+
+_tuning_db = None
+
+
+def get_tuning_db():
+    """Return the persistent :class:`dict` in which :func:`autotune` stores
+    its results, creating it upon first use.
+    """
+
+    global _tuning_db
+    if _tuning_db is None:
+        from pytools.persistent_dict import PersistentDict
+        _tuning_db = PersistentDict(
+                "loopy-tuning-db-v1-"+DATA_MODEL_VERSION,
+                key_builder=LoopyKeyBuilder())
+
+    return _tuning_db
+
+
+def _get_db_key(kernel, transform, parameter_space, parameters, device):
+    # Argument dtypes need to know the target to be pickled.
+    from loopy.preprocess import prepare_for_caching
+
+    return (
+            prepare_for_caching(kernel),
+            "%s.%s" % (transform.__module__, transform.__name__),
+            parameter_space,
+            parameters,
+            get_device_key(device))
+
+# }}}
+
+
+# {{{ variant compilation and timing
+
+class TuningVariant(Record):
+    """
+    .. attribute:: params
+
+        A :class:`dict` of transformation parameters.
+
+    .. attribute:: kernel
+
+        The transformed kernel, or *None* if the transformation failed.
+
+    .. attribute:: error
+
+        A string describing why the variant could not be built or run,
+        or *None*.
+
+    .. attribute:: elapsed
+
+        Per-launch device time in seconds (the minimum over the
+        timing rounds), or *None*.
+    """
+
+
+def _generate_variant_code(ctx, variant):
+    from loopy.compiled import CompiledKernel
+
+    try:
+        compiled = CompiledKernel(ctx, variant.kernel)
+        code = compiled.get_code()
+    except Exception as e:
+        variant.error = "%s: %s" % (type(e).__name__, str(e))
+        return None, None
+    else:
+        return compiled, code
+
+
+def _build_variant_code(ctx, variant, code):
+    import pyopencl as cl
+
+    try:
+        cl.Program(ctx, code).build(
+                options=variant.kernel.options.cl_build_options)
+    except cl.Error as e:
+        variant.error = "%s: %s" % (type(e).__name__, str(e))
+
+
+def _time_variant(queue, compiled, parameters, warmup_rounds, timing_rounds):
+    from loopy.auto_test import make_ref_args
+    from loopy.benchmark import time_compiled_kernel
+
+    kernel_info = compiled.cl_kernel_info(frozenset())
+    args, _ = make_ref_args(kernel_info.kernel, kernel_info.impl_arg_info,
+            queue, parameters)
+    args["out_host"] = False
+
+    timing_data = time_compiled_kernel(queue, compiled, args,
+            warmup_rounds=warmup_rounds, timing_rounds=timing_rounds)
+
+    return float(timing_data.event_elapsed.min())
+
+# }}}
+
+
+# {{{ main entrypoint
+
+def autotune(kernel, transform, parameter_space, queue, parameters={},
+        warmup_rounds=2, timing_rounds=10, compile_threads=None,
+        use_database=True, return_variants=False):
+    """Find the parameters for *transform* that make *kernel* run fastest on
+    the device of *queue*, and return the transformed kernel.
+
+    :arg transform: a function ``transform(kernel, **params)`` returning a
+        transformed kernel, where *params* is one point of
+        *parameter_space*. A variant for which *transform* raises
+        a :exc:`loopy.LoopyError` (for example because the parameters are
+        invalid for the kernel) is skipped.
+    :arg parameter_space: a :class:`dict` mapping names of keyword
+        arguments of *transform* to lists of candidate values. All
+        combinations of these are tried. Values must be persistently
+        hashable (e.g. numbers, strings and tuples of these).
+    :arg parameters: a :class:`dict` of values for the kernel's
+        :class:`loopy.ValueArg` arguments, used for timing. Array
+        arguments are created with random content.
+    :arg compile_threads: the number of threads used to build the
+        OpenCL programs of the variants. Defaults to the number of CPUs.
+    :arg use_database: if *True*, the best parameters are looked up in and
+        stored to a persistent tuning database, keyed by *kernel*,
+        *parameter_space*, *parameters*, the name of *transform* and the
+        device. If an entry is found, no timing takes place.
+    :arg return_variants: if *True*, return a tuple ``(kernel, variants)``,
+        where *variants* is a list of :class:`TuningVariant` instances
+        describing all tried variants, sorted by ascending time and
+        followed by the variants that could not be built or run. This
+        list is empty if the result was found in the database.
+
+    The types of all arguments of *kernel* must be known (see
+    :func:`loopy.add_and_infer_dtypes`).
+    """
+
+    import pyopencl as cl
+
+    device = queue.device
+
+    db_key = _get_db_key(kernel, transform, parameter_space, parameters,
+            device)
+
+    if use_database:
+        try:
+            best_params = get_tuning_db()[db_key]
+        except KeyError:
+            pass
+        else:
+            logger.info("%s: tuning database hit" % kernel.name)
+
+            result = transform(kernel, **best_params)
+            if return_variants:
+                return result, []
+            else:
+                return result
+
+    # {{{ generate variants
+
+    variants = []
+    for params in iterate_parameter_space(parameter_space):
+        try:
+            variant_kernel = transform(kernel, **params)
+        except LoopyError as e:
+            logger.info("%s: skipping variant %s: %s" % (
+                kernel.name, params, e))
+            variants.append(TuningVariant(
+                params=params, kernel=None, error=str(e), elapsed=None))
+        else:
+            variants.append(TuningVariant(
+                params=params, kernel=variant_kernel, error=None,
+                elapsed=None))
+
+    buildable_variants = [
+            variant for variant in variants
+            if variant.kernel is not None]
+
+    # }}}
+
+    # {{{ compile
+
+    # Code generation is not thread-safe (it relies on shared isl
+    # contexts), so it happens here. The expensive part, building the
+    # OpenCL programs, happens in parallel. The resulting binaries are then
+    # picked up from pyopencl's binary cache when the variants are timed.
+
+    logger.info("%s: building %d variants" % (
+        kernel.name, len(buildable_variants)))
+
+    ctx = queue.context
+
+    compiled_and_code = [
+            _generate_variant_code(ctx, variant)
+            for variant in buildable_variants]
+
+    if compile_threads is None:
+        import multiprocessing
+        compile_threads = multiprocessing.cpu_count()
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(compile_threads)
+    try:
+        pool.map(
+                lambda variant_and_code: _build_variant_code(
+                    ctx, *variant_and_code),
+                [(variant, code)
+                    for variant, (_, code) in zip(
+                        buildable_variants, compiled_and_code)
+                    if code is not None])
+    finally:
+        pool.close()
+        pool.join()
+
+    # }}}
+
+    # {{{ time
+
+    prof_queue = cl.CommandQueue(ctx, device,
+            properties=cl.command_queue_properties.PROFILING_ENABLE)
+
+    for variant, (compiled, _) in zip(buildable_variants, compiled_and_code):
+        if variant.error is not None:
+            continue
+
+        try:
+            variant.elapsed = _time_variant(prof_queue, compiled, parameters,
+                    warmup_rounds, timing_rounds)
+        except (cl.Error, LoopyError) as e:
+            variant.error = "%s: %s" % (type(e).__name__, str(e))
+
+        logger.info("%s: variant %s: %s" % (
+            kernel.name, variant.params,
+            variant.error if variant.error is not None
+            else "%g s" % variant.elapsed))
+
+    # }}}
+
+    timed_variants = sorted(
+            (variant for variant in variants if variant.elapsed is not None),
+            key=lambda variant: variant.elapsed)
+
+    if not timed_variants:
+        raise LoopyError("no variant of '%s' could be built and run:\n%s"
+                % (kernel.name, "\n".join(
+                    "%s: %s" % (variant.params, variant.error)
+                    for variant in variants)))
+
+    best = timed_variants[0]
+
+    if use_database:
+        get_tuning_db()[db_key] = best.params
+
+    if return_variants:
+        return best.kernel, timed_variants + [
+                variant for variant in variants
+                if variant.elapsed is None]
+    else:
+        return best.kernel
+
+# }}}
+
+
+# {{{ local size tuning
+
+def _set_auto_local_size(kernel, auto_local_size):
+    from loopy import set_options
+    return set_options(kernel, auto_local_size=auto_local_size)
+
+
+def tune_auto_local_size(kernel, queue, parameters={}, candidates=None,
+        **kwargs):
+    """Time *kernel* with a few candidate work group sizes for its inames
+    tagged ``l.auto`` (see :attr:`loopy.Options.auto_local_size`) on the
+    device of *queue*, and return it with the fastest one fixed.
+
+    The winner is stored in (and on subsequent calls retrieved from) the
+    tuning database, per device. See :func:`autotune` for the remaining
+    arguments.
+
+    :arg candidates: a list of tuples of work group sizes (axis 0 first).
+        Defaults to the result of
+        :func:`loopy.preprocess.get_auto_local_size_candidates`.
+    """
+
+    if candidates is None:
+        from loopy.preprocess import get_auto_local_size_candidates
+        candidates = get_auto_local_size_candidates(
+                kernel, device=queue.device)
+
+    return autotune(kernel, _set_auto_local_size,
+            dict(auto_local_size=[tuple(c) for c in candidates]),
+            queue, parameters=parameters, **kwargs)
+
+# }}}
+
+# vim: foldmethod=marker
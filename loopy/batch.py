@@ -0,0 +1,210 @@
+from __future__ import division, absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import six
+
+import islpy as isl
+
+from loopy.symbolic import (RuleAwareIdentityMapper,
+        SubstitutionRuleMappingContext)
+from loopy.diagnostic import LoopyError
+
+
+class _BatchVariableChanger(RuleAwareIdentityMapper):
+    def __init__(self, rule_mapping_context, batch_varying_args,
+            batch_iname_expr):
+        super(_BatchVariableChanger, self).__init__(rule_mapping_context)
+
+        self.batch_varying_args = batch_varying_args
+        self.batch_iname_expr = batch_iname_expr
+
+    def map_subscript(self, expr, expn_state):
+        if expr.aggregate.name not in self.batch_varying_args:
+            return super(_BatchVariableChanger, self).map_subscript(
+                    expr, expn_state)
+
+        idx = expr.index
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+
+        return type(expr)(
+                expr.aggregate,
+                (self.batch_iname_expr,)
+                + tuple(self.rec(i, expn_state) for i in idx))
+
+    def map_variable(self, expr, expn_state):
+        if expr.name not in self.batch_varying_args:
+            return super(_BatchVariableChanger, self).map_variable(
+                    expr, expn_state)
+
+        return expr.index(self.batch_iname_expr)
+
+
+def _get_batch_axis_stride(arg):
+    """Return a stride for a new, slowest-varying axis of *arg* that
+    places successive batch entries one after the other in memory.
+    """
+
+    from loopy.kernel.array import FixedStrideArrayDimTag
+
+    if arg.shape is None or any(s is None for s in arg.shape):
+        raise LoopyError("shape of argument '%s' is not fully known--"
+                "cannot add a batch axis" % arg.name)
+
+    if arg.dim_tags is None or not all(
+            isinstance(dim_tag, FixedStrideArrayDimTag)
+            for dim_tag in arg.dim_tags):
+        raise LoopyError("argument '%s' does not have a fixed-stride "
+                "layout--cannot add a batch axis" % arg.name)
+
+    from pymbolic.primitives import flattened_sum
+    return flattened_sum(
+            [1] + [
+                dim_tag.stride*(axis_len-1)
+                for dim_tag, axis_len in zip(arg.dim_tags, arg.shape)])
+
+
+def to_batched(kernel, nbatches, batch_varying_args,
+        batch_iname_prefix="ibatch"):
+    """Turn *kernel* into one that performs *nbatches* independent instances of
+    itself in a single launch. A new iname ranging over the batch is
+    introduced and tagged as an additional, outermost group axis, so that
+    each batch entry is processed by its own set of work groups.
+
+    :arg nbatches: an :class:`int`, or the name of a new integer
+        :class:`loopy.ValueArg` giving the number of batch entries.
+    :arg batch_varying_args: a list of names of arguments that
+        differ between batch entries. These receive a new leading axis
+        of length *nbatches*. Scalar :class:`loopy.ValueArg` instances
+        become one-dimensional :class:`loopy.GlobalArg` instances. All
+        other arguments are shared by all batch entries.
+
+    All arguments written by the kernel must be batch-varying.
+    """
+
+    from loopy.kernel.data import ValueArg, GlobalArg, GroupIndexTag
+    from loopy.kernel.array import ArrayBase, FixedStrideArrayDimTag
+
+    batch_varying_args = frozenset(batch_varying_args)
+
+    unknown_args = batch_varying_args - set(kernel.arg_dict)
+    if unknown_args:
+        raise LoopyError("batch-varying arguments not found: %s"
+                % ", ".join(sorted(unknown_args)))
+
+    shared_written_args = (
+            (kernel.get_written_variables() & set(kernel.arg_dict))
+            - batch_varying_args)
+    if shared_written_args:
+        raise LoopyError("arguments written by the kernel must be "
+                "batch-varying (offending arguments: %s)"
+                % ", ".join(sorted(shared_written_args)))
+
+    batched_params = batch_varying_args & kernel.all_params()
+    if batched_params:
+        raise LoopyError("domain parameters cannot be batch-varying "
+                "(offending arguments: %s)"
+                % ", ".join(sorted(batched_params)))
+
+    # {{{ find the group axis for the batch iname
+
+    used_group_axes = set(
+            tag.axis
+            for tag in six.itervalues(kernel.iname_to_tag)
+            if isinstance(tag, GroupIndexTag))
+
+    batch_axis = max(used_group_axes)+1 if used_group_axes else 0
+
+    if batch_axis >= 3:
+        raise LoopyError("kernel already uses group axes %s--no axis left "
+                "for the batch iname"
+                % ", ".join(str(ax) for ax in sorted(used_group_axes)))
+
+    # }}}
+
+    from pymbolic import var
+
+    var_name_gen = kernel.get_var_name_generator()
+    batch_iname = var_name_gen(batch_iname_prefix)
+    batch_iname_expr = var(batch_iname)
+
+    new_args = []
+
+    if isinstance(nbatches, str):
+        batch_dom_str = "[%(nbatches)s] -> {[%(iname)s]: 0<=%(iname)s<%(nbatches)s}"
+        nbatches_expr = var(nbatches)
+        new_args.append(ValueArg(nbatches, dtype=kernel.index_dtype))
+    else:
+        batch_dom_str = "{[%(iname)s]: 0<=%(iname)s<%(nbatches)s}"
+        nbatches_expr = nbatches
+
+    batch_domain = isl.BasicSet.read_from_str(kernel.isl_context,
+            batch_dom_str % dict(iname=batch_iname, nbatches=nbatches))
+
+    # {{{ add batch axis to batch-varying arguments
+
+    for arg in kernel.args:
+        if arg.name in batch_varying_args:
+            if isinstance(arg, ValueArg):
+                arg = GlobalArg(arg.name, arg.dtype, shape=(nbatches_expr,),
+                        order="C")
+
+            elif isinstance(arg, ArrayBase):
+                arg = arg.copy(
+                        shape=(nbatches_expr,) + arg.shape,
+                        dim_tags=(
+                            (FixedStrideArrayDimTag(_get_batch_axis_stride(arg)),)
+                            + arg.dim_tags))
+
+            else:
+                raise LoopyError("argument '%s' of unsupported type '%s' "
+                        "cannot be batch-varying"
+                        % (arg.name, type(arg).__name__))
+
+        new_args.append(arg)
+
+    # }}}
+
+    new_iname_to_tag = kernel.iname_to_tag.copy()
+    new_iname_to_tag[batch_iname] = GroupIndexTag(batch_axis)
+
+    kernel = kernel.copy(
+            domains=[batch_domain] + kernel.domains,
+            args=new_args,
+            iname_to_tag=new_iname_to_tag)
+
+    rule_mapping_context = SubstitutionRuleMappingContext(
+            kernel.substitutions, var_name_gen)
+    bvc = _BatchVariableChanger(rule_mapping_context,
+            batch_varying_args, batch_iname_expr)
+    kernel = rule_mapping_context.finish_kernel(bvc.map_kernel(kernel))
+
+    return kernel.copy(
+            instructions=[
+                insn.copy(
+                    forced_iname_deps=insn.forced_iname_deps | frozenset(
+                        [batch_iname]))
+                for insn in kernel.instructions])
+
+# vim: foldmethod=marker
@@ -0,0 +1,444 @@
+from __future__ import division, absolute_import, print_function
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import six
+
+import numpy as np
+from pytools import Record
+
+from loopy.diagnostic import LoopyError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ timing
+
+class TimingData(Record):
+    """
+    .. attribute:: event_elapsed
+
+        A :class:`numpy.ndarray` of device times (in seconds) of the
+        individual launches, from the launches' profiling events.
+
+    .. attribute:: wall_elapsed
+
+        Host wall time (in seconds) per launch, averaged over all
+        timed launches.
+
+    .. attribute:: rounds
+
+        The number of timed launches.
+    """
+
+
+def time_compiled_kernel(queue, compiled, args, warmup_rounds=2,
+        timing_rounds=None, min_wall_time=0.3):
+    """Run the :class:`loopy.CompiledKernel` *compiled* with the keyword
+    arguments *args* on *queue* and return :class:`TimingData`.
+
+    *queue* must have profiling enabled.
+
+    If *timing_rounds* is *None*, the number of timed launches starts
+    at *warmup_rounds* (or 1) and is quadrupled until the total wall time
+    exceeds *min_wall_time*.
+    """
+
+    import pyopencl as cl
+    from time import time
+
+    for i in range(warmup_rounds):
+        compiled(queue, **args)
+
+    queue.finish()
+
+    if timing_rounds is None:
+        rounds = max(warmup_rounds, 1)
+        grow = True
+    else:
+        rounds = timing_rounds
+        grow = False
+
+    while True:
+        events = []
+
+        start_time = time()
+        for i in range(rounds):
+            evt, _ = compiled(queue, **args)
+            events.append(evt)
+
+        queue.finish()
+        stop_time = time()
+
+        if grow and stop_time - start_time < min_wall_time:
+            rounds *= 4
+        else:
+            break
+
+    for evt in events:
+        evt.wait()
+
+    try:
+        event_elapsed = np.array([
+            1e-9*(evt.profile.END - evt.profile.START)
+            for evt in events])
+    except cl.RuntimeError:
+        raise LoopyError("profiling information unavailable--"
+                "the command queue must have profiling enabled")
+
+    return TimingData(
+            event_elapsed=event_elapsed,
+            wall_elapsed=(stop_time - start_time)/rounds,
+            rounds=rounds)
+
+# }}}
+
+
+# {{{ op and data volume counting
+
+def count_flops(kernel, parameters):
+    """Return the number of floating point operations performed by *kernel*
+    for the :class:`loopy.ValueArg` values in *parameters*, as
+    counted by :func:`loopy.statistics.get_op_poly`.
+    """
+
+    from loopy.statistics import get_op_poly
+    op_map = get_op_poly(kernel)
+
+    result = 0
+    for dtype, poly in six.iteritems(op_map.dict):
+        if dtype.kind in "fc":
+            result += poly.eval_with_dict(parameters)
+
+    return result
+
+
+def estimate_bytes_moved(kernel, impl_arg_info, parameters):
+    """Return an estimate of the global memory traffic of *kernel* in bytes.
+    Each array argument is counted as being read once in full if the
+    kernel reads it and written once in full if the kernel writes it.
+    This is the compulsory traffic, i.e. a lower bound.
+    """
+
+    from pymbolic import evaluate
+    from loopy.kernel.data import GlobalArg, ConstantArg, ImageArg
+
+    read_vars = kernel.get_read_variables()
+    written_vars = kernel.get_written_variables()
+
+    result = 0
+    for arg in impl_arg_info:
+        if arg.arg_class not in (GlobalArg, ConstantArg, ImageArg):
+            continue
+
+        if arg.shape is None or any(s is None for s in arg.shape):
+            raise LoopyError("array '%s' needs known shape to estimate the "
+                    "amount of data moved" % arg.name)
+
+        nbytes = arg.dtype.itemsize
+        for axis_len in evaluate(arg.shape, parameters):
+            nbytes *= axis_len
+
+        result += nbytes * (
+                int(arg.base_name in read_vars)
+                + int(arg.base_name in written_vars))
+
+    return result
+
+# }}}
+
+
+# {{{ benchmark results
+
+class BenchmarkResult(Record):
+    """
+    .. attribute:: label
+
+        A :class:`str` identifying the kernel variant. Results with the
+        same label are compared by :func:`compare_benchmarks`.
+
+    .. attribute:: kernel_name
+    .. attribute:: device
+
+        A :class:`str` describing the device the benchmark ran on.
+
+    .. attribute:: parameters
+
+        The values of the :class:`loopy.ValueArg` arguments used.
+
+    .. attribute:: rounds
+    .. attribute:: event_median
+    .. attribute:: event_min
+    .. attribute:: event_stddev
+
+        Statistics of the per-launch device time (in seconds).
+
+    .. attribute:: wall_elapsed
+
+        Host wall time per launch (in seconds).
+
+    .. attribute:: flops
+
+        The number of floating point operations per launch, or *None*
+        if not counted.
+
+    .. attribute:: bytes_moved
+
+        Estimated global memory traffic per launch in bytes (see
+        :func:`estimate_bytes_moved`), or *None* if not estimated.
+
+    .. attribute:: gflops_per_s
+    .. attribute:: gbytes_per_s
+
+        Rates achieved based on :attr:`event_median`, or *None*.
+
+    .. automethod:: get_json_dict
+    """
+
+    def __init__(self, label, kernel_name, device, parameters, timing_data,
+            flops=None, bytes_moved=None):
+        event_elapsed = timing_data.event_elapsed
+        event_median = float(np.median(event_elapsed))
+
+        def rate(count):
+            if count is None or event_median == 0:
+                return None
+            else:
+                return 1e-9*count/event_median
+
+        Record.__init__(self,
+                label=label,
+                kernel_name=kernel_name,
+                device=device,
+                parameters=parameters,
+                rounds=timing_data.rounds,
+                event_median=event_median,
+                event_min=float(np.min(event_elapsed)),
+                event_stddev=float(np.std(event_elapsed)),
+                wall_elapsed=timing_data.wall_elapsed,
+                flops=flops,
+                bytes_moved=bytes_moved,
+                gflops_per_s=rate(flops),
+                gbytes_per_s=rate(bytes_moved))
+
+    def get_json_dict(self):
+        """Return a :class:`dict` of the attributes of *self* that can be
+        serialized to JSON.
+        """
+
+        def jsonify(val):
+            if isinstance(val, np.generic):
+                return val.item()
+            else:
+                return val
+
+        result = dict(
+                (field, jsonify(getattr(self, field)))
+                for field in self.__class__.fields)
+        result["parameters"] = dict(
+                (name, jsonify(val))
+                for name, val in six.iteritems(self.parameters))
+        return result
+
+    def __str__(self):
+        result = ("%s: %g s median, %g s min, %g s stddev event, "
+                "%g s wall (%d rounds)" % (
+                    self.label, self.event_median, self.event_min,
+                    self.event_stddev, self.wall_elapsed, self.rounds))
+
+        if self.gflops_per_s is not None:
+            result += ", %g GFLOP/s" % self.gflops_per_s
+        if self.gbytes_per_s is not None:
+            result += ", %g GB/s" % self.gbytes_per_s
+
+        return result
+
+
+def make_benchmark_result(label, kernel_info, device, parameters, timing_data,
+        count_ops=True, estimate_traffic=True):
+    """Return a :class:`BenchmarkResult` for the :class:`TimingData`
+    *timing_data* obtained by running the kernel described by *kernel_info*
+    (as returned by :meth:`loopy.CompiledKernel.cl_kernel_info`) on the
+    :class:`pyopencl.Device` *device*.
+    """
+
+    kernel = kernel_info.kernel
+
+    flops = None
+    if count_ops:
+        flops = count_flops(kernel, parameters)
+
+    bytes_moved = None
+    if estimate_traffic:
+        bytes_moved = estimate_bytes_moved(kernel,
+                kernel_info.impl_arg_info, parameters)
+
+    return BenchmarkResult(
+            label=label,
+            kernel_name=kernel.name,
+            device="%s (%s)" % (device.name, device.platform.name),
+            parameters=parameters,
+            timing_data=timing_data,
+            flops=flops,
+            bytes_moved=bytes_moved)
+
+
+def save_benchmarks(results, filename):
+    """Write the :class:`BenchmarkResult` instances in *results* to the
+    file *filename* as JSON.
+    """
+    import json
+    with open(filename, "w") as outf:
+        json.dump([result.get_json_dict() for result in results], outf,
+                indent=2, sort_keys=True)
+
+
+def load_benchmarks(filename):
+    """Read a list of benchmark results written by :func:`save_benchmarks`.
+    The results are returned as :class:`dict` instances, as obtained from
+    :meth:`BenchmarkResult.get_json_dict`.
+    """
+    import json
+    with open(filename, "r") as inf:
+        return json.load(inf)
+
+# }}}
+
+
+# {{{ baseline comparison
+
+class BenchmarkComparison(Record):
+    """
+    .. attribute:: label
+    .. attribute:: baseline_elapsed
+    .. attribute:: elapsed
+
+        Median per-launch device times (in seconds).
+
+    .. attribute:: ratio
+
+        :attr:`elapsed` divided by :attr:`baseline_elapsed`.
+
+    .. attribute:: is_regression
+    """
+
+
+def compare_benchmarks(results, baseline, rel_tolerance=0.1):
+    """Compare *results* to *baseline* by the median device time of
+    results with matching labels. Labels that occur in only one of them
+    are ignored.
+
+    :arg results: a list of :class:`BenchmarkResult` instances or of
+        dictionaries as returned by :func:`load_benchmarks`.
+    :arg baseline: same as *results*.
+    :arg rel_tolerance: a result is considered a regression if it is slower
+        than the baseline by more than this fraction.
+    :returns: a list of :class:`BenchmarkComparison` instances, in the order
+        of *results*.
+    """
+
+    def as_dict(result):
+        if isinstance(result, BenchmarkResult):
+            return result.get_json_dict()
+        else:
+            return result
+
+    baseline_by_label = dict(
+            (entry["label"], entry)
+            for entry in (as_dict(b) for b in baseline))
+
+    comparisons = []
+    for result in results:
+        result = as_dict(result)
+        base = baseline_by_label.get(result["label"])
+        if base is None:
+            continue
+
+        ratio = result["event_median"]/base["event_median"]
+
+        comparisons.append(BenchmarkComparison(
+            label=result["label"],
+            baseline_elapsed=base["event_median"],
+            elapsed=result["event_median"],
+            ratio=ratio,
+            is_regression=ratio > 1 + rel_tolerance))
+
+    return comparisons
+
+# }}}
+
+
+# {{{ main entrypoint
+
+def benchmark(kernel, queue, parameters={}, label=None,
+        warmup_rounds=2, timing_rounds=None, min_wall_time=0.3,
+        count_ops=True, estimate_traffic=True):
+    """Time *kernel* on the device of *queue* and return a
+    :class:`BenchmarkResult`.
+
+    :arg parameters: a :class:`dict` of values for the kernel's
+        :class:`loopy.ValueArg` arguments. Array arguments are created with
+        random content.
+    :arg label: a label for the result. Defaults to the kernel's name.
+    :arg timing_rounds: see :func:`time_compiled_kernel`.
+    :arg count_ops: whether to count floating point operations (see
+        :func:`count_flops`) to determine :attr:`BenchmarkResult.gflops_per_s`.
+    :arg estimate_traffic: whether to estimate the data moved (see
+        :func:`estimate_bytes_moved`) to determine
+        :attr:`BenchmarkResult.gbytes_per_s`.
+
+    The types of all arguments of *kernel* must be known (see
+    :func:`loopy.add_and_infer_dtypes`).
+    """
+
+    import pyopencl as cl
+    from loopy.compiled import CompiledKernel
+    from loopy.auto_test import make_ref_args
+
+    prof_queue = cl.CommandQueue(queue.context, queue.device,
+            properties=cl.command_queue_properties.PROFILING_ENABLE)
+
+    compiled = CompiledKernel(queue.context, kernel)
+    kernel_info = compiled.cl_kernel_info(frozenset())
+
+    args, _ = make_ref_args(kernel_info.kernel, kernel_info.impl_arg_info,
+            prof_queue, parameters)
+    args["out_host"] = False
+
+    timing_data = time_compiled_kernel(prof_queue, compiled, args,
+            warmup_rounds=warmup_rounds, timing_rounds=timing_rounds,
+            min_wall_time=min_wall_time)
+
+    result = make_benchmark_result(
+            label if label is not None else kernel.name,
+            kernel_info, queue.device, parameters, timing_data,
+            count_ops=count_ops, estimate_traffic=estimate_traffic)
+
+    logger.info(str(result))
+
+    return result
+
+# }}}
+
+# vim: foldmethod=marker
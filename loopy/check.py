@@ -138,6 +138,13 @@ def check_for_inactive_iname_access(kernel):
                     % insn.id)
 
 
+def _has_single_iteration(kernel, iname):
+    try:
+        return kernel.get_constant_iname_length(iname) == 1
+    except (ValueError, isl.Error):
+        return False
+
+
 def check_for_write_races(kernel):
     from loopy.symbolic import DependencyMapper
     from loopy.kernel.data import ParallelTag, GroupIndexTag, LocalIndexTagBase
@@ -198,8 +205,10 @@ def check_for_write_races(kernel):
                 raise LoopyError("invalid assignee name in instruction '%s'"
                         % insn.id)
 
-            race_inames = \
-                    raceable_parallel_insn_inames - assignee_inames
+            race_inames = set(
+                    iname
+                    for iname in raceable_parallel_insn_inames - assignee_inames
+                    if not _has_single_iteration(kernel, iname))
 
             if race_inames:
                 warn(kernel, "write_race(%s)" % insn.id,
@@ -445,14 +454,112 @@ def pre_codegen_checks(kernel):
 
 # {{{ sanity-check for implemented domains of each instruction
 
-def check_implemented_domains(kernel, implemented_domains, code=None):
-    from islpy import dim_type
+def _find_implemented_domain_mismatch(idomains, insn_domain,
+        assumption_non_param, insn_inames):
+    """Return *None* if the union of *idomains* matches *insn_domain* on
+    *insn_inames*, or a message describing the mismatch otherwise.
+    """
 
     from islpy import align_two
 
+    insn_impl_domain = idomains[0]
+    for idomain in idomains[1:]:
+        insn_impl_domain = insn_impl_domain | idomain
+    assumptions, insn_impl_domain = align_two(
+            assumption_non_param, insn_impl_domain)
+    insn_impl_domain = (
+            (insn_impl_domain & assumptions)
+            .project_out_except(insn_inames, [dim_type.set]))
+
+    assumptions, insn_domain = align_two(assumption_non_param, insn_domain)
+    desired_domain = ((insn_domain & assumptions)
+        .project_out_except(insn_inames, [dim_type.set]))
+
+    insn_impl_domain, desired_domain = align_two(
+            insn_impl_domain, desired_domain)
+
+    if insn_impl_domain == desired_domain:
+        return None
+
+    i_minus_d = insn_impl_domain - desired_domain
+    d_minus_i = desired_domain - insn_impl_domain
+
+    parameter_inames = set(
+            insn_domain.get_dim_name(dim_type.param, i)
+            for i in range(insn_domain.dim(dim_type.param)))
+
+    lines = []
+    for kind, diff_set, gist_domain in [
+            ("implemented, but not desired", i_minus_d,
+                desired_domain.gist(insn_impl_domain)),
+            ("desired, but not implemented", d_minus_i,
+                insn_impl_domain.gist(desired_domain))]:
+
+        if diff_set.is_empty():
+            continue
+
+        diff_set = diff_set.coalesce()
+        pt = diff_set.sample_point()
+        assert not pt.is_void()
+
+        #pt_set = isl.Set.from_point(pt)
+        #lines.append("point implemented: %s" % (pt_set <= insn_impl_domain))
+        #lines.append("point desired: %s" % (pt_set <= desired_domain))
+
+        iname_to_dim = pt.get_space().get_var_dict()
+        point_axes = []
+        for iname in insn_inames | parameter_inames:
+            tp, dim = iname_to_dim[iname]
+            point_axes.append("%s=%d" % (
+                iname, pt.get_coordinate_val(tp, dim).to_python()))
+
+        lines.append(
+                "sample point in %s: %s" % (kind, ", ".join(point_axes)))
+        lines.append(
+                "gist of %s: %s" % (kind, gist_domain))
+
+    return ("implemented: %s\n\n"
+            "desired:%s\n\n%s"
+            % (insn_impl_domain, desired_domain, "\n".join(lines)))
+
+
+def _find_implemented_domain_mismatch_from_strings(args):
+    # Entry point for worker processes. isl objects are passed as strings
+    # so that neither they nor the kernel need to be pickled.
+
+    idomain_strs, insn_domain_str, assumptions_str, insn_inames = args
+    return _find_implemented_domain_mismatch(
+            [isl.Set(idomain_str) for idomain_str in idomain_strs],
+            isl.Set(insn_domain_str),
+            isl.Set(assumptions_str),
+            insn_inames)
+
+
+def check_implemented_domains(kernel, implemented_domains, code=None):
+    """Check that each instruction is executed for exactly the points
+    in its domain. How many instructions get checked (and whether that
+    happens in parallel) is controlled by
+    :attr:`loopy.Options.domain_check`,
+    :attr:`loopy.Options.domain_check_sample_size` and
+    :attr:`loopy.Options.domain_check_processes`.
+    """
+
+    check_level = kernel.options.domain_check
+    if check_level is None:
+        check_level = "full"
+
+    if check_level not in ["full", "sampled", "off"]:
+        raise LoopyError("invalid value for option 'domain_check': %s"
+                % check_level)
+
+    if check_level == "off":
+        return True
+
     last_idomains = None
     last_insn_inames = None
 
+    to_check = []
+
     for insn_id, idomains in six.iteritems(implemented_domains):
         insn = kernel.id_to_insn[insn_id]
 
@@ -471,75 +578,59 @@ def check_implemented_domains(kernel, implemented_domains, code=None):
 
         # }}}
 
-        insn_impl_domain = idomains[0]
-        for idomain in idomains[1:]:
-            insn_impl_domain = insn_impl_domain | idomain
-        assumption_non_param = isl.BasicSet.from_params(kernel.assumptions)
-        assumptions, insn_impl_domain = align_two(
-                assumption_non_param, insn_impl_domain)
-        insn_impl_domain = (
-                (insn_impl_domain & assumptions)
-                .project_out_except(insn_inames, [dim_type.set]))
-
-        insn_domain = kernel.get_inames_domain(insn_inames)
-        assumptions, insn_domain = align_two(assumption_non_param, insn_domain)
-        desired_domain = ((insn_domain & assumptions)
-            .project_out_except(insn_inames, [dim_type.set]))
+        to_check.append((insn_id, idomains, insn_inames))
+
+    if check_level == "sampled":
+        sample_size = kernel.options.domain_check_sample_size
+        if sample_size is None:
+            sample_size = 10
+
+        if sample_size < len(to_check):
+            # Seeded for reproducibility of failures
+            from random import Random
+            to_check = Random(kernel.name).sample(to_check, sample_size)
+
+    assumption_non_param = isl.BasicSet.from_params(kernel.assumptions)
+
+    nprocesses = kernel.options.domain_check_processes
+    if nprocesses is not None and nprocesses > 1 and len(to_check) > 1:
+        from multiprocessing import Pool
+        pool = Pool(nprocesses)
+        try:
+            mismatches = pool.map(
+                    _find_implemented_domain_mismatch_from_strings,
+                    [(
+                        [str(idomain) for idomain in idomains],
+                        str(kernel.get_inames_domain(insn_inames)),
+                        str(assumption_non_param),
+                        insn_inames)
+                        for insn_id, idomains, insn_inames in to_check])
+        finally:
+            pool.close()
+            pool.join()
+
+    else:
+        mismatches = (
+                _find_implemented_domain_mismatch(
+                    idomains, kernel.get_inames_domain(insn_inames),
+                    assumption_non_param, insn_inames)
+                for insn_id, idomains, insn_inames in to_check)
+
+    for (insn_id, _, _), mismatch in zip(to_check, mismatches):
+        if mismatch is None:
+            continue
 
-        insn_impl_domain, desired_domain = align_two(
-                insn_impl_domain, desired_domain)
-
-        if insn_impl_domain != desired_domain:
-            i_minus_d = insn_impl_domain - desired_domain
-            d_minus_i = desired_domain - insn_impl_domain
-
-            parameter_inames = set(
-                    insn_domain.get_dim_name(dim_type.param, i)
-                    for i in range(insn_domain.dim(dim_type.param)))
-
-            lines = []
-            for kind, diff_set, gist_domain in [
-                    ("implemented, but not desired", i_minus_d,
-                        desired_domain.gist(insn_impl_domain)),
-                    ("desired, but not implemented", d_minus_i,
-                        insn_impl_domain.gist(desired_domain))]:
-
-                if diff_set.is_empty():
-                    continue
-
-                diff_set = diff_set.coalesce()
-                pt = diff_set.sample_point()
-                assert not pt.is_void()
-
-                #pt_set = isl.Set.from_point(pt)
-                #lines.append("point implemented: %s" % (pt_set <= insn_impl_domain))
-                #lines.append("point desired: %s" % (pt_set <= desired_domain))
-
-                iname_to_dim = pt.get_space().get_var_dict()
-                point_axes = []
-                for iname in kernel.insn_inames(insn) | parameter_inames:
-                    tp, dim = iname_to_dim[iname]
-                    point_axes.append("%s=%d" % (
-                        iname, pt.get_coordinate_val(tp, dim).to_python()))
-
-                lines.append(
-                        "sample point in %s: %s" % (kind, ", ".join(point_axes)))
-                lines.append(
-                        "gist of %s: %s" % (kind, gist_domain))
-
-            if code is not None:
-                print(79*"-")
-                print("CODE:")
-                print(79*"-")
-                from loopy.compiled import get_highlighted_cl_code
-                print(get_highlighted_cl_code(code))
-                print(79*"-")
-
-            raise LoopyError("sanity check failed--implemented and desired "
-                    "domain for instruction '%s' do not match\n\n"
-                    "implemented: %s\n\n"
-                    "desired:%s\n\n%s"
-                    % (insn_id, insn_impl_domain, desired_domain, "\n".join(lines)))
+        if code is not None:
+            print(79*"-")
+            print("CODE:")
+            print(79*"-")
+            from loopy.compiled import get_highlighted_cl_code
+            print(get_highlighted_cl_code(code))
+            print(79*"-")
+
+        raise LoopyError("sanity check failed--implemented and desired "
+                "domain for instruction '%s' do not match\n\n%s"
+                % (insn_id, mismatch))
 
     # placate the assert at the call site
     return True
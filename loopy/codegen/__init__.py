@@ -212,12 +212,17 @@ class CodeGenerationState(object):
     .. attribute:: vectorization_info
 
         None or an instance of :class:`VectorizationInfo`
+
+    .. attribute:: induction_vars
+
+        A tuple of :class:`loopy.codegen.induction.InductionVariable`
+        instances maintained by the enclosing loops, outermost first.
     """
 
     def __init__(self, kernel, implemented_domain, implemented_predicates,
             seen_dtypes, seen_functions, var_subst_map,
             allow_complex,
-            vectorization_info=None):
+            vectorization_info=None, induction_vars=()):
         self.kernel = kernel
         self.implemented_domain = implemented_domain
         self.implemented_predicates = implemented_predicates
@@ -226,11 +231,12 @@ class CodeGenerationState(object):
         self.var_subst_map = var_subst_map.copy()
         self.allow_complex = allow_complex
         self.vectorization_info = vectorization_info
+        self.induction_vars = induction_vars
 
     # {{{ copy helpers
 
     def copy(self, implemented_domain=None, implemented_predicates=frozenset(),
-            var_subst_map=None, vectorization_info=None):
+            var_subst_map=None, vectorization_info=None, induction_vars=None):
 
         if vectorization_info is False:
             vectorization_info = None
@@ -247,7 +253,10 @@ class CodeGenerationState(object):
                 seen_functions=self.seen_functions,
                 var_subst_map=var_subst_map or self.var_subst_map,
                 allow_complex=self.allow_complex,
-                vectorization_info=vectorization_info)
+                vectorization_info=vectorization_info,
+                induction_vars=(
+                    self.induction_vars if induction_vars is None
+                    else induction_vars))
 
     def copy_and_assign(self, name, value):
         """Make a copy of self with variable *name* fixed to *value*."""
@@ -452,7 +461,7 @@ class ImplementedDataInfo(Record):
 # }}}
 
 
-code_gen_cache = PersistentDict("loopy-code-gen-cache-v3-"+DATA_MODEL_VERSION,
+code_gen_cache = PersistentDict("loopy-code-gen-cache-v5-"+DATA_MODEL_VERSION,
         key_builder=LoopyKeyBuilder())
 
 
@@ -464,6 +473,20 @@ def generate_code(kernel, device=None):
         warn("passing 'device' to generate_code() is deprecated",
                 DeprecationWarning, stacklevel=2)
 
+    preambles, code_str, impl_arg_info = generate_code_and_preambles(kernel)
+
+    return "".join(code for _, code in preambles) + code_str, impl_arg_info
+
+
+def generate_code_and_preambles(kernel):
+    """Like :func:`generate_code`, but return the preambles separately,
+    so that code for multiple kernels can share them.
+
+    :returns: a tuple ``(preambles, code_str, impl_arg_info)``, where
+        *preambles* is a list of tuples ``(tag, code)``, sorted by
+        and unique in *tag*.
+    """
+
     if kernel.schedule is None:
         from loopy.schedule import get_one_scheduled_kernel
         kernel = get_one_scheduled_kernel(kernel)
@@ -490,6 +513,10 @@ def generate_code(kernel, device=None):
     from loopy.preprocess import infer_unknown_types
     kernel = infer_unknown_types(kernel, expect_completion=True)
 
+    if kernel.options.share_temporary_storage:
+        from loopy.storage import share_temporary_storage
+        kernel = share_temporary_storage(kernel)
+
     from loopy.check import pre_codegen_checks
     pre_codegen_checks(kernel)
 
@@ -571,20 +598,18 @@ def generate_code(kernel, device=None):
             continue
 
         seen_preamble_tags.add(tag)
-        dedup_preambles.append(preamble)
+        dedup_preambles.append((tag, preamble))
 
     from loopy.tools import remove_common_indentation
-    preamble_codes = [
-            remove_common_indentation(lines) + "\n"
-            for lines in dedup_preambles]
-
-    code_str = "".join(preamble_codes) + code_str
+    preambles = [
+            (tag, remove_common_indentation(lines) + "\n")
+            for tag, lines in dedup_preambles]
 
     # }}}
 
     logger.info("%s: generate code: done" % kernel.name)
 
-    result = code_str, impl_arg_info
+    result = preambles, code_str, impl_arg_info
 
     if CACHING_ENABLED:
         code_gen_cache[input_kernel] = result
@@ -608,6 +633,10 @@ def generate_body(kernel):
     from loopy.preprocess import infer_unknown_types
     kernel = infer_unknown_types(kernel, expect_completion=True)
 
+    if kernel.options.share_temporary_storage:
+        from loopy.storage import share_temporary_storage
+        kernel = share_temporary_storage(kernel)
+
     from loopy.check import pre_codegen_checks
     pre_codegen_checks(kernel)
 
@@ -2,7 +2,6 @@
 
 from __future__ import division
 from __future__ import absolute_import
-import six
 
 __copyright__ = "Copyright (C) 2012 Andreas Kloeckner"
 
@@ -29,8 +28,7 @@ THE SOFTWARE.
 
 from loopy.codegen import gen_code_block
 import islpy as isl
-from loopy.schedule import (EnterLoop, LeaveLoop, RunInstruction, Barrier,
-        gather_schedule_subloop, generate_sub_sched_items)
+from loopy.schedule import EnterLoop, LeaveLoop, RunInstruction, Barrier
 
 
 def get_admissible_conditional_inames_for(kernel, sched_index):
@@ -38,19 +36,13 @@ def get_admissible_conditional_inames_for(kernel, sched_index):
     inames if there is a barrier nested somewhere within.
     """
 
-    from loopy.kernel.data import LocalIndexTag, HardwareParallelTag
+    sched_tables = kernel.get_schedule_tables()
+    hw_inames, nonlocal_hw_inames = kernel.hw_parallel_inames()
 
-    from loopy.schedule import find_active_inames_at, has_barrier_within
-    result = find_active_inames_at(kernel, sched_index)
-
-    has_barrier = has_barrier_within(kernel, sched_index)
-
-    for iname, tag in six.iteritems(kernel.iname_to_tag):
-        if isinstance(tag, HardwareParallelTag):
-            if not has_barrier or not isinstance(tag, LocalIndexTag):
-                result.add(iname)
-
-    return frozenset(result)
+    if sched_tables.has_barrier_within[sched_index]:
+        return sched_tables.active_inames[sched_index] | nonlocal_hw_inames
+    else:
+        return sched_tables.active_inames[sched_index] | hw_inames
 
 
 def generate_code_for_sched_index(kernel, sched_index, codegen_state):
@@ -105,22 +97,7 @@ def generate_code_for_sched_index(kernel, sched_index, codegen_state):
 
 
 def get_required_predicates(kernel, sched_index):
-    result = None
-    for _, sched_item in generate_sub_sched_items(kernel.schedule, sched_index):
-        if isinstance(sched_item, Barrier):
-            my_preds = frozenset()
-        elif isinstance(sched_item, RunInstruction):
-            my_preds = kernel.id_to_insn[sched_item.insn_id].predicates
-        else:
-            raise RuntimeError("unexpected schedule item type: %s"
-                    % type(sched_item))
-
-        if result is None:
-            result = my_preds
-        else:
-            result = result & my_preds
-
-    return result
+    return kernel.get_schedule_tables().required_predicates[sched_index]
 
 
 def group_by(l, key, merge):
@@ -150,6 +127,8 @@ def build_loop_nest(kernel, sched_index, codegen_state):
 
     # i.e. go up to the next LeaveLoop, and skip over inner loops.
 
+    sched_tables = kernel.get_schedule_tables()
+
     my_sched_indices = []
 
     i = sched_index
@@ -161,14 +140,8 @@ def build_loop_nest(kernel, sched_index, codegen_state):
 
         my_sched_indices.append(i)
 
-        if isinstance(sched_item, EnterLoop):
-            _, i = gather_schedule_subloop(
-                    kernel.schedule, i)
-        elif isinstance(sched_item, Barrier):
-            i += 1
-
-        elif isinstance(sched_item, RunInstruction):
-            i += 1
+        if isinstance(sched_item, (EnterLoop, Barrier, RunInstruction)):
+            i = sched_tables.loop_end[i]
         else:
             raise RuntimeError("unexpected schedule item type: %s"
                     % type(sched_item))
@@ -189,14 +162,13 @@ def build_loop_nest(kernel, sched_index, codegen_state):
         .. attribute:: used_inames_within
         """
 
-    from loopy.schedule import find_used_inames_within
     sched_index_info_entries = [
             ScheduleIndexInfo(
                 schedule_indices=[i],
                 admissible_cond_inames=(
                     get_admissible_conditional_inames_for(kernel, i)),
                 required_predicates=get_required_predicates(kernel, i),
-                used_inames_within=find_used_inames_within(kernel, i)
+                used_inames_within=sched_tables.used_inames_within[i]
                 )
             for i in my_sched_indices
             ]
@@ -241,7 +213,7 @@ def build_loop_nest(kernel, sched_index, codegen_state):
                     overapproximate=True)
 
     def build_insn_group(sched_index_info_entries, codegen_state,
-            done_group_lengths=set()):
+            done_group_lengths=frozenset()):
         """
         :arg done_group_lengths: A set of group lengths (integers) that grows
             from empty to include the longest found group and downwards with every
@@ -260,76 +232,97 @@ def build_loop_nest(kernel, sched_index, codegen_state):
         # considered down so that a callee cannot find a *longer* hoist group.)
         #
         # Upon return the hoist is wrapped around the returned code and
-        # build_insn_group calls itself for the remainder of schedule indices
+        # build_insn_group moves on to the remainder of schedule indices
         # that were not in the hoist group.
+        #
+        # Since the candidate conditional inames and predicates only ever
+        # shrink and the used inames only ever grow as a group is extended,
+        # the bounds checks only take on few distinct values along the way,
+        # and the (expensive) bounds check computation is cached below.
 
-        if not sched_index_info_entries:
-            return []
+        result = []
+
+        bounds_check_cache = BoundsCheckCache(
+                kernel, codegen_state.implemented_domain)
 
-        origin_si_entry = sched_index_info_entries[0]
-        current_iname_set = origin_si_entry.admissible_cond_inames
-        current_pred_set = (origin_si_entry.required_predicates
-                - codegen_state.implemented_predicates)
+        start = 0
+        while start < len(sched_index_info_entries):
+            origin_si_entry = sched_index_info_entries[start]
+            current_iname_set = origin_si_entry.admissible_cond_inames
+            current_pred_set = (origin_si_entry.required_predicates
+                    - codegen_state.implemented_predicates)
 
-        # {{{ grow schedule item group
+            # {{{ grow schedule item group
 
-        # Keep growing schedule item group as long as group fulfills minimum
-        # size requirement.
+            # Keep growing schedule item group as long as group fulfills
+            # minimum size requirement.
 
-        bounds_check_cache = BoundsCheckCache(
-                kernel, codegen_state.implemented_domain)
+            found_hoists = []
 
-        found_hoists = []
+            # i.e. the inames actually used in the group, only generate
+            # conditionals for those.
+            used_inames = frozenset()
 
-        candidate_group_length = 1
-        while candidate_group_length <= len(sched_index_info_entries):
-            if candidate_group_length in done_group_lengths:
-                candidate_group_length += 1
-                continue
+            max_group_length = len(sched_index_info_entries) - start
 
-            current_iname_set = (
-                    current_iname_set
-                    & sched_index_info_entries[candidate_group_length-1]
-                    .admissible_cond_inames)
-            current_pred_set = (
-                    current_pred_set
-                    & sched_index_info_entries[candidate_group_length-1]
-                    .required_predicates)
+            candidate_group_length = 1
+            while candidate_group_length <= max_group_length:
+                si_entry = sched_index_info_entries[
+                        start + candidate_group_length - 1]
 
-            # {{{ see which inames are actually used in group
+                used_inames = used_inames | si_entry.used_inames_within
 
-            # And only generate conditionals for those.
-            used_inames = set()
-            for sched_index_info_entry in \
-                    sched_index_info_entries[0:candidate_group_length]:
-                used_inames |= sched_index_info_entry.used_inames_within
+                if candidate_group_length in done_group_lengths:
+                    candidate_group_length += 1
+                    continue
 
-            # }}}
+                current_iname_set = (
+                        current_iname_set & si_entry.admissible_cond_inames)
+                current_pred_set = (
+                        current_pred_set & si_entry.required_predicates)
 
-            only_unshared_inames = kernel.remove_inames_for_shared_hw_axes(
-                    current_iname_set & used_inames)
+                only_unshared_inames = kernel.remove_inames_for_shared_hw_axes(
+                        current_iname_set & used_inames)
 
-            bounds_checks = bounds_check_cache(only_unshared_inames)
+                bounds_checks = bounds_check_cache(only_unshared_inames)
 
-            if (bounds_checks  # found a bounds check
-                    or current_pred_set
-                    or candidate_group_length == 1):
-                # length-1 must always be an option to reach the recursion base
-                # case below
-                found_hoists.append((candidate_group_length,
-                    bounds_checks, current_pred_set))
+                if (bounds_checks  # found a bounds check
+                        or current_pred_set
+                        or candidate_group_length == 1):
+                    # length-1 must always be an option to reach the recursion
+                    # base case below
+                    found_hoists.append((candidate_group_length,
+                        bounds_checks, current_pred_set))
 
-            if not bounds_checks and not current_pred_set:
-                # already no more checks possible, let's not waste time
-                # checking longer groups.
-                break
+                if not bounds_checks and not current_pred_set:
+                    # already no more checks possible, let's not waste time
+                    # checking longer groups.
+                    break
+
+                candidate_group_length += 1
+
+            # }}}
 
-            candidate_group_length += 1
+            # pick largest such group
+            group_length, bounds_checks, pred_checks = max(
+                    found_hoists, key=lambda hoist: hoist[0])
 
-        # }}}
+            result.extend(build_hoist_group(
+                    sched_index_info_entries[start:start+group_length],
+                    codegen_state, done_group_lengths,
+                    bounds_checks, pred_checks))
 
-        # pick largest such group
-        group_length, bounds_checks, pred_checks = max(found_hoists)
+            start += group_length
+
+            # Only the first group is constrained by the caller.
+            done_group_lengths = frozenset()
+
+        return result
+
+    def build_hoist_group(group_si_entries, codegen_state, done_group_lengths,
+            bounds_checks, pred_checks):
+        group_length = len(group_si_entries)
+        origin_si_entry = group_si_entries[0]
 
         check_set = None
         for cns in bounds_checks:
@@ -355,76 +348,73 @@ def build_loop_nest(kernel, sched_index, codegen_state):
                     | pred_checks)
 
         if is_empty:
-            result = []
-        else:
-            if group_length == 1:
-                # group only contains starting schedule item
-                def gen_code(inner_codegen_state):
-                    result = []
-                    for i in origin_si_entry.schedule_indices:
-                        inner = generate_code_for_sched_index(
-                            kernel, i, inner_codegen_state)
+            return []
 
-                        if inner is not None:
-                            result.append(inner)
+        if group_length == 1:
+            # group only contains starting schedule item
+            def gen_code(inner_codegen_state):
+                result = []
+                for i in origin_si_entry.schedule_indices:
+                    inner = generate_code_for_sched_index(
+                        kernel, i, inner_codegen_state)
 
-                    return result
+                    if inner is not None:
+                        result.append(inner)
 
-            else:
-                # recurse with a bigger done_group_lengths
-                def gen_code(inner_codegen_state):
-                    return build_insn_group(
-                            sched_index_info_entries[0:group_length],
-                            inner_codegen_state,
-                            done_group_lengths=(
-                                done_group_lengths | set([group_length])))
-
-            # gen_code returns a list
-
-            if bounds_checks or pred_checks:
-                from loopy.codegen import wrap_in_if
-                from loopy.codegen.bounds import constraint_to_code
-
-                prev_gen_code = gen_code
-
-                def gen_code(inner_codegen_state):
-                    conditionals = [
-                            constraint_to_code(
-                                inner_codegen_state.expression_to_code_mapper, cns)
-                            for cns in bounds_checks] + list(pred_checks)
-
-                    prev_result = prev_gen_code(inner_codegen_state)
-
-                    return [wrap_in_if(
-                             conditionals,
-                             gen_code_block(prev_result))]
-
-                cannot_vectorize = False
-                if new_codegen_state.vectorization_info is not None:
-                    from loopy.isl_helpers import obj_involves_variable
-                    for cond in bounds_checks:
-                        if obj_involves_variable(
-                                cond,
-                                new_codegen_state.vectorization_info.iname):
-                            cannot_vectorize = True
-                            break
-
-                if cannot_vectorize:
-                    def gen_code_wrapper(inner_codegen_state):
-                        # gen_code returns a list, but this needs to return a
-                        # GeneratedCode instance.
-
-                        return gen_code_block(gen_code(inner_codegen_state))
-
-                    result = [new_codegen_state.unvectorize(gen_code_wrapper)]
-                else:
-                    result = gen_code(new_codegen_state)
+                return result
 
+        else:
+            # recurse with a bigger done_group_lengths
+            def gen_code(inner_codegen_state):
+                return build_insn_group(
+                        group_si_entries,
+                        inner_codegen_state,
+                        done_group_lengths=(
+                            done_group_lengths | set([group_length])))
+
+        # gen_code returns a list
+
+        if bounds_checks or pred_checks:
+            from loopy.codegen import wrap_in_if
+            from loopy.codegen.bounds import constraint_to_code
+
+            prev_gen_code = gen_code
+
+            def gen_code(inner_codegen_state):
+                conditionals = [
+                        constraint_to_code(
+                            inner_codegen_state.expression_to_code_mapper, cns)
+                        for cns in bounds_checks] + list(pred_checks)
+
+                prev_result = prev_gen_code(inner_codegen_state)
+
+                return [wrap_in_if(
+                         conditionals,
+                         gen_code_block(prev_result))]
+
+            cannot_vectorize = False
+            if new_codegen_state.vectorization_info is not None:
+                from loopy.isl_helpers import obj_involves_variable
+                for cond in bounds_checks:
+                    if obj_involves_variable(
+                            cond,
+                            new_codegen_state.vectorization_info.iname):
+                        cannot_vectorize = True
+                        break
+
+            if cannot_vectorize:
+                def gen_code_wrapper(inner_codegen_state):
+                    # gen_code returns a list, but this needs to return a
+                    # GeneratedCode instance.
+
+                    return gen_code_block(gen_code(inner_codegen_state))
+
+                return [new_codegen_state.unvectorize(gen_code_wrapper)]
             else:
-                result = gen_code(new_codegen_state)
+                return gen_code(new_codegen_state)
 
-        return result + build_insn_group(
-                sched_index_info_entries[group_length:], codegen_state)
+        else:
+            return gen_code(new_codegen_state)
 
     # }}}
 
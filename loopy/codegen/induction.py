@@ -0,0 +1,287 @@
+from __future__ import division
+from __future__ import absolute_import
+import six
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+from pytools import Record
+from pymbolic import var
+from pymbolic.primitives import Sum
+
+from loopy.tools import is_integer
+
+
+# {{{ affine subscript terms
+
+def get_subscript_terms(kernel, subscript, induction_vars=()):
+    """Split the linearized array subscript *subscript* into terms.
+
+    :returns: a tuple ``(terms, constant)``, where *terms* is a :class:`dict`
+        mapping :class:`pymbolic.primitives.Variable` instances for inames
+        (or 1, for the parts not depending on any iname) to their
+        (iname-independent) coefficients, and *constant* is an integer.
+        Returns *None* if *subscript* is not affine in the inames.
+
+    Terms matching one of the :class:`InductionVariable` instances
+    *induction_vars* are replaced by a reference to the induction
+    variable, in order.
+    """
+
+    from loopy.symbolic import CoefficientCollector
+    try:
+        coeffs = CoefficientCollector(kernel.all_inames())(subscript)
+    except (RuntimeError, NotImplementedError):
+        return None
+
+    def split_summands(expr):
+        if isinstance(expr, Sum):
+            for child in expr.children:
+                for summand in split_summands(child):
+                    yield summand
+        else:
+            yield expr
+
+    terms = {}
+    constant = 0
+    nonconstant_summands = []
+
+    for key, coeff in six.iteritems(coeffs):
+        if key == 1:
+            for summand in split_summands(coeff):
+                if is_integer(summand):
+                    constant += summand
+                else:
+                    nonconstant_summands.append(summand)
+
+        elif coeff != 0:
+            terms[key] = coeff
+
+    if nonconstant_summands:
+        from pymbolic.primitives import flattened_sum
+        terms[1] = flattened_sum(nonconstant_summands)
+
+    for ivar in induction_vars:
+        if all(terms.get(key) == coeff
+                for key, coeff in six.iteritems(ivar.terms)):
+            for key in ivar.terms:
+                del terms[key]
+            terms[var(ivar.name)] = 1
+
+    return terms, constant
+
+
+def terms_to_expr(terms, constant=0):
+    from pymbolic.primitives import flattened_sum
+
+    summands = []
+    for key in sorted(terms, key=lambda key: (key == 1, str(key))):
+        coeff = terms[key]
+        if key == 1:
+            summands.append(coeff)
+        elif coeff == 1:
+            summands.append(key)
+        else:
+            summands.append(coeff*key)
+
+    if constant:
+        summands.append(constant)
+
+    return flattened_sum(summands)
+
+
+def rewrite_subscript(kernel, subscript, induction_vars):
+    """Return *subscript*, expressed in terms of the
+    :class:`InductionVariable` instances *induction_vars*, if possible.
+    """
+    if not induction_vars:
+        return subscript
+
+    result = get_subscript_terms(kernel, subscript, induction_vars)
+    if result is None:
+        return subscript
+
+    terms, constant = result
+
+    ivar_names = set(ivar.name for ivar in induction_vars)
+    if not any(getattr(key, "name", None) in ivar_names for key in terms):
+        return subscript
+
+    return terms_to_expr(terms, constant)
+
+# }}}
+
+
+# {{{ induction variables
+
+class InductionVariable(Record):
+    """An integer variable updated along with a sequential loop that holds
+    the part of one or more linearized array subscripts within the loop
+    that depends only on the loop's iname and on the inames (and induction
+    variables) of the surrounding code.
+
+    .. attribute:: name
+    .. attribute:: iname
+    .. attribute:: terms
+
+        A :class:`dict` as returned by :func:`get_subscript_terms`.
+
+    .. attribute:: initial_value
+
+        An expression for the value at the lower bound of the loop.
+
+    .. attribute:: step
+
+        An expression for the increment per loop trip, possibly zero.
+    """
+
+
+def _is_worth_precomputing(terms):
+    if len(terms) > 1:
+        return True
+
+    if not terms:
+        return False
+
+    (key, coeff), = six.iteritems(terms)
+    return key != 1 and coeff != 1
+
+
+def find_induction_variables(kernel, sched_index, codegen_state, lbound_expr):
+    """Find the :class:`InductionVariable` instances worth maintaining along
+    with the loop entered at *sched_index* (whose iname starts at
+    *lbound_expr*) by inspecting the array accesses of the instructions
+    within it.
+    """
+
+    from loopy.kernel.data import (
+            GlobalArg, TemporaryVariable, ExpressionInstruction)
+    from loopy.kernel.array import get_access_info
+    from loopy.schedule import RunInstruction
+    from loopy.symbolic import ArrayAccessFinder
+    from loopy.diagnostic import LoopyError
+    from pymbolic import evaluate
+
+    loop_iname = kernel.schedule[sched_index].iname
+    outer_ivars = codegen_state.induction_vars
+    sched_tables = kernel.get_schedule_tables()
+
+    # Inames (and induction variables) with known values upon loop entry
+    available = (
+            set(var(iname) for iname in sched_tables.active_inames[sched_index])
+            | set(var(name) for name in codegen_state.var_subst_map)
+            | set(var(ivar.name) for ivar in outer_ivars)
+            | set([1]))
+
+    # Variables whose values are known upon loop entry and do not change
+    # within the loop
+    from loopy.kernel.data import ValueArg
+    from loopy.symbolic import get_dependencies
+    invariant_names = (
+            (set(arg.name for arg in kernel.args if isinstance(arg, ValueArg))
+                | kernel.all_params()
+                | sched_tables.active_inames[sched_index]
+                | set(codegen_state.var_subst_map)
+                | set(ivar.name for ivar in outer_ivars))
+            - kernel.get_written_variables())
+
+    def is_invariant(expr):
+        return get_dependencies(expr) <= invariant_names
+
+    var_name_gen = kernel.get_var_name_generator()
+    var_name_gen.add_names(ivar.name for ivar in outer_ivars)
+
+    subscripts = set()
+    for sched_item in kernel.schedule[
+            sched_index+1:sched_tables.loop_end[sched_index]]:
+        if not isinstance(sched_item, RunInstruction):
+            continue
+
+        insn = kernel.id_to_insn[sched_item.insn_id]
+        if not isinstance(insn, ExpressionInstruction):
+            continue
+
+        for expr in [insn.assignee, insn.expression]:
+            for access in ArrayAccessFinder()(expr):
+                ary = (kernel.arg_dict.get(access.aggregate.name)
+                        or kernel.temporary_variables.get(access.aggregate.name))
+                if not isinstance(ary, (GlobalArg, TemporaryVariable)):
+                    continue
+
+                try:
+                    access_info = get_access_info(kernel.target, ary,
+                            access.index,
+                            lambda expr: evaluate(
+                                expr, codegen_state.var_subst_map),
+                            None)
+                except LoopyError:
+                    continue
+
+                if len(access_info.subscripts) == 1:
+                    subscripts.add(access_info.subscripts[0])
+
+    result = []
+    terms_to_ivar = {}
+
+    for subscript in sorted(subscripts, key=str):
+        subscript_terms = get_subscript_terms(kernel, subscript, outer_ivars)
+        if subscript_terms is None:
+            continue
+
+        terms, _ = subscript_terms
+
+        ivar_terms = dict(
+                (key, coeff) for key, coeff in six.iteritems(terms)
+                if key in available and is_invariant(coeff))
+        step = terms.get(var(loop_iname), 0)
+        if not is_invariant(step):
+            continue
+
+        initial_value = terms_to_expr(ivar_terms)
+        if step != 0:
+            ivar_terms[var(loop_iname)] = step
+            if lbound_expr != 0:
+                initial_value = initial_value + step*lbound_expr
+
+        if not _is_worth_precomputing(ivar_terms):
+            continue
+
+        key = frozenset(six.iteritems(ivar_terms))
+        if key in terms_to_ivar:
+            continue
+
+        ivar = InductionVariable(
+                name=var_name_gen(loop_iname + "_offset"),
+                iname=loop_iname,
+                terms=ivar_terms,
+                initial_value=initial_value,
+                step=step)
+
+        terms_to_ivar[key] = ivar
+        result.append(ivar)
+
+    return result
+
+# }}}
+
+# vim: foldmethod=marker
@@ -113,13 +113,24 @@ def generate_expr_instruction_code(kernel, insn, codegen_state):
     (assignee_var_name, assignee_indices), = insn.assignees_and_indices()
     target_dtype = kernel.get_var_descriptor(assignee_var_name).dtype
 
-    from cgen import Assign
-    lhs_code = ecm(insn.assignee, prec=PREC_NONE, type_context=None)
-    result = Assign(
-            lhs_code,
-            ecm(expr, prec=PREC_NONE,
-                type_context=dtype_to_type_context(kernel.target, target_dtype),
-                needed_dtype=target_dtype))
+    rhs_code = ecm(expr, prec=PREC_NONE,
+            type_context=dtype_to_type_context(kernel.target, target_dtype),
+            needed_dtype=target_dtype)
+
+    vector_store = None
+    if codegen_state.vectorization_info and is_vector:
+        vector_store = ecm.get_vector_memory_access(insn.assignee)
+
+    if vector_store is not None:
+        from cgen import Statement
+        vec_length, offset_code, pointer_code = vector_store
+        result = Statement("vstore%d(%s, %s, %s)" % (
+            vec_length, rhs_code, offset_code, pointer_code))
+
+    else:
+        from cgen import Assign
+        lhs_code = ecm(insn.assignee, prec=PREC_NONE, type_context=None)
+        result = Assign(lhs_code, rhs_code)
 
     if kernel.options.trace_assignments or kernel.options.trace_assignment_values:
         if codegen_state.vectorization_info and is_vector:
@@ -193,6 +204,7 @@ def generate_c_instruction_code(kernel, insn, codegen_state):
     from pymbolic.primitives import Variable
     for name, iname_expr in insn.iname_exprs:
         if (isinstance(iname_expr, Variable)
+                and iname_expr.name == name
                 and name not in ecm.var_subst_map):
             # No need, the bare symbol will work
             continue
@@ -35,83 +35,196 @@ from pymbolic.mapper.stringifier import PREC_NONE
 
 # {{{ conditional-reducing slab decomposition
 
-def get_slab_decomposition(kernel, iname, sched_index, codegen_state):
-    iname_domain = kernel.get_inames_domain(iname)
-
-    if iname_domain.is_empty():
-        return ()
-
-    space = iname_domain.space
-
-    lower_incr, upper_incr = kernel.iname_slab_increments.get(iname, (0, 0))
-    lower_bulk_bound = None
-    upper_bulk_bound = None
-
-    if lower_incr or upper_incr:
-        bounds = kernel.get_iname_bounds(iname)
+def _get_slab_bound_affs(kernel, iname):
+    """Return a tuple *(lower_bound_aff, upper_bound_aff)* of static
+    (i.e. non-piecewise) bounds for *iname*. If the actual bounds are
+    piecewise, the returned bounds may be looser than the actual ones.
+    Since the slabs always cover the entire iteration space, this only
+    affects how many iterations end up in the bulk slab, not correctness.
+
+    :raises ValueError: if no such bounds exist.
+    """
+    bounds = kernel.get_iname_bounds(iname)
 
-        lower_bound_pw_aff_pieces = bounds.lower_bound_pw_aff.coalesce().get_pieces()
-        upper_bound_pw_aff_pieces = bounds.upper_bound_pw_aff.coalesce().get_pieces()
+    from loopy.isl_helpers import static_min_of_pw_aff, static_max_of_pw_aff
+    return (
+            static_min_of_pw_aff(
+                bounds.lower_bound_pw_aff.coalesce(), constants_only=False),
+            static_max_of_pw_aff(
+                bounds.upper_bound_pw_aff.coalesce(), constants_only=False))
 
-        if len(lower_bound_pw_aff_pieces) > 1:
-            raise NotImplementedError("lower bound for slab decomp of '%s' needs "
-                    "conditional/has more than one piece" % iname)
-        if len(upper_bound_pw_aff_pieces) > 1:
-            raise NotImplementedError("upper bound for slab decomp of '%s' needs "
-                    "conditional/has more than one piece" % iname)
 
-        (_, lower_bound_aff), = lower_bound_pw_aff_pieces
-        (_, upper_bound_aff), = upper_bound_pw_aff_pieces
+def _make_slabs(space, iname, lower_bound_aff, upper_bound_aff,
+        lower_incr, upper_incr):
+    from loopy.isl_helpers import iname_rel_aff
 
-        from loopy.isl_helpers import iname_rel_aff
+    lower_slab = None
+    upper_slab = None
+    bulk_slab = isl.BasicSet.universe(space)
 
-        if lower_incr:
-            assert lower_incr > 0
-            lower_slab = ("initial", isl.BasicSet.universe(space)
-                    .add_constraint(
-                        isl.Constraint.inequality_from_aff(
-                            iname_rel_aff(space,
-                                iname, "<", lower_bound_aff+lower_incr))))
-            lower_bulk_bound = (
+    if lower_incr:
+        assert lower_incr > 0
+        lower_slab = ("initial", isl.BasicSet.universe(space)
+                .add_constraint(
                     isl.Constraint.inequality_from_aff(
                         iname_rel_aff(space,
-                            iname, ">=", lower_bound_aff+lower_incr)))
-        else:
-            lower_slab = None
-
-        if upper_incr:
-            assert upper_incr > 0
-            upper_slab = ("final", isl.BasicSet.universe(space)
-                    .add_constraint(
-                        isl.Constraint.inequality_from_aff(
-                            iname_rel_aff(space,
-                                iname, ">", upper_bound_aff-upper_incr))))
-            upper_bulk_bound = (
+                            iname, "<", lower_bound_aff+lower_incr))))
+        bulk_slab = bulk_slab.add_constraint(
+                isl.Constraint.inequality_from_aff(
+                    iname_rel_aff(space,
+                        iname, ">=", lower_bound_aff+lower_incr)))
+
+    if upper_incr:
+        assert upper_incr > 0
+        upper_slab = ("final", isl.BasicSet.universe(space)
+                .add_constraint(
                     isl.Constraint.inequality_from_aff(
                         iname_rel_aff(space,
-                            iname, "<=", upper_bound_aff-upper_incr)))
-        else:
-            lower_slab = None
+                            iname, ">", upper_bound_aff-upper_incr))))
+
+        # If there's an initial slab, keep the final slab from
+        # overlapping with it.
+        if lower_incr:
+            upper_slab = (upper_slab[0], upper_slab[1].add_constraint(
+                isl.Constraint.inequality_from_aff(
+                    iname_rel_aff(space,
+                        iname, ">=", lower_bound_aff+lower_incr))))
 
-        slabs = []
+        bulk_slab = bulk_slab.add_constraint(
+                isl.Constraint.inequality_from_aff(
+                    iname_rel_aff(space,
+                        iname, "<=", upper_bound_aff-upper_incr)))
 
-        bulk_slab = isl.BasicSet.universe(space)
-        if lower_bulk_bound is not None:
-            bulk_slab = bulk_slab.add_constraint(lower_bulk_bound)
-        if upper_bulk_bound is not None:
-            bulk_slab = bulk_slab.add_constraint(upper_bulk_bound)
+    slabs = [("bulk", bulk_slab)]
+    if lower_slab:
+        slabs.append(lower_slab)
+    if upper_slab:
+        slabs.append(upper_slab)
 
-        slabs.append(("bulk", bulk_slab))
-        if lower_slab:
-            slabs.append(lower_slab)
-        if upper_slab:
-            slabs.append(upper_slab)
+    return slabs
 
-        return slabs
 
+def _is_box(set, iname_a, iname_b):
+    """Return whether the projection of *set* onto *iname_a* and *iname_b*
+    is a Cartesian product, i.e. whether the bounds of either iname are
+    independent of the value of the other.
+    """
+    set = set.project_out_except([iname_a, iname_b], [dim_type.set])
+
+    var_dict = set.get_var_dict()
+    _, idx_a = var_dict[iname_a]
+    _, idx_b = var_dict[iname_b]
+
+    return set.is_equal(
+            set.eliminate(dim_type.set, idx_a, 1)
+            & set.eliminate(dim_type.set, idx_b, 1))
+
+
+def find_automatic_slab_increments(kernel, iname, sched_index):
+    """Find slab increments for *iname* that remove the conditionals on
+    inames nested inside the loop over *iname* (or, for hardware-parallel
+    *iname*, on all other inames) whose bounds depend on *iname*. The
+    typical source of these is :func:`loopy.split_iname` applied to a loop
+    of a length that is not known to be divisible by the split length,
+    in which case this returns ``(0, 1)``.
+
+    Returns ``(0, 0)`` if no choice of increments helps.
+    """
+    from loopy.kernel.data import HardwareParallelTag, LocalIndexTag, UniqueTag
+
+    tag = kernel.iname_to_tag.get(iname)
+    if isinstance(tag, LocalIndexTag):
+        # Work items in a group would diverge, and barriers inside the
+        # slabs would become illegal.
+        return (0, 0)
+    if isinstance(tag, HardwareParallelTag) and any(
+            isinstance(kernel.iname_to_tag.get(other_iname), UniqueTag)
+            and kernel.iname_to_tag.get(other_iname).key == tag.key
+            and other_iname != iname
+            for other_iname in kernel.all_inames()):
+        return (0, 0)
+
+    domain = kernel.get_inames_domain(frozenset([iname]))
+
+    assumptions = kernel.assumptions.project_out_except(
+            set(domain.get_var_dict(dim_type.param)), [dim_type.param])
+    assumptions, domain = isl.align_two(assumptions, domain)
+    domain = domain & assumptions
+
+    if isinstance(tag, HardwareParallelTag):
+        outer_inames = set()
     else:
+        from loopy.schedule import find_active_inames_at
+        outer_inames = find_active_inames_at(kernel, sched_index)
+
+    coupled_inames = [
+            other_iname
+            for other_iname in domain.get_var_names(dim_type.set)
+            if other_iname != iname
+            and other_iname not in outer_inames
+            and not _is_box(domain, iname, other_iname)]
+
+    if not coupled_inames:
+        return (0, 0)
+
+    try:
+        lower_bound_aff, upper_bound_aff = _get_slab_bound_affs(kernel, iname)
+    except ValueError:
+        return (0, 0)
+
+    best_incrs = (0, 0)
+    best_decoupled_count = 0
+
+    for incrs in [(0, 1), (1, 0), (1, 1)]:
+        (_, bulk_slab), = [
+                (slab_name, slab)
+                for slab_name, slab in _make_slabs(
+                    domain.space, iname, lower_bound_aff, upper_bound_aff,
+                    *incrs)
+                if slab_name == "bulk"]
+
+        bulk_domain = domain & bulk_slab
+        if bulk_domain.is_empty():
+            continue
+
+        decoupled_count = sum(
+                1 for other_iname in coupled_inames
+                if _is_box(bulk_domain, iname, other_iname))
+
+        if decoupled_count > best_decoupled_count:
+            best_incrs = incrs
+            best_decoupled_count = decoupled_count
+
+    return best_incrs
+
+
+def get_slab_decomposition(kernel, iname, sched_index, codegen_state):
+    iname_domain = kernel.get_inames_domain(iname)
+
+    if iname_domain.is_empty():
+        return ()
+
+    space = iname_domain.space
+
+    slab_increments = kernel.iname_slab_increments.get(iname, (0, 0))
+    if slab_increments == "auto":
+        slab_increments = find_automatic_slab_increments(
+                kernel, iname, sched_index)
+
+    lower_incr, upper_incr = slab_increments
+
+    if not (lower_incr or upper_incr):
         return [("bulk", (isl.BasicSet.universe(space)))]
 
+    try:
+        lower_bound_aff, upper_bound_aff = _get_slab_bound_affs(kernel, iname)
+    except ValueError:
+        raise NotImplementedError("bounds for slab decomp of '%s' need "
+                "conditionals and have no static extremum" % iname)
+
+    return _make_slabs(space, iname, lower_bound_aff, upper_bound_aff,
+            lower_incr, upper_incr)
+
 # }}}
 
 
@@ -414,9 +527,23 @@ def generate_sequential_loop_dim_code(kernel, sched_index, codegen_state):
 
         new_codegen_state = codegen_state.intersect(impl_slab)
 
+        from loopy.symbolic import aff_to_expr
+
+        is_single_trip = (static_ubound - static_lbound).plain_is_zero()
+
+        induction_vars = []
+        if kernel.options.strength_reduce_indices and not is_single_trip:
+            from loopy.codegen.induction import find_induction_variables
+            induction_vars = find_induction_variables(
+                    kernel, sched_index, codegen_state,
+                    aff_to_expr(static_lbound))
+            new_codegen_state = new_codegen_state.copy(
+                    induction_vars=(
+                        codegen_state.induction_vars + tuple(induction_vars)))
+
         inner = build_loop_nest(
                 intersect_kernel_with_slab(
-                    kernel, slab, iname),
+                    kernel, slab, loop_iname),
                 sched_index+1, new_codegen_state)
 
         # }}}
@@ -426,9 +553,8 @@ def generate_sequential_loop_dim_code(kernel, sched_index, codegen_state):
             result.append(Comment(cmt))
 
         from cgen import Initializer, POD, Const, Line, For
-        from loopy.symbolic import aff_to_expr
 
-        if (static_ubound - static_lbound).plain_is_zero():
+        if is_single_trip:
             # single-trip, generate just a variable assignment, not a loop
             result.append(gen_code_block([
                 Initializer(Const(POD(kernel.index_dtype, loop_iname)),
@@ -440,13 +566,24 @@ def generate_sequential_loop_dim_code(kernel, sched_index, codegen_state):
         else:
             from loopy.codegen import wrap_in
 
+            inits = ["%s = %s" % (
+                loop_iname, ecm(aff_to_expr(static_lbound), PREC_NONE, "i"))]
+            updates = ["++%s" % loop_iname]
+
+            for ivar in induction_vars:
+                inits.append("%s = %s" % (
+                    ivar.name, ecm(ivar.initial_value, PREC_NONE, "i")))
+                if ivar.step != 0:
+                    updates.append("%s += %s" % (
+                        ivar.name, ecm(ivar.step, PREC_NONE, "i")))
+
             result.append(wrap_in(For,
-                    "%s %s = %s"
+                    "%s %s"
                     % (kernel.target.dtype_to_typename(kernel.index_dtype),
-                        loop_iname, ecm(aff_to_expr(static_lbound), PREC_NONE, "i")),
+                        ", ".join(inits)),
                     "%s <= %s" % (
                         loop_iname, ecm(aff_to_expr(static_ubound), PREC_NONE, "i")),
-                    "++%s" % loop_iname,
+                    ", ".join(updates),
                     inner))
 
     return gen_code_block(result)
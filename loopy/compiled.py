@@ -34,6 +34,11 @@ from loopy.diagnostic import ParameterFinderWarning
 from pytools.py_codegen import (
         Indentation, PythonFunctionGenerator)
 from loopy.diagnostic import LoopyError
+from loopy.tools import LoopyKeyBuilder
+from loopy.version import DATA_MODEL_VERSION
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 # {{{ object array argument packing
@@ -239,7 +244,7 @@ def generate_integer_arg_finding_from_offsets(gen, kernel, impl_arg_info, option
                                 % impl_array_name)
                         gen("del _lpy_remdr")
                     else:
-                        gen("%s = _lpy_offset // %d)"
+                        gen("%s = _lpy_offset // %d"
                                 % (arg.name, base_arg.dtype.itemsize))
 
                     if not options.skip_arg_checks:
@@ -271,23 +276,21 @@ def generate_integer_arg_finding_from_strides(gen, kernel, impl_arg_info, option
                                 "passed array\")"
                                 % (arg.name, impl_array_name))
 
-                    base_arg = kernel.impl_arg_to_arg[impl_array_name]
-
-                    if not options.skip_arg_checks:
-                        gen("%s, _lpy_remdr = divmod(%s.strides[%d], %d)"
-                                % (arg.name, impl_array_name, stride_impl_axis,
-                                    base_arg.dtype.itemsize))
+                base_arg = kernel.impl_arg_to_arg[impl_array_name]
 
-                        gen("assert _lpy_remdr == 0, \"Stride %d of array '%s' is "
-                                "not divisible by its dtype itemsize\""
-                                % (stride_impl_axis, impl_array_name))
-                        gen("del _lpy_remdr")
-                    else:
-                        gen("%s = divmod(%s.strides[%d], %d)"
-                                % (arg.name, impl_array_name, stride_impl_axis,
-                                    base_arg.dtype.itemsize))
-                        gen("%s = _lpy_offset // %d)"
-                                % (arg.name, base_arg.dtype.itemsize))
+                if not options.skip_arg_checks:
+                    gen("%s, _lpy_remdr = divmod(%s.strides[%d], %d)"
+                            % (arg.name, impl_array_name, stride_impl_axis,
+                                base_arg.dtype.itemsize))
+
+                    gen("assert _lpy_remdr == 0, \"Stride %d of array '%s' is "
+                            "not divisible by its dtype itemsize\""
+                            % (stride_impl_axis, impl_array_name))
+                    gen("del _lpy_remdr")
+                else:
+                    gen("%s = %s.strides[%d] // %d"
+                            % (arg.name, impl_array_name, stride_impl_axis,
+                                base_arg.dtype.itemsize))
 
     gen("# }}}")
     gen("")
@@ -665,7 +668,7 @@ def generate_array_arg_setup(gen, kernel, impl_arg_info, options,
 # }}}
 
 
-def generate_invoker(kernel, cl_kernel, impl_arg_info, options):
+def generate_invoker_source(kernel, cl_kernel, impl_arg_info, options):
     system_args = [
             "cl_kernel", "queue", "allocator=None", "wait_for=None",
             # ignored if options.no_numpy
@@ -673,7 +676,7 @@ def generate_invoker(kernel, cl_kernel, impl_arg_info, options):
             ]
 
     gen = PythonFunctionGenerator(
-            "invoke_%s_loopy_kernel" % kernel.name,
+            get_invoker_name(kernel),
             system_args + ["%s=None" % iai.name for iai in impl_arg_info])
 
     gen.add_to_preamble("from __future__ import division")
@@ -755,8 +758,112 @@ def generate_invoker(kernel, cl_kernel, impl_arg_info, options):
 
     # }}}
 
+    return gen.get()
+
+
+# {{{ on-disk invoker module cache
+
+def get_invoker_name(kernel):
+    return "invoke_%s_loopy_kernel" % kernel.name
+
+
+def get_invoker_module_dir():
+    """Return the directory (within the :mod:`loopy` cache directory) into
+    which generated invoker modules are written.
+    """
+    from loopy.codegen import code_gen_cache
+    from os.path import join
+    return join(code_gen_cache.container_dir,
+            "loopy-invokers-v1-"+DATA_MODEL_VERSION)
+
+
+def get_invoker_cache_key(kernel, cl_kernel, options):
+    from pyopencl.characterize import has_struct_arg_count_bug
+
+    # The generated code depends on the devices only through the
+    # argument count workaround, see generate_value_arg_setup.
+    count_bug_per_dev = tuple(
+            bool(has_struct_arg_count_bug(dev))
+            for dev in cl_kernel.context.devices)
+
+    return LoopyKeyBuilder()((kernel, options, count_bug_per_dev))
+
+
+def _write_invoker_module(filename, source):
+    import os
+    from os.path import dirname
+
+    try:
+        os.makedirs(dirname(filename))
+    except OSError:
+        # already exists
+        pass
+
+    # Write to a temporary file and move it into place, so that concurrent
+    # processes never see a partially written module.
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp_filename, "w") as outf:
+        outf.write(source)
+
+    os.rename(tmp_filename, filename)
+
+
+def _import_invoker_module(module_name, filename):
+    if six.PY3:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(module_name, filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    else:
+        import imp
+        return imp.load_source(module_name, filename)
+
+# }}}
+
+
+def generate_invoker(kernel, cl_kernel, impl_arg_info, options):
+    """Return a Python function that sets up the arguments of *cl_kernel* and
+    launches it.
+
+    If caching is enabled (see :func:`loopy.set_caching_enabled`), the
+    generated source is kept as a module in :func:`get_invoker_module_dir`
+    and imported from there, so that it only needs to be generated once
+    per kernel and so that profilers and tracebacks can refer to the
+    lines of the invoker.
+    """
+
+    from loopy import CACHING_ENABLED
+
+    func_name = get_invoker_name(kernel)
+
+    source = None
+
+    if CACHING_ENABLED:
+        from os.path import join, exists
+
+        cache_key = get_invoker_cache_key(kernel, cl_kernel, options)
+        module_name = "_lpy_invoker_%s" % cache_key
+        filename = join(get_invoker_module_dir(), module_name + ".py")
+
+        if exists(filename):
+            logger.info("%s: invoker cache hit" % kernel.name)
+        else:
+            source = generate_invoker_source(
+                    kernel, cl_kernel, impl_arg_info, options)
+            _write_invoker_module(filename, source)
+
+    else:
+        source = generate_invoker_source(
+                kernel, cl_kernel, impl_arg_info, options)
+
     if options.write_wrapper:
-        output = gen.get()
+        if source is None:
+            with open(filename, "r") as inf:
+                output = inf.read()
+        else:
+            output = source
+
         if options.highlight_wrapper:
             output = get_highlighted_python_code(output)
 
@@ -766,8 +873,157 @@ def generate_invoker(kernel, cl_kernel, impl_arg_info, options):
             with open(options.write_wrapper, "w") as outf:
                 outf.write(output)
 
-    return gen.get_function()
+    if CACHING_ENABLED:
+        module = _import_invoker_module(module_name, filename)
+        return getattr(module, func_name)
+    else:
+        namespace = {}
+        exec(compile(source, "<generated: '%s'>" % func_name, "exec"),
+                namespace)
+        return namespace[func_name]
+
+# }}}
+
+
+# {{{ event dependency tracking
+
+def _get_memory_object(val):
+    """Return the :class:`pyopencl.MemoryObject` underlying the argument value
+    *val*, or *None* if there is none.
+    """
+    import pyopencl as cl
+
+    if isinstance(val, cl.MemoryObjectHolder):
+        return val
+
+    base_data = getattr(val, "base_data", None)
+    if isinstance(base_data, cl.MemoryObjectHolder):
+        return base_data
+
+    return None
+
+
+def _is_in_order_queue(queue):
+    import pyopencl as cl
+    return not (queue.properties
+            & cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE)
+
+
+class EventDependencyTracker(object):
+    """Records which memory objects each kernel launch reads and writes,
+    along with the launch's event, so that later launches can be made to
+    wait for exactly the launches they depend on:
+
+    * A launch reading a memory object waits for the last launch
+      writing it.
+    * A launch writing a memory object additionally waits for all
+      launches that read it since it was last written.
+
+    Events that are known to be unnecessary, because they were enqueued
+    to the same in-order queue as the launch, are omitted.
+
+    Pass an instance of this class as *dependency_tracker* to
+    :meth:`CompiledKernel.__call__` (or :meth:`LoopKernel.__call__`).
+    The same tracker may (and should) be shared among kernels that
+    operate on the same data.
+
+    Memory objects are identified by (the address of) their underlying
+    :class:`pyopencl.MemoryObject`, so that all arrays and sub-arrays
+    sharing a buffer are treated as one. Events of launches that have
+    completed are forgotten whenever a new launch is recorded. Since a
+    buffer that is released and reallocated at the same address cannot be
+    told apart from the original, call :meth:`clear` once the data
+    tracked so far is no longer in use, for example before reusing the
+    tracker for an unrelated computation.
+
+    .. automethod:: get_wait_for
+    .. automethod:: record
+    .. automethod:: clear
+    """
+
+    def __init__(self):
+        # maps memory object pointers to the event of the last write
+        self.last_write_events = {}
+
+        # maps memory object pointers to a list of events of reads
+        # since the last write
+        self.read_events = {}
+
+    def get_wait_for(self, queue, read_mem_objs, written_mem_objs, wait_for=None):
+        """Return a list of events on which a launch on *queue* that
+        reads *read_mem_objs* and writes *written_mem_objs* (both
+        iterables of :class:`pyopencl.MemoryObject`) needs to wait. The events
+        in *wait_for* are included in the result.
+        """
+
+        events = []
+        if wait_for:
+            events.extend(wait_for)
+
+        for mem_obj in list(read_mem_objs) + list(written_mem_objs):
+            evt = self.last_write_events.get(mem_obj.int_ptr)
+            if evt is not None:
+                events.append(evt)
+
+        for mem_obj in written_mem_objs:
+            events.extend(self.read_events.get(mem_obj.int_ptr, []))
 
+        in_order = _is_in_order_queue(queue)
+
+        result = []
+        seen_evt_ptrs = set()
+        for evt in events:
+            if evt.int_ptr in seen_evt_ptrs:
+                continue
+            seen_evt_ptrs.add(evt.int_ptr)
+
+            if in_order and evt.command_queue == queue:
+                continue
+
+            result.append(evt)
+
+        return result
+
+    def record(self, evt, read_mem_objs, written_mem_objs):
+        """Record that the launch associated with *evt* reads
+        *read_mem_objs* and writes *written_mem_objs*.
+        """
+
+        self._prune()
+
+        for mem_obj in read_mem_objs:
+            self.read_events.setdefault(mem_obj.int_ptr, []).append(evt)
+
+        for mem_obj in written_mem_objs:
+            self.last_write_events[mem_obj.int_ptr] = evt
+            self.read_events.pop(mem_obj.int_ptr, None)
+
+    def _prune(self):
+        """Forget the events of launches that have completed."""
+
+        import pyopencl as cl
+        complete = cl.command_execution_status.COMPLETE
+
+        for ptr, write_evt in list(six.iteritems(self.last_write_events)):
+            if write_evt.command_execution_status == complete:
+                del self.last_write_events[ptr]
+
+        for ptr, read_evts in list(six.iteritems(self.read_events)):
+            read_evts = [
+                    read_evt
+                    for read_evt in read_evts
+                    if read_evt.command_execution_status != complete]
+            if read_evts:
+                self.read_events[ptr] = read_evts
+            else:
+                del self.read_events[ptr]
+
+    def clear(self):
+        """Forget all recorded launches. Call this once the memory objects
+        passed so far may have been released (see above).
+        """
+        self.last_write_events.clear()
+        self.read_events.clear()
 
 # }}}
 
@@ -865,6 +1121,61 @@ class CompiledKernel:
                 invoker=generate_invoker(
                     kernel, cl_kernel, impl_arg_info, self.kernel.options))
 
+    @memoize_method
+    def get_unchecked_invoker(self, arg_to_dtype_set=frozenset()):
+        """Return an invoker for the same code as :meth:`cl_kernel_info`
+        that does not check its arguments.
+        """
+        kernel_info = self.cl_kernel_info(arg_to_dtype_set)
+
+        return generate_invoker(
+                kernel_info.kernel, kernel_info.cl_kernel,
+                kernel_info.impl_arg_info,
+                self.kernel.options.copy(skip_arg_checks=True))
+
+    def _get_accessed_memory_objects(self, kwargs):
+        impl_arg_to_arg = self.kernel.impl_arg_to_arg
+        read_vars = self.kernel.get_read_variables()
+        written_vars = self.kernel.get_written_variables()
+
+        read_mem_objs = []
+        written_mem_objs = []
+        for arg_name, val in six.iteritems(kwargs):
+            arg = impl_arg_to_arg.get(arg_name, None)
+            if arg is None:
+                continue
+
+            mem_obj = _get_memory_object(val)
+            if mem_obj is None:
+                continue
+
+            if arg.name in written_vars:
+                written_mem_objs.append(mem_obj)
+            elif arg.name in read_vars:
+                read_mem_objs.append(mem_obj)
+
+        return read_mem_objs, written_mem_objs
+
+    def _get_arg_to_dtype(self, kwargs):
+        impl_arg_to_arg = self.kernel.impl_arg_to_arg
+        arg_to_dtype = {}
+        for arg_name, val in six.iteritems(kwargs):
+            arg = impl_arg_to_arg.get(arg_name, None)
+
+            if arg is None:
+                # offsets, strides and such
+                continue
+
+            if arg.dtype is None and val is not None:
+                try:
+                    dtype = val.dtype
+                except AttributeError:
+                    pass
+                else:
+                    arg_to_dtype[arg_name] = dtype
+
+        return arg_to_dtype
+
     # {{{ debugging aids
 
     def get_code(self, arg_to_dtype=None):
@@ -905,6 +1216,11 @@ class CompiledKernel:
             arguments are :mod:`numpy` arrays, defaults to
             returning :mod:`numpy` arrays as well.
 
+        :arg dependency_tracker: An :class:`EventDependencyTracker`.
+            If given, the launch additionally waits for all launches
+            recorded in the tracker that access the same memory objects
+            in a conflicting manner, and the launch itself is recorded.
+
         :returns: ``(evt, output)`` where *evt* is a :class:`pyopencl.Event`
             associated with the execution of the kernel, and
             output is a tuple of output arguments (arguments that
@@ -919,33 +1235,252 @@ class CompiledKernel:
         allocator = kwargs.pop("allocator", None)
         wait_for = kwargs.pop("wait_for", None)
         out_host = kwargs.pop("out_host", None)
+        dependency_tracker = kwargs.pop("dependency_tracker", None)
 
         kwargs = self.packing_controller.unpack(kwargs)
+        arg_to_dtype = self._get_arg_to_dtype(kwargs)
 
-        impl_arg_to_arg = self.kernel.impl_arg_to_arg
-        arg_to_dtype = {}
-        for arg_name, val in six.iteritems(kwargs):
-            arg = impl_arg_to_arg.get(arg_name, None)
+        kernel_info = self.cl_kernel_info(
+                frozenset(six.iteritems(arg_to_dtype)))
 
-            if arg is None:
-                # offsets, strides and such
-                continue
+        if dependency_tracker is None:
+            return kernel_info.invoker(
+                    kernel_info.cl_kernel, queue, allocator, wait_for,
+                    out_host, **kwargs)
 
-            if arg.dtype is None and val is not None:
-                try:
-                    dtype = val.dtype
-                except AttributeError:
-                    pass
-                else:
-                    arg_to_dtype[arg_name] = dtype
+        return self._call_tracked(kernel_info.invoker, kernel_info,
+                dependency_tracker, queue, allocator, wait_for, out_host, kwargs)
 
-        kernel_info = self.cl_kernel_info(
-                frozenset(six.iteritems(arg_to_dtype)))
+    def _call_tracked(self, invoker, kernel_info, dependency_tracker,
+            queue, allocator, wait_for, out_host, kwargs):
+        read_mem_objs, written_mem_objs = \
+                self._get_accessed_memory_objects(kwargs)
 
-        return kernel_info.invoker(
-                kernel_info.cl_kernel, queue, allocator, wait_for,
+        evt, output = invoker(
+                kernel_info.cl_kernel, queue, allocator,
+                dependency_tracker.get_wait_for(
+                    queue, read_mem_objs, written_mem_objs, wait_for),
                 out_host, **kwargs)
 
+        # Written arrays allocated by the invoker only show up in the output.
+        if isinstance(output, dict):
+            output_values = list(six.itervalues(output))
+        else:
+            output_values = list(output)
+
+        for val in output_values:
+            mem_obj = _get_memory_object(val)
+            if mem_obj is not None:
+                written_mem_objs.append(mem_obj)
+
+        dependency_tracker.record(evt, read_mem_objs, written_mem_objs)
+
+        return evt, output
+
+    def call_batched(self, queue, kwargs_list, allocator=None, wait_for=None,
+            out_host=None, dependency_tracker=None):
+        """Launch the kernel once for each entry of *kwargs_list*, a list of
+        keyword argument dictionaries as accepted by :meth:`__call__`.
+
+        Type inference, code lookup and argument checking are performed
+        only once, based on the first entry. The remaining launches use an
+        invoker generated with :attr:`loopy.Options.skip_arg_checks`, after
+        verifying (unless :attr:`loopy.Options.skip_arg_checks` is set)
+        that all entries pass arrays of the same dtype, shape and
+        strides.
+
+        All launches wait for the events in *wait_for*. *dependency_tracker*
+        is used for each launch as described for :meth:`__call__`.
+
+        :returns: ``(evts, outputs)`` where *evts* is a list of
+            :class:`pyopencl.Event` instances, one per launch, and
+            *outputs* is a list of the outputs of each launch, as described
+            for :meth:`__call__`.
+
+        To perform the entire batch in a single launch instead, see
+        :func:`loopy.to_batched`.
+        """
+
+        if not kwargs_list:
+            return [], []
+
+        kwargs_list = [
+                self.packing_controller.unpack(kwargs)
+                for kwargs in kwargs_list]
+
+        first_kwargs = kwargs_list[0]
+
+        arg_to_dtype_set = frozenset(six.iteritems(
+            self._get_arg_to_dtype(first_kwargs)))
+        kernel_info = self.cl_kernel_info(arg_to_dtype_set)
+
+        if not self.kernel.options.skip_arg_checks:
+            def get_layout(kwargs):
+                return dict(
+                        (arg_name, (val.dtype, val.shape, val.strides))
+                        for arg_name, val in six.iteritems(kwargs)
+                        if hasattr(val, "strides"))
+
+            first_layout = get_layout(first_kwargs)
+            for i, kwargs in enumerate(kwargs_list[1:]):
+                if (set(kwargs) != set(first_kwargs)
+                        or get_layout(kwargs) != first_layout):
+                    raise TypeError("batch entry %d differs from entry 0 in "
+                            "its arguments or their dtypes, shapes or strides"
+                            % (i+1))
+
+        def invoke(invoker, kwargs):
+            if dependency_tracker is None:
+                return invoker(
+                        kernel_info.cl_kernel, queue, allocator, wait_for,
+                        out_host, **kwargs)
+            else:
+                return self._call_tracked(invoker, kernel_info,
+                        dependency_tracker, queue, allocator, wait_for,
+                        out_host, kwargs)
+
+        evt, output = invoke(kernel_info.invoker, first_kwargs)
+
+        evts = [evt]
+        outputs = [output]
+
+        if len(kwargs_list) > 1:
+            unchecked_invoker = self.get_unchecked_invoker(arg_to_dtype_set)
+
+            for kwargs in kwargs_list[1:]:
+                evt, output = invoke(unchecked_invoker, kwargs)
+                evts.append(evt)
+                outputs.append(output)
+
+        return evts, outputs
+
+# }}}
+
+
+# {{{ compiled program object
+
+class _ProgramMemberKernel(CompiledKernel):
+    def __init__(self, context, kernel, program):
+        CompiledKernel.__init__(self, context, kernel)
+        self.program = program
+
+    def cl_kernel_info(self, arg_to_dtype_set=frozenset(), all_kwargs=None):
+        if arg_to_dtype_set:
+            raise LoopyError("argument types of kernel '%s' must be known "
+                    "when it is part of a CompiledProgram"
+                    % self.kernel.name)
+
+        return self.program.cl_kernel_infos()[self.kernel.name]
+
+
+class CompiledProgram(object):
+    """A collection of kernels built together, as a single OpenCL program.
+
+    All argument types of all kernels must be known. The kernels must
+    agree in :attr:`loopy.Options.cl_build_options`, and their names must
+    be unique.
+
+    The program is generated and built upon first use of any of
+    its kernels, as obtained by :meth:`__getitem__`.
+
+    .. automethod:: __getitem__
+    .. automethod:: get_code
+    """
+
+    def __init__(self, context, kernels):
+        self.context = context
+
+        kernels = list(kernels)
+        if not kernels:
+            raise LoopyError("a CompiledProgram needs at least one kernel")
+
+        self.kernel_names = [knl.name for knl in kernels]
+        if len(set(self.kernel_names)) != len(self.kernel_names):
+            raise LoopyError("kernel names in a CompiledProgram must be "
+                    "unique")
+
+        for knl in kernels:
+            untyped_args = [arg.name for arg in knl.args if arg.dtype is None]
+            if untyped_args:
+                raise LoopyError("kernel '%s' has arguments of unknown type: %s"
+                        % (knl.name, ", ".join(untyped_args)))
+
+        self.cl_build_options = kernels[0].options.cl_build_options
+        for knl in kernels[1:]:
+            if knl.options.cl_build_options != self.cl_build_options:
+                raise LoopyError("kernels in a CompiledProgram must agree "
+                        "in their build options")
+
+        self.compiled_kernels = dict(
+                (knl.name, _ProgramMemberKernel(context, knl, self))
+                for knl in kernels)
+
+    def __getitem__(self, name):
+        """Return a :class:`CompiledKernel` for the kernel named *name*,
+        whose code is built as part of this program.
+        """
+        return self.compiled_kernels[name]
+
+    @memoize_method
+    def _get_code_and_impl_arg_info(self):
+        from loopy.codegen import generate_code_and_preambles
+
+        tag_to_preamble = {}
+        codes = []
+        name_to_impl_arg_info = {}
+        name_to_kernel = {}
+
+        for name in self.kernel_names:
+            kernel = self.compiled_kernels[name].get_typed_and_scheduled_kernel(
+                    frozenset())
+            preambles, code, impl_arg_info = generate_code_and_preambles(kernel)
+
+            for tag, preamble in preambles:
+                tag_to_preamble.setdefault(tag, preamble)
+
+            codes.append(code)
+            name_to_impl_arg_info[name] = impl_arg_info
+            name_to_kernel[name] = kernel
+
+        code = "".join(
+                tag_to_preamble[tag] for tag in sorted(tag_to_preamble))
+        code = code + "\n\n".join(codes)
+
+        return code, name_to_kernel, name_to_impl_arg_info
+
+    def get_code(self):
+        code, _, _ = self._get_code_and_impl_arg_info()
+        return code
+
+    @memoize_method
+    def cl_kernel_infos(self):
+        """Build the program, returning a :class:`dict` mapping kernel names
+        to the information on their built code used by
+        :class:`CompiledKernel`.
+        """
+        code, name_to_kernel, name_to_impl_arg_info = \
+                self._get_code_and_impl_arg_info()
+
+        import pyopencl as cl
+        cl_program = cl.Program(self.context, code).build(
+                options=self.cl_build_options)
+
+        result = {}
+        for name in self.kernel_names:
+            kernel = name_to_kernel[name]
+            cl_kernel = getattr(cl_program, name)
+            options = self.compiled_kernels[name].kernel.options
+
+            result[name] = _CLKernelInfo(
+                    kernel=kernel,
+                    cl_kernel=cl_kernel,
+                    impl_arg_info=name_to_impl_arg_info[name],
+                    invoker=generate_invoker(
+                        kernel, cl_kernel, name_to_impl_arg_info[name],
+                        options))
+
+        return result
+
 # }}}
 
 
@@ -0,0 +1,322 @@
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import six
+
+from pytools import Record
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ model parameters
+
+# Number of work items whose memory accesses are serviced together
+SIMD_GROUP_SIZE = 32
+
+# Bytes per memory transaction/cache line
+CACHE_LINE_SIZE = 128
+
+# Assumed trip count of loops whose length cannot be determined
+DEFAULT_TRIP_COUNT = 1000
+
+# }}}
+
+
+# {{{ access patterns
+
+class ArrayAccessPattern(Record):
+    """A (group of identical) access(es) to a global array by an
+    instruction.
+
+    .. attribute:: name
+
+        The name of the array.
+
+    .. attribute:: iname_to_stride
+
+        A :class:`dict` mapping inames to the (approximate) number of array
+        entries by which the accessed address changes when the iname is
+        incremented. Inames on which the access does not depend are absent.
+
+    .. attribute:: itemsize
+    .. attribute:: is_write
+    """
+
+
+def _get_approximate_arg_values(kernel):
+    from loopy.kernel.data import ValueArg
+
+    return dict(
+            (arg.name, arg.approximately)
+            for arg in kernel.args
+            if isinstance(arg, ValueArg)
+            and arg.approximately is not None)
+
+
+def _evaluate_approximately(expr, approximate_arg_values):
+    from pymbolic import evaluate
+    return evaluate(expr, approximate_arg_values)
+
+
+def get_access_patterns(kernel, insn, approximate_arg_values=None):
+    """Return a list of :class:`ArrayAccessPattern` instances for the
+    accesses of *insn* to global array arguments with affine subscripts.
+
+    Strides that depend on parameters are evaluated using the
+    :attr:`loopy.ValueArg.approximately` values of the parameters.
+    """
+
+    from loopy.kernel.data import ImageArg
+    from loopy.kernel.array import ArrayBase, FixedStrideArrayDimTag
+    from loopy.symbolic import ArrayAccessFinder, CoefficientCollector
+    from pymbolic.primitives import Subscript, Variable
+    from pymbolic.mapper.evaluator import UnknownVariableError
+    import loopy as lp
+
+    if approximate_arg_values is None:
+        approximate_arg_values = _get_approximate_arg_values(kernel)
+
+    accesses = [(aae, False) for aae in ArrayAccessFinder()(insn.expression)]
+    if isinstance(insn.assignee, Subscript):
+        accesses.append((insn.assignee, True))
+
+    all_inames = kernel.all_inames()
+
+    result = []
+    for aae, is_write in accesses:
+        arg = kernel.arg_dict.get(aae.aggregate.name)
+        if (not isinstance(arg, ArrayBase)
+                or isinstance(arg, ImageArg)
+                or arg.dtype is None):
+            continue
+
+        index = aae.index
+        if not isinstance(index, tuple):
+            index = (index,)
+
+        if arg.dim_tags is None or any(
+                isinstance(dim_tag, FixedStrideArrayDimTag)
+                and dim_tag.stride is lp.auto
+                for dim_tag in arg.dim_tags):
+            from warnings import warn
+            warn("Strides for '%s' are not known. Local axis assignment "
+                    "is likely suboptimal." % arg.name)
+            continue
+
+        if len(arg.dim_tags) != len(index):
+            continue
+
+        iname_to_stride = {}
+        try:
+            for idx, dim_tag in zip(index, arg.dim_tags):
+                if not isinstance(dim_tag, FixedStrideArrayDimTag):
+                    continue
+
+                coeffs = CoefficientCollector(all_inames)(idx)
+                for key, coeff in six.iteritems(coeffs):
+                    if not (isinstance(key, Variable) and key.name in all_inames):
+                        continue
+
+                    stride = _evaluate_approximately(
+                            coeff*dim_tag.stride, approximate_arg_values)
+                    iname_to_stride[key.name] = (
+                            iname_to_stride.get(key.name, 0) + stride)
+
+        except (RuntimeError, NotImplementedError):
+            # non-affine subscript
+            continue
+        except UnknownVariableError:
+            # stride depends on a parameter without an approximate value
+            continue
+
+        result.append(ArrayAccessPattern(
+            name=arg.name,
+            iname_to_stride=dict(
+                (iname, stride)
+                for iname, stride in six.iteritems(iname_to_stride)
+                if stride != 0),
+            itemsize=arg.dtype.itemsize,
+            is_write=is_write))
+
+    return result
+
+
+def _get_approximate_trip_count(kernel, iname, approximate_arg_values):
+    from loopy.isl_helpers import static_max_of_pw_aff
+    from loopy.symbolic import pw_aff_to_expr
+    from pymbolic.mapper.evaluator import UnknownVariableError
+    import islpy as isl
+
+    try:
+        size = pw_aff_to_expr(static_max_of_pw_aff(
+            kernel.get_iname_bounds(iname).size, constants_only=False))
+        return max(1, _evaluate_approximately(size, approximate_arg_values))
+    except (ValueError, isl.Error, NotImplementedError, UnknownVariableError):
+        return DEFAULT_TRIP_COUNT
+
+# }}}
+
+
+# {{{ local axis ranking
+
+def _get_transactions_per_simd_group(stride_bytes):
+    if stride_bytes == 0:
+        return 1
+
+    return min(SIMD_GROUP_SIZE,
+            -(-SIMD_GROUP_SIZE*stride_bytes // CACHE_LINE_SIZE))
+
+
+def get_auto_axis_iname_ranking(kernel, insn):
+    """Return the inames of *insn* tagged ``l.auto``, ordered by their
+    suitability for local axis 0, or *None* if *insn* does not access
+    global memory in a way that allows a judgment.
+
+    The inames are ranked by the estimated number of memory transactions
+    needed by a SIMD group of work items that are consecutive along the
+    iname, with ties broken by the sum of the strides. Inames on which no
+    access depends come last.
+    """
+
+    from loopy.kernel.data import AutoLocalIndexTagBase
+
+    auto_axis_inames = [
+            iname
+            for iname in kernel.insn_inames(insn)
+            if isinstance(kernel.iname_to_tag.get(iname),
+                AutoLocalIndexTagBase)]
+
+    patterns = get_access_patterns(kernel, insn)
+    if not patterns:
+        return None
+
+    def get_key(iname):
+        strides = [abs(pattern.iname_to_stride.get(iname, 0))
+                for pattern in patterns]
+        transactions = sum(
+                _get_transactions_per_simd_group(stride*pattern.itemsize)
+                for stride, pattern in zip(strides, patterns))
+
+        return (not any(strides), transactions, sum(strides), iname)
+
+    return sorted(auto_axis_inames, key=get_key)
+
+# }}}
+
+
+# {{{ loop ordering
+
+def _get_reference_cost(pattern, iname, trip_count):
+    # The number of cache lines touched by *pattern* in a loop over *iname*
+    # of *trip_count* iterations, cf. K. McKinley, S. Carr, C.-W. Tseng,
+    # "Improving data locality with loop transformations", TOPLAS 1996.
+
+    stride_bytes = abs(pattern.iname_to_stride.get(iname, 0))*pattern.itemsize
+
+    if stride_bytes == 0:
+        return 1
+    elif stride_bytes < CACHE_LINE_SIZE:
+        return trip_count*stride_bytes/CACHE_LINE_SIZE
+    else:
+        return trip_count
+
+
+def _is_sequential_loop_iname(kernel, iname):
+    from loopy.kernel.data import ParallelTag, VectorizeTag
+    return not isinstance(kernel.iname_to_tag.get(iname),
+            (ParallelTag, VectorizeTag))
+
+
+def get_loop_costs(kernel):
+    """Return a :class:`dict` mapping each sequential iname to the
+    estimated number of cache lines moved from or to global memory by the
+    instructions within it if its loop were innermost.
+    """
+
+    from loopy.kernel.data import ExpressionInstruction
+    from pytools import product
+
+    approximate_arg_values = _get_approximate_arg_values(kernel)
+    trip_counts = {}
+
+    result = {}
+    for insn in kernel.instructions:
+        if not isinstance(insn, ExpressionInstruction):
+            continue
+
+        loop_inames = sorted(
+                iname for iname in kernel.insn_inames(insn)
+                if _is_sequential_loop_iname(kernel, iname))
+        if not loop_inames:
+            continue
+
+        patterns = get_access_patterns(kernel, insn, approximate_arg_values)
+        if not patterns:
+            continue
+
+        for iname in loop_inames:
+            if iname not in trip_counts:
+                trip_counts[iname] = _get_approximate_trip_count(
+                        kernel, iname, approximate_arg_values)
+
+        for iname in loop_inames:
+            other_trips = product(
+                trip_counts[other_iname]
+                for other_iname in loop_inames
+                if other_iname != iname)
+
+            result[iname] = result.get(iname, 0) + other_trips*sum(
+                    _get_reference_cost(pattern, iname, trip_counts[iname])
+                    for pattern in patterns)
+
+    return result
+
+
+def get_default_loop_priority(kernel):
+    """Return :attr:`loopy.LoopKernel.loop_priority`, followed by the
+    remaining sequential inames ordered (outermost first) by decreasing
+    cost according to :func:`get_loop_costs`, so that the loops with the
+    least memory traffic (i.e. with the best spatial and temporal reuse)
+    end up innermost.
+    """
+
+    loop_costs = get_loop_costs(kernel)
+
+    model_priority = sorted(
+            (iname for iname in loop_costs
+                if iname not in kernel.loop_priority),
+            key=lambda iname: (-loop_costs[iname], iname))
+
+    if model_priority:
+        logger.debug("%s: default loop priority: %s" % (
+            kernel.name, ", ".join(model_priority)))
+
+    return list(kernel.loop_priority) + model_priority
+
+# }}}
+
+# vim: foldmethod=marker
@@ -328,6 +328,22 @@ class VectorizabilityChecker(RecursiveMapper):
         from loopy.kernel.array import VectorArrayDimTag
         from pymbolic.primitives import Variable
 
+        if (self.kernel.options.use_vload_vstore
+                and self.vec_iname in get_dependencies(index)
+                and not any(isinstance(dim_tag, VectorArrayDimTag)
+                    for dim_tag in var.dim_tags or ())):
+            from loopy.kernel.array import get_vector_memory_access_info
+            from pymbolic import evaluate
+
+            if get_vector_memory_access_info(
+                    self.kernel.target, var, index,
+                    lambda expr: evaluate(expr, {}),
+                    self.vec_iname, self.vec_iname_length) is None:
+                raise Unvectorizable("access '%s' is not contiguous along "
+                        "vectorizing iname '%s'" % (expr, self.vec_iname))
+
+            return True
+
         possible = None
         for i in range(len(var.shape)):
             if (
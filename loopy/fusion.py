@@ -29,8 +29,12 @@ import islpy as isl
 from islpy import dim_type
 
 from loopy.diagnostic import LoopyError
+from loopy.symbolic import RuleAwareIdentityMapper, WalkMapper
 from pymbolic import var
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 def _find_fusable_loop_domain_index(domain, other_domains):
     my_inames = set(domain.get_var_dict(dim_type.set))
@@ -114,7 +118,7 @@ def _fuse_two_kernels(knla, knlb):
                     set(dom_b.get_var_dict(dim_type.set)))
 
             dom_a_s = dom_a.project_out_except(shared_inames, [dim_type.set])
-            dom_b_s = dom_a.project_out_except(shared_inames, [dim_type.set])
+            dom_b_s = dom_b.project_out_except(shared_inames, [dim_type.set])
 
             if not (dom_a_s <= dom_b_s and dom_b_s <= dom_a_s):
                 raise LoopyError("kernels do not agree on domain of "
@@ -203,7 +207,7 @@ def _fuse_two_kernels(knla, knlb):
                 insnb.copy(
                     insn_deps=frozenset(
                         old_b_id_to_new_b_id[dep_id]
-                        for dep_id in insnb.insn_deps)))
+                        for dep_id in insnb.insn_deps or ())))
 
     # }}}
 
@@ -214,12 +218,12 @@ def _fuse_two_kernels(knla, knlb):
     assump_a, assump_b = isl.align_two(assump_a, assump_b)
 
     shared_param_names = list(
-            set(dom_a.get_var_dict(dim_type.set))
+            set(knla.assumptions.get_var_dict(dim_type.param))
             &
-            set(dom_b.get_var_dict(dim_type.set)))
+            set(knlb.assumptions.get_var_dict(dim_type.param)))
 
     assump_a_s = assump_a.project_out_except(shared_param_names, [dim_type.param])
-    assump_b_s = assump_a.project_out_except(shared_param_names, [dim_type.param])
+    assump_b_s = assump_b.project_out_except(shared_param_names, [dim_type.param])
 
     if not (assump_a_s <= assump_b_s and assump_b_s <= assump_a_s):
         raise LoopyError("assumptions do not agree on kernels to be merged")
@@ -282,12 +286,245 @@ def _fuse_two_kernels(knla, knlb):
 # }}}
 
 
-def fuse_kernels(kernels):
+# {{{ store/fetch elimination
+
+class _AccessCollector(WalkMapper):
+    def __init__(self, name):
+        self.name = name
+        self.accesses = []
+        self.saw_other_use = False
+
+    def map_subscript(self, expr, *args):
+        if expr.aggregate.name == self.name:
+            self.accesses.append(expr)
+            self.rec(expr.index, *args)
+        else:
+            super(_AccessCollector, self).map_subscript(expr, *args)
+
+    def map_variable(self, expr, *args):
+        if expr.name == self.name:
+            self.saw_other_use = True
+
+
+class _PointwiseAccessReplacer(RuleAwareIdentityMapper):
+    def __init__(self, rule_mapping_context, name, index, replacement):
+        super(_PointwiseAccessReplacer, self).__init__(rule_mapping_context)
+        self.name = name
+        self.index = index
+        self.replacement = replacement
+
+    def map_subscript(self, expr, expn_state):
+        if (expr.aggregate.name == self.name
+                and expr.index == self.index):
+            return self.replacement
+
+        return super(_PointwiseAccessReplacer, self).map_subscript(
+                expr, expn_state)
+
+
+def eliminate_intermediate(kernel, name):
+    """Keep the global array *name*, which is written by a single
+    instruction of *kernel* and only read at the point being written
+    (i.e. using the assignee's index) by other instructions, out of global
+    memory. If *name* is read once, the expression defining it is
+    substituted at the point of use (see :func:`loopy.temporary_to_subst`),
+    otherwise it becomes a private scalar temporary. In either case, *name*
+    is removed from the kernel's arguments.
+
+    The reads must logically follow the write, as is the case when the
+    reads and the write originate from different kernels combined by
+    :func:`fuse_kernels`.
+    """
+
+    from loopy.kernel.data import (
+            GlobalArg, TemporaryVariable, ExpressionInstruction)
+    from loopy.symbolic import get_dependencies
+    from pymbolic.primitives import Subscript, Variable
+
+    arg = kernel.arg_dict.get(name)
+    if not isinstance(arg, GlobalArg):
+        raise LoopyError("'%s' is not a global array argument" % name)
+
+    writer_ids = kernel.writer_map().get(name, set())
+    if len(writer_ids) != 1:
+        raise LoopyError("'%s' is not written by exactly one instruction"
+                % name)
+
+    writer_id, = writer_ids
+    writer = kernel.id_to_insn[writer_id]
+
+    if (not isinstance(writer, ExpressionInstruction)
+            or writer.predicates
+            or not isinstance(writer.assignee, Subscript)):
+        raise LoopyError("'%s' is not written by an unconditional "
+                "assignment to an array entry" % name)
+
+    index = writer.assignee.index
+    if not isinstance(index, tuple):
+        index = (index,)
+
+    if not (all(isinstance(idx, Variable) for idx in index)
+            and len(set(index)) == len(index)
+            and set(idx.name for idx in index) == kernel.insn_inames(writer)):
+        raise LoopyError("the write to '%s' in instruction '%s' is not "
+                "indexed by exactly the inames of the instruction"
+                % (name, writer_id))
+
+    if name in writer.read_dependency_names():
+        raise LoopyError("instruction '%s' writes '%s' but also reads it"
+                % (writer_id, name))
+
+    for rule in six.itervalues(kernel.substitutions):
+        if name in get_dependencies(rule.expression):
+            raise LoopyError("substitution rule '%s' uses '%s'"
+                    % (rule.name, name))
+
+    nreads = 0
+    for insn in kernel.instructions:
+        if name not in insn.read_dependency_names():
+            continue
+
+        if not isinstance(insn, ExpressionInstruction):
+            raise LoopyError("'%s' is read by non-expression instruction '%s'"
+                    % (name, insn.id))
+
+        for expr in [insn.expression] + [
+                idx for _, idx in insn.assignees_and_indices()]:
+            collector = _AccessCollector(name)
+            collector(expr)
+            if collector.saw_other_use:
+                raise LoopyError("instruction '%s' uses '%s' other than "
+                        "by indexing it" % (insn.id, name))
+
+            for access in collector.accesses:
+                access_index = access.index
+                if not isinstance(access_index, tuple):
+                    access_index = (access_index,)
+
+                if access_index != index:
+                    raise LoopyError("instruction '%s' reads '%s' at an index "
+                            "other than the one written ('%s')"
+                            % (insn.id, name, access))
+
+            nreads += len(collector.accesses)
+
+    new_args = [other_arg for other_arg in kernel.args
+            if other_arg.name != name]
+
+    import loopy as lp
+    dtype = arg.dtype
+    if dtype is None:
+        dtype = lp.auto
+
+    # Substituting is only safe if the defining expression evaluates the
+    # same at the point of use.
+    if (nreads == 1
+            and not (get_dependencies(writer.expression)
+                & kernel.get_written_variables())
+            and not writer.reduction_inames()):
+        # {{{ substitute definition
+
+        from loopy.subst import temporary_to_subst
+
+        new_temporaries = kernel.temporary_variables.copy()
+        new_temporaries[name] = TemporaryVariable(
+                name=name, dtype=dtype, shape=arg.shape,
+                is_local=False)
+
+        return temporary_to_subst(
+                kernel.copy(args=new_args, temporary_variables=new_temporaries),
+                name)
+
+        # }}}
+
+    else:
+        # {{{ privatize
+
+        new_temporaries = kernel.temporary_variables.copy()
+        new_temporaries[name] = TemporaryVariable(
+                name=name, dtype=dtype, shape=(), is_local=False)
+
+        from loopy.symbolic import SubstitutionRuleMappingContext
+        rule_mapping_context = SubstitutionRuleMappingContext(
+                kernel.substitutions, kernel.get_var_name_generator())
+        replacer = _PointwiseAccessReplacer(
+                rule_mapping_context, name, writer.assignee.index, var(name))
+
+        return rule_mapping_context.finish_kernel(replacer.map_kernel(
+                kernel.copy(
+                    args=new_args, temporary_variables=new_temporaries)))
+
+        # }}}
+
+# }}}
+
+
+def fuse_kernels(kernels, eliminate_intermediates=False):
+    """Return a kernel that performs all the operations of *kernels*,
+    fusing loops with like-named inames.
+
+    :arg eliminate_intermediates: If *True*, use
+        :func:`loopy.fusion.eliminate_intermediate` on those global arrays written
+        by one of *kernels* and read by a later one, where possible. (Arrays
+        whose values are needed after the fused kernel completes must not be
+        among them.) If a list of names, eliminate exactly the arrays
+        named, and raise a :exc:`loopy.LoopyError` if that is not possible.
+    """
+
     kernels = list(kernels)
+
+    if eliminate_intermediates is True:
+        # {{{ find intermediates
+
+        intermediates = []
+        read_before = set()
+        for i, knl in enumerate(kernels):
+            read_later = set()
+            for later_knl in kernels[i+1:]:
+                for insn in later_knl.instructions:
+                    read_later.update(insn.read_dependency_names())
+
+            for name in sorted(knl.get_written_variables()):
+                arg = knl.arg_dict.get(name)
+                if (arg is None
+                        or name not in read_later
+                        or name in read_before
+                        or any(other_knl.arg_dict.get(name) != arg
+                            for other_knl in kernels[i+1:]
+                            if name in other_knl.arg_dict)):
+                    continue
+
+                intermediates.append(name)
+
+            for insn in knl.instructions:
+                read_before.update(insn.read_dependency_names())
+
+        required = False
+
+        # }}}
+
+    elif not eliminate_intermediates:
+        intermediates = []
+        required = False
+
+    else:
+        intermediates = list(eliminate_intermediates)
+        required = True
+
     result = kernels.pop(0)
     while kernels:
         result = _fuse_two_kernels(result, kernels.pop(0))
 
+    for name in intermediates:
+        try:
+            result = eliminate_intermediate(result, name)
+        except LoopyError:
+            if required:
+                raise
+
+            logger.debug("%s: not eliminating intermediate '%s'"
+                    % (result.name, name))
+
     return result
 
 # vim: foldmethod=marker
@@ -0,0 +1,403 @@
+from __future__ import division, absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import six
+import numpy as np
+
+import islpy as isl
+from islpy import dim_type
+
+from loopy.diagnostic import LoopyError
+
+
+# {{{ helpers
+
+def _get_needed_args(kernel, var_names):
+    """Return the arguments of *kernel* named in *var_names*, along with the
+    :class:`loopy.ValueArg` instances needed by their shapes and by the
+    domains of *kernel*.
+    """
+
+    from loopy.symbolic import get_dependencies
+
+    needed = set(var_names)
+    for dom in kernel.domains:
+        needed.update(dom.get_var_names(dim_type.param))
+
+    for arg in kernel.args:
+        if arg.name in needed and getattr(arg, "shape", None) is not None:
+            needed.update(get_dependencies(
+                tuple(s for s in arg.shape if s is not None)))
+
+    return [arg for arg in kernel.args if arg.name in needed]
+
+
+def _get_reduction_iname_domain(kernel, iname):
+    dom = (kernel.get_inames_domain(frozenset([iname]))
+            .project_out_except([iname], [dim_type.set]))
+
+    iname_params = (
+            frozenset(dom.get_var_names(dim_type.param))
+            & kernel.all_inames())
+    if iname_params:
+        raise LoopyError("bounds of reduction iname '%s' may not depend on "
+                "other inames (found: %s)"
+                % (iname, ", ".join(sorted(iname_params))))
+
+    from loopy.isl_helpers import static_value_of_pw_aff
+    from loopy.symbolic import aff_to_expr
+
+    _, iname_idx = dom.get_var_dict()[iname]
+    try:
+        lower_bound = aff_to_expr(static_value_of_pw_aff(
+                kernel.cache_manager.dim_min(dom, iname_idx).coalesce(),
+                constants_only=False, context=kernel.assumptions))
+    except ValueError:
+        raise LoopyError("reduction iname '%s' does not have a single "
+                "lower bound" % iname)
+
+    return dom, lower_bound
+
+# }}}
+
+
+# {{{ split reduction across groups
+
+def split_reduction_across_groups(kernel, insn_id, num_groups=64,
+        group_size=128, partial_name=None):
+    """Split the reduction making up the right-hand side of the instruction
+    with id *insn_id* into two kernels.
+
+    The first kernel runs *num_groups* work groups of *group_size* work
+    items each. Each work item sequentially reduces over every
+    ``num_groups*group_size``-th element (so that neighboring work items
+    access neighboring elements), the work items within a group then
+    combine their results by a tree reduction in local memory (see
+    :func:`loopy.preprocess.realize_reduction`), and each group writes its
+    result to a global array *partial_name* of length *num_groups*.
+
+    The second kernel is *kernel*, with the reduction replaced by a
+    sequential reduction over the entries of *partial_name*, which is
+    passed as an additional argument.
+
+    The instruction may not be nested inside any loops, and the reduction
+    must be over a single iname whose bounds depend only on parameters.
+    Its argument may only refer to kernel arguments, and the type of the
+    argument must be known.
+
+    :returns: a tuple ``(stage1_kernel, stage2_kernel)``.
+
+    See :class:`TwoStageReductionKernel` for a way of executing the
+    result.
+    """
+
+    from loopy.subst import expand_subst
+    kernel = expand_subst(kernel)
+
+    from loopy.preprocess import infer_unknown_types
+    kernel = infer_unknown_types(kernel)
+
+    # {{{ check applicability
+
+    from loopy.kernel.data import ExpressionInstruction
+    from loopy.symbolic import Reduction
+
+    insn = kernel.id_to_insn[insn_id]
+    if (not isinstance(insn, ExpressionInstruction)
+            or not isinstance(insn.expression, Reduction)):
+        raise LoopyError("instruction '%s' does not consist of a single "
+                "reduction" % insn_id)
+
+    red = insn.expression
+    if len(red.inames) != 1:
+        raise LoopyError("instruction '%s': only reductions over a single "
+                "iname can be split across groups" % insn_id)
+
+    red_iname, = red.inames
+
+    outer_inames = kernel.insn_inames(insn)
+    if outer_inames:
+        raise LoopyError("instruction '%s' may not be nested inside loops "
+                "over '%s'" % (insn_id, ", ".join(sorted(outer_inames))))
+
+    for other_insn in kernel.instructions:
+        if (other_insn.id != insn_id
+                and red_iname in kernel.insn_inames(other_insn)):
+            raise LoopyError("reduction iname '%s' is also used by "
+                    "instruction '%s'" % (red_iname, other_insn.id))
+
+    from loopy.symbolic import get_dependencies
+    red_deps = get_dependencies(red) - frozenset(kernel.all_params())
+    non_arg_deps = red_deps - frozenset(kernel.arg_dict)
+    if non_arg_deps:
+        raise LoopyError("reduction in instruction '%s' may only use kernel "
+                "arguments (found: %s)"
+                % (insn_id, ", ".join(sorted(non_arg_deps))))
+
+    from loopy.expression import TypeInferenceMapper
+    from loopy.diagnostic import DependencyTypeInferenceFailure
+    try:
+        arg_dtype = TypeInferenceMapper(kernel)(red.expr)
+    except DependencyTypeInferenceFailure:
+        raise LoopyError("failed to determine type of reduction argument "
+                "in instruction '%s'" % insn_id)
+
+    # }}}
+
+    op = red.operation
+    result_dtype = op.result_dtype(kernel.target, arg_dtype, red.inames)
+
+    from loopy.library.reduction import CombineReductionOperation
+    combine_op = CombineReductionOperation(op, arg_dtype)
+
+    vng = kernel.get_var_name_generator()
+    grp_iname = vng(red_iname+"_grp")
+    lane_iname = vng(red_iname+"_lane")
+    seq_iname = vng(red_iname+"_seq")
+    partial_iname = vng(red_iname+"_partial")
+
+    if partial_name is None:
+        (assignee_name, _), = insn.assignees_and_indices()
+        partial_name = vng(assignee_name+"_partial")
+
+    from pymbolic import var
+    from loopy.kernel.data import GlobalArg, GroupIndexTag, LocalIndexTag
+
+    partial_arg = GlobalArg(partial_name, result_dtype, shape=(num_groups,),
+            order="C")
+
+    # {{{ stage 1: per-group partial results
+
+    red_dom, lower_bound = _get_reduction_iname_domain(kernel, red_iname)
+
+    index_expr = (
+            lower_bound
+            + (var(seq_iname)*num_groups + var(grp_iname))*group_size
+            + var(lane_iname))
+
+    nparams = red_dom.dim(dim_type.param)
+    red_dom = red_dom.add_dims(dim_type.set, 3)
+    for i, iname in enumerate([grp_iname, lane_iname, seq_iname]):
+        red_dom = red_dom.set_dim_name(dim_type.set, 1+i, iname)
+
+    from loopy.isl_helpers import make_slab
+    from loopy.symbolic import eq_constraint_from_expr
+
+    space = red_dom.get_space()
+    red_dom = (red_dom
+            & make_slab(space, grp_iname, 0, num_groups)
+            & make_slab(space, lane_iname, 0, group_size))
+    red_dom = (red_dom
+            .add_constraint(
+                isl.Constraint.ineq_from_names(space, {seq_iname: 1}))
+            .add_constraint(
+                eq_constraint_from_expr(space, var(red_iname) - index_expr)))
+
+    _, red_iname_idx = red_dom.get_var_dict()[red_iname]
+    red_dom = red_dom.project_out(dim_type.set, red_iname_idx, 1)
+
+    # The sequential loop is nested inside the (parallel) group and lane
+    # loops.
+    for i, iname in enumerate([grp_iname, lane_iname]):
+        _, idx = red_dom.get_var_dict()[iname]
+        red_dom = red_dom.move_dims(dim_type.param, nparams+i,
+                dim_type.set, idx, 1)
+
+    par_dom = isl.BasicSet.read_from_str(kernel.isl_context,
+            "{[%(grp)s, %(lane)s]: 0<=%(grp)s<%(ngroups)d "
+            "and 0<=%(lane)s<%(gsize)d}"
+            % dict(grp=grp_iname, lane=lane_iname,
+                ngroups=num_groups, gsize=group_size))
+
+    # Apply the reduction's own update to each element, so that
+    # index-aware reductions (such as argmax) see the original iname.
+    from loopy.symbolic import SubstitutionMapper
+    from pymbolic.mapper.substitutor import make_subst_func
+    operand = SubstitutionMapper(make_subst_func({red_iname: index_expr}))(
+            op(arg_dtype, op.neutral_element(arg_dtype, red.inames),
+                red.expr, red.inames))
+
+    stage1_insn = ExpressionInstruction(
+            id=insn.id,
+            assignee=var(partial_name)[var(grp_iname)],
+            expression=Reduction(combine_op, (lane_iname, seq_iname), operand))
+
+    stage1 = kernel.copy(
+            name=kernel.name+"_stage1",
+            domains=[par_dom, red_dom],
+            instructions=[stage1_insn],
+            args=_get_needed_args(kernel, red_deps) + [partial_arg],
+            temporary_variables={},
+            substitutions={},
+            iname_to_tag={
+                grp_iname: GroupIndexTag(0),
+                lane_iname: LocalIndexTag(0),
+                },
+            iname_slab_increments={},
+            loop_priority=[],
+            local_sizes={})
+
+    # }}}
+
+    # {{{ stage 2: combine partial results
+
+    from loopy.kernel.tools import DomainChanger
+    domch = DomainChanger(kernel, (red_iname,))
+    dom = domch.domain
+    _, red_iname_idx = dom.get_var_dict()[red_iname]
+    dom = dom.project_out(dim_type.set, red_iname_idx, 1)
+
+    if dom.dim(dim_type.set):
+        stage2_domains = domch.get_domains_with(dom)
+    else:
+        stage2_domains = [
+                other_dom for other_dom in kernel.domains
+                if other_dom is not domch.get_original_domain()]
+
+    stage2_domains.append(isl.BasicSet.read_from_str(kernel.isl_context,
+            "{[%(iname)s]: 0<=%(iname)s<%(ngroups)d}"
+            % dict(iname=partial_iname, ngroups=num_groups)))
+
+    stage2_insns = [
+            other_insn.copy(expression=Reduction(
+                combine_op, (partial_iname,),
+                var(partial_name)[var(partial_iname)]))
+            if other_insn.id == insn_id
+            else other_insn
+            for other_insn in kernel.instructions]
+
+    stage2 = kernel.copy(
+            name=kernel.name+"_stage2",
+            domains=stage2_domains,
+            instructions=stage2_insns,
+            iname_to_tag=dict(
+                (iname, tag)
+                for iname, tag in six.iteritems(kernel.iname_to_tag)
+                if iname != red_iname))
+
+    stage2_used_vars = stage2.get_read_variables() | stage2.get_written_variables()
+    stage2 = stage2.copy(
+            args=_get_needed_args(stage2, stage2_used_vars) + [partial_arg])
+
+    # }}}
+
+    return stage1, stage2
+
+# }}}
+
+
+# {{{ execution
+
+class TwoStageReductionKernel(object):
+    """Executes the two kernels obtained from
+    :func:`split_reduction_across_groups` as if they were a single
+    :class:`loopy.CompiledKernel`.
+
+    .. automethod:: __call__
+    .. automethod:: get_code
+    """
+
+    def __init__(self, context, kernel, insn_id, num_groups=64,
+            group_size=128, partial_name=None):
+        stage1, stage2 = split_reduction_across_groups(
+                kernel, insn_id, num_groups=num_groups, group_size=group_size,
+                partial_name=partial_name)
+
+        from loopy.compiled import CompiledKernel
+        self.stage1 = CompiledKernel(context, stage1)
+        self.stage2 = CompiledKernel(context, stage2)
+
+        self.partial_name = stage1.args[-1].name
+
+    @staticmethod
+    def _filter_kwargs(compiled, kwargs):
+        names = (
+                set(compiled.kernel.impl_arg_to_arg)
+                | set(arg.name for arg in compiled.kernel.args))
+
+        return dict(
+                (name, val)
+                for name, val in six.iteritems(kwargs)
+                if name in names)
+
+    def __call__(self, queue, **kwargs):
+        """Accepts the same arguments as
+        :meth:`loopy.CompiledKernel.__call__`. The second stage waits for
+        the first one.
+
+        :returns: ``(evt, output)`` of the second stage. The array of
+            partial results is not returned.
+        """
+
+        allocator = kwargs.pop("allocator", None)
+        wait_for = kwargs.pop("wait_for", None)
+        out_host = kwargs.pop("out_host", None)
+        dependency_tracker = kwargs.pop("dependency_tracker", None)
+
+        if out_host is None:
+            import pyopencl.array as cl_array
+            out_host = (
+                    any(isinstance(val, np.ndarray)
+                        for val in six.itervalues(kwargs))
+                    and not any(isinstance(val, cl_array.Array)
+                        for val in six.itervalues(kwargs)))
+
+        evt, output = self.stage1(queue,
+                allocator=allocator, wait_for=wait_for, out_host=False,
+                dependency_tracker=dependency_tracker,
+                **self._filter_kwargs(self.stage1, kwargs))
+
+        if isinstance(output, dict):
+            partial = output[self.partial_name]
+        else:
+            partial, = output
+
+        stage2_kwargs = self._filter_kwargs(self.stage2, kwargs)
+        stage2_kwargs[self.partial_name] = partial
+
+        return self.stage2(queue,
+                allocator=allocator, wait_for=[evt], out_host=out_host,
+                dependency_tracker=dependency_tracker,
+                **stage2_kwargs)
+
+    def get_code(self, arg_to_dtype=None):
+        """Return the code of both stages, concatenated."""
+
+        def get_stage_code(compiled):
+            if arg_to_dtype is None:
+                return compiled.get_code()
+
+            names = set(arg.name for arg in compiled.kernel.args)
+            return compiled.get_code(dict(
+                (name, dtype)
+                for name, dtype in six.iteritems(arg_to_dtype)
+                if name in names))
+
+        return "\n\n".join(
+                get_stage_code(compiled)
+                for compiled in [self.stage1, self.stage2])
+
+# }}}
+
+# vim: foldmethod=marker
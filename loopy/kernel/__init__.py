@@ -128,7 +128,10 @@ class LoopKernel(RecordWithoutPickling):
 
         a dictionary mapping inames to (lower_incr,
         upper_incr) tuples that will be separated out in the execution to generate
-        'bulk' slabs with fewer conditionals.
+        'bulk' slabs with fewer conditionals. Instead of a tuple, the
+        value may also be the string ``"auto"``, in which case the
+        increments are chosen during code generation so as to remove
+        conditionals on inames whose bounds depend on the iname, if possible.
 
     .. attribute:: loop_priority
 
@@ -926,8 +929,53 @@ class LoopKernel(RecordWithoutPickling):
             if tv.is_local)
 
     def local_mem_use(self):
-        return sum(lv.nbytes for lv in six.itervalues(self.temporary_variables)
-                if lv.is_local)
+        result = 0
+        base_storage_to_nbytes = {}
+
+        for lv in six.itervalues(self.temporary_variables):
+            if not lv.is_local:
+                continue
+
+            if lv.base_storage is None:
+                result += lv.nbytes
+            else:
+                base_storage_to_nbytes[lv.base_storage] = max(
+                        base_storage_to_nbytes.get(lv.base_storage, 0),
+                        lv.nbytes)
+
+        return result + sum(six.itervalues(base_storage_to_nbytes))
+
+    # }}}
+
+    # {{{ schedule information
+
+    @memoize_method
+    def get_schedule_tables(self):
+        """Return a :class:`loopy.schedule.ScheduleTables` instance with
+        per-schedule-index information about :attr:`schedule`.
+        """
+        from loopy.schedule import compute_schedule_tables
+        return compute_schedule_tables(self)
+
+    @memoize_method
+    def hw_parallel_inames(self):
+        """Return a tuple of two :class:`frozenset` instances, the first
+        containing all inames tagged with a
+        :class:`loopy.kernel.data.HardwareParallelTag`, the second containing
+        just the ones that are not tagged with a
+        :class:`loopy.kernel.data.LocalIndexTag`.
+        """
+        from loopy.kernel.data import HardwareParallelTag, LocalIndexTag
+
+        hw_inames = set()
+        nonlocal_hw_inames = set()
+        for iname, tag in six.iteritems(self.iname_to_tag):
+            if isinstance(tag, HardwareParallelTag):
+                hw_inames.add(iname)
+                if not isinstance(tag, LocalIndexTag):
+                    nonlocal_hw_inames.add(iname)
+
+        return frozenset(hw_inames), frozenset(nonlocal_hw_inames)
 
     # }}}
 
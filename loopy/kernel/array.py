@@ -1220,4 +1220,121 @@ def get_access_info(target, ary, index, eval_expr, vectorization_info):
 
 # }}}
 
+
+# {{{ contiguous vector access
+
+class VectorMemoryAccessInfo(Record):
+    """Describes an access to a scalar-typed array that is contiguous along
+    a vectorized iname and can therefore be implemented using
+    ``vloadn``/``vstoren``.
+
+    .. attribute:: array_name
+    .. attribute:: vector_length
+    .. attribute:: base_subscript
+
+        The linearized subscript of the first vector entry.
+
+    .. attribute:: aligned_offset
+
+        *base_subscript* divided by :attr:`vector_length`, or *None* if
+        *base_subscript* is not known to be a multiple of
+        :attr:`vector_length`.
+    """
+
+
+def _get_exact_quotient(expr, divisor):
+    """Return *expr* divided by the integer *divisor* if *expr* is
+    structurally a multiple of *divisor* for all values of the variables
+    in it, or *None*.
+    """
+
+    from pymbolic.primitives import Sum, Product, FloorDiv
+
+    if is_integer(expr):
+        if expr % divisor == 0:
+            return expr // divisor
+        return None
+
+    elif isinstance(expr, Sum):
+        quotients = [_get_exact_quotient(child, divisor)
+                for child in expr.children]
+        if any(quotient is None for quotient in quotients):
+            return None
+        return Sum(tuple(quotients))
+
+    elif isinstance(expr, Product):
+        for i, child in enumerate(expr.children):
+            quotient = _get_exact_quotient(child, divisor)
+            if quotient is not None:
+                return Product(
+                        expr.children[:i] + (quotient,) + expr.children[i+1:])
+        return None
+
+    elif isinstance(expr, FloorDiv) and expr.denominator == 1:
+        return _get_exact_quotient(expr.numerator, divisor)
+
+    else:
+        return None
+
+
+def get_vector_memory_access_info(target, ary, index, eval_expr,
+        vec_iname, vec_length):
+    """Return a :class:`VectorMemoryAccessInfo` if the access to *ary*
+    at *index* can be implemented as a vector access along *vec_iname*
+    (of length *vec_length*) using ``vloadn``/``vstoren``. Otherwise,
+    return *None*.
+
+    :arg ary: an object of type :class:`ArrayBase`
+    :arg index: a tuple of indices representing a subscript into ary
+    """
+
+    if vec_length not in [2, 3, 4, 8, 16]:
+        return None
+
+    from loopy.target.opencl import OpenCLTarget
+    if not isinstance(target, OpenCLTarget):
+        return None
+
+    from loopy.kernel.data import ImageArg
+    if isinstance(ary, ImageArg) or ary.dtype is None:
+        return None
+
+    dtype = np.dtype(ary.dtype)
+    if dtype.kind not in "iuf" or dtype.fields is not None:
+        return None
+
+    if ary.dim_tags is not None and any(
+            isinstance(dim_tag, VectorArrayDimTag) for dim_tag in ary.dim_tags):
+        return None
+
+    try:
+        access_info = get_access_info(target, ary, index, eval_expr, None)
+    except LoopyError:
+        return None
+
+    if len(access_info.subscripts) != 1:
+        return None
+
+    subscript, = access_info.subscripts
+
+    from loopy.symbolic import CoefficientCollector
+    from pymbolic import var
+    try:
+        coeffs = CoefficientCollector([vec_iname])(subscript)
+    except (RuntimeError, NotImplementedError):
+        return None
+
+    if coeffs.get(var(vec_iname)) != 1:
+        return None
+
+    base_subscript = coeffs.get(1, 0)
+
+    return VectorMemoryAccessInfo(
+            array_name=access_info.array_name,
+            vector_length=vec_length,
+            base_subscript=base_subscript,
+            aligned_offset=_get_exact_quotient(base_subscript, vec_length))
+
+# }}}
+
 # vim: fdm=marker
@@ -312,6 +312,13 @@ class TemporaryVariable(ArrayBase):
         Whether this is temporary lives in ``local`` memory.
         May be *True*, *False*, or :class:`loopy.auto` if this is
         to be automatically determined.
+
+    .. attribute:: base_storage
+
+        The name of a storage array (in the same address space) that holds
+        the data of this temporary, possibly shared with other temporaries
+        that are not in use at the same time, or *None* if the temporary
+        has storage of its own. See :func:`loopy.storage.share_temporary_storage`.
     """
 
     min_target_axes = 0
@@ -320,12 +327,13 @@ class TemporaryVariable(ArrayBase):
     allowed_extra_kwargs = [
             "storage_shape",
             "base_indices",
-            "is_local"
+            "is_local",
+            "base_storage",
             ]
 
     def __init__(self, name, dtype=None, shape=(), is_local=auto,
             dim_tags=None, offset=0, strides=None, order=None,
-            base_indices=None, storage_shape=None):
+            base_indices=None, storage_shape=None, base_storage=None):
         """
         :arg dtype: :class:`loopy.auto` or a :class:`numpy.dtype`
         :arg shape: :class:`loopy.auto` or a shape tuple
@@ -343,7 +351,7 @@ class TemporaryVariable(ArrayBase):
                 dtype=dtype, shape=shape,
                 dim_tags=dim_tags, order="C",
                 base_indices=base_indices, is_local=is_local,
-                storage_shape=storage_shape)
+                storage_shape=storage_shape, base_storage=base_storage)
 
     @property
     def nbytes(self):
@@ -381,6 +389,7 @@ class TemporaryVariable(ArrayBase):
         key_builder.rec(key_hash, self.storage_shape)
         key_builder.rec(key_hash, self.base_indices)
         key_builder.rec(key_hash, self.is_local)
+        key_builder.rec(key_hash, self.base_storage)
 
 # }}}
 
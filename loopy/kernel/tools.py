@@ -578,4 +578,93 @@ def is_domain_dependent_on_inames(kernel, domain_index, inames):
 # }}}
 
 
+# {{{ find tile operands
+
+def find_tile_operands(kernel, inames):
+    """Return a :class:`dict` mapping names of (read-only) array arguments
+    accessed by instructions within *inames* to the subsets of *inames*
+    on which their accesses depend.
+    """
+
+    from loopy.kernel.data import ExpressionInstruction
+    from loopy.kernel.array import ArrayBase
+    from loopy.symbolic import ArrayAccessFinder, get_dependencies
+
+    written_vars = kernel.get_written_variables()
+
+    result = {}
+    for insn in kernel.instructions:
+        if not isinstance(insn, ExpressionInstruction):
+            continue
+        if not kernel.insn_inames(insn) & inames:
+            continue
+
+        for access in ArrayAccessFinder()(insn.expression):
+            name = access.aggregate.name
+            if (name in written_vars
+                    or not isinstance(kernel.arg_dict.get(name), ArrayBase)):
+                continue
+
+            result[name] = (
+                    result.get(name, frozenset())
+                    | (get_dependencies(access.index) & inames))
+
+    return result
+
+# }}}
+
+
+# {{{ check sequential iname nesting
+
+def iname_range_depends_on(kernel, iname, inames):
+    """Return *True* if the range of *iname* depends on any of *inames*."""
+
+    other_inames = frozenset(inames) - frozenset([iname])
+    all_inames = other_inames | frozenset([iname])
+    domain = (kernel.get_inames_domain(all_inames)
+            .project_out_except(all_inames, [dim_type.set]))
+
+    iname_only = domain
+    others_only = domain
+    for name, (dt, idx) in six.iteritems(domain.get_var_dict(dim_type.set)):
+        if name == iname:
+            others_only = others_only.eliminate(dt, idx, 1)
+        else:
+            iname_only = iname_only.eliminate(dt, idx, 1)
+
+    return not (iname_only & others_only).is_subset(domain)
+
+
+def check_innermost_sequential_iname(kernel, iname, inames):
+    """Raise a :exc:`loopy.diagnostic.LoopyError` unless *iname* is
+    sequential (i.e. untagged), its range does not depend on any of *inames*,
+    and all other non-parallel inames among *inames* are nested outside
+    of it by way of :func:`loopy.set_loop_priority`, so that the iterations
+    of *iname* immediately follow each other.
+    """
+
+    from loopy.kernel.data import ParallelTag
+
+    if kernel.iname_to_tag.get(iname) is not None:
+        raise LoopyError("'%s' is not a sequential iname" % iname)
+
+    other_inames = frozenset(inames) - frozenset([iname])
+
+    for other_iname in other_inames:
+        if isinstance(kernel.iname_to_tag.get(other_iname), ParallelTag):
+            continue
+
+        if not (other_iname in kernel.loop_priority
+                and iname in kernel.loop_priority
+                and kernel.loop_priority.index(other_iname)
+                < kernel.loop_priority.index(iname)):
+            raise LoopyError("iname '%s' is not known to be nested outside "
+                    "of '%s'" % (other_iname, iname))
+
+    if iname_range_depends_on(kernel, iname, other_inames):
+        raise LoopyError("bounds of '%s' depend on other inames" % iname)
+
+# }}}
+
+
 # vim: foldmethod=marker
@@ -52,6 +52,13 @@ class ReductionOperation(object):
     def __call__(self, dtype, operand1, operand2, inames):
         raise NotImplementedError
 
+    def combine(self, dtype, operand1, operand2, inames):
+        """Return an expression combining *operand1* and *operand2*, two
+        partial reduction results of type *dtype* (the result type of the
+        reduction). This is used when a reduction is carried out in parallel.
+        """
+        raise NotImplementedError
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
@@ -87,6 +94,9 @@ class ScalarReductionOperation(ReductionOperation):
 
         return arg_dtype
 
+    def combine(self, dtype, operand1, operand2, inames):
+        return self(dtype, operand1, operand2, inames)
+
     def __hash__(self):
         return hash((type(self), self.forced_result_type))
 
@@ -138,7 +148,6 @@ class MaxReductionOperation(ScalarReductionOperation):
 
 
 class MinReductionOperation(ScalarReductionOperation):
-    @property
     def neutral_element(self, dtype, inames):
         return get_le_neutral(dtype)
 
@@ -180,16 +189,23 @@ class _ArgExtremumReductionOperation(ReductionOperation):
         return ArgExtFunction(self, dtype, "update", inames)(
                 operand1, operand2, var(iname))
 
+    def combine(self, dtype, operand1, operand2, inames):
+        scalar_dtype = dtype.fields["value"][0]
+        return ArgExtFunction(self, scalar_dtype, "combine", inames)(
+                operand1, operand2)
+
 
 class ArgMaxReductionOperation(_ArgExtremumReductionOperation):
     which = "max"
     update_comparison = ">="
+    strict_comparison = ">"
     neutral_sign = -1
 
 
 class ArgMinReductionOperation(_ArgExtremumReductionOperation):
     which = "min"
     update_comparison = "<="
+    strict_comparison = "<"
     neutral_sign = +1
 
 
@@ -240,6 +256,17 @@ def get_argext_preamble(target, func_id):
         }
         else return state;
     }
+
+    inline %(type_name)s %(prefix)s_combine(
+        %(type_name)s state1, %(type_name)s state2)
+    {
+        // On ties, prefer the larger index, as the sequential update does.
+        if (state2.value %(strict_comp)s state1.value
+            || (state2.value == state1.value && state2.index > state1.index))
+            return state2;
+        else
+            return state1;
+    }
     """ % dict(
             type_name=prefix+"_result",
             scalar_type=target.dtype_to_typename(func_id.scalar_dtype),
@@ -247,11 +274,51 @@ def get_argext_preamble(target, func_id):
             neutral=c_code_mapper(
                 op.neutral_sign*get_le_neutral(func_id.scalar_dtype)),
             comp=op.update_comparison,
+            strict_comp=op.strict_comparison,
             ))
 
 # }}}
 
 
+# {{{ combining partial results
+
+class CombineReductionOperation(ReductionOperation):
+    """Reduces partial results of *inner_operation*, i.e. values that
+    are already of the result type of *inner_operation* applied to
+    arguments of type *inner_arg_dtype*, by way of
+    :meth:`ReductionOperation.combine`.
+    """
+
+    def __init__(self, inner_operation, inner_arg_dtype):
+        self.inner_operation = inner_operation
+        self.inner_arg_dtype = np.dtype(inner_arg_dtype)
+
+    def result_dtype(self, target, arg_dtype, inames):
+        return arg_dtype
+
+    def neutral_element(self, dtype, inames):
+        return self.inner_operation.neutral_element(self.inner_arg_dtype, inames)
+
+    def __call__(self, dtype, operand1, operand2, inames):
+        return self.inner_operation.combine(dtype, operand1, operand2, inames)
+
+    def combine(self, dtype, operand1, operand2, inames):
+        return self.inner_operation.combine(dtype, operand1, operand2, inames)
+
+    def __hash__(self):
+        return hash((type(self), self.inner_operation, self.inner_arg_dtype))
+
+    def __eq__(self, other):
+        return (type(self) == type(other)
+                and self.inner_operation == other.inner_operation
+                and self.inner_arg_dtype == other.inner_arg_dtype)
+
+    def __str__(self):
+        return "combine<%s, %s>" % (self.inner_operation, self.inner_arg_dtype)
+
+# }}}
+
+
 # {{{ reduction op registry
 
 _REDUCTION_OPS = {
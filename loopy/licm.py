@@ -0,0 +1,334 @@
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+from pymbolic import var
+
+from loopy.symbolic import IdentityMapper, get_dependencies
+from loopy.diagnostic import TypeInferenceFailure
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ invariant subexpression hoisting
+
+class _InvariantHoister(IdentityMapper):
+    """Replaces maximal subexpressions of an instruction's expression that
+    depend on a strict subset of the instruction's (sequential) inames and
+    only read variables that are not written anywhere in the kernel by
+    references to new temporaries. *hoist_func* is called with each such
+    subexpression and the set of inames on which it depends and returns
+    the replacement.
+    """
+
+    def __init__(self, kernel, insn_inames, hoist_func,
+            loop_nest_map, loop_priority_before):
+        self.kernel = kernel
+        self.insn_inames = insn_inames
+        self.hoist_func = hoist_func
+        self.loop_nest_map = loop_nest_map
+        self.loop_priority_before = loop_priority_before
+
+        self.all_inames = kernel.all_inames()
+        self.written_vars = kernel.get_written_variables()
+
+    # {{{ invariance analysis
+
+    def get_invariant_inames(self, expr):
+        """Return the set of inames *expr* depends on if *expr* may be
+        evaluated outside of some loop surrounding the instruction,
+        or *None* otherwise.
+        """
+        deps = get_dependencies(expr)
+
+        if deps & self.written_vars:
+            return None
+
+        inames = deps & self.all_inames
+        if not inames < self.insn_inames:
+            return None
+
+        return inames
+
+    def nests_inside(self, inner_iname, outer_iname):
+        return (outer_iname in self.loop_nest_map[inner_iname]
+                or outer_iname in self.loop_priority_before[inner_iname])
+
+    def is_worth_hoisting(self, expr, inames):
+        if not get_dependencies(expr):
+            # constant
+            return False
+
+        # Hardware-parallel loops (and vectorization) don't repeat work
+        # within a work item--nothing to be gained.
+        from loopy.kernel.data import (
+                HardwareParallelTag, VectorizeTag, ParallelTag)
+        left_loops = [
+                iname for iname in self.insn_inames - inames
+                if not isinstance(
+                    self.kernel.iname_to_tag.get(iname),
+                    (HardwareParallelTag, VectorizeTag))]
+
+        if not left_loops:
+            return False
+
+        # The temporary is a scalar, so the new instruction must run
+        # within the same iterations of the remaining loops as the
+        # instruction using it. Make sure the loops being left are nested
+        # inside all remaining ones.
+        kept_loops = [
+                iname for iname in inames
+                if not isinstance(
+                    self.kernel.iname_to_tag.get(iname), ParallelTag)]
+
+        return all(
+                self.nests_inside(left_iname, kept_iname)
+                for left_iname in left_loops
+                for kept_iname in kept_loops)
+
+    def try_hoist(self, expr):
+        inames = self.get_invariant_inames(expr)
+        if inames is None or not self.is_worth_hoisting(expr, inames):
+            return None
+
+        return self.hoist_func(expr, inames)
+
+    # }}}
+
+    def map_commutative(self, expr):
+        result = self.try_hoist(expr)
+        if result is not None:
+            return result
+
+        # Invariant operands may together form a hoistable subexpression
+        # even though the entire expression is not. Among the possible
+        # groupings, prefer ones that include more operands, then ones
+        # that leave more loops.
+
+        def flatten(expr_type, children):
+            for child in children:
+                if type(child) is expr_type:
+                    for subchild in flatten(expr_type, child.children):
+                        yield subchild
+                else:
+                    yield child
+
+        expr = type(expr)(tuple(flatten(type(expr), expr.children)))
+
+        child_inames = [
+                self.get_invariant_inames(child) for child in expr.children]
+
+        best_group = None
+        best_score = None
+        for candidate_inames in set(
+                frozenset(inames) for inames in child_inames
+                if inames is not None):
+            group = [
+                    i for i, inames in enumerate(child_inames)
+                    if inames is not None and inames <= candidate_inames]
+            nonconstant_count = sum(
+                    1 for i in group if get_dependencies(expr.children[i]))
+
+            if len(group) < 2 or not nonconstant_count:
+                continue
+
+            if not self.is_worth_hoisting(
+                    type(expr)(tuple(expr.children[i] for i in group)),
+                    candidate_inames):
+                continue
+
+            score = (
+                    nonconstant_count,
+                    -len(candidate_inames),
+                    sorted(candidate_inames))
+
+            if best_score is None or score > best_score:
+                best_group = group
+                best_score = score
+
+        if best_group is not None:
+            hoisted = self.try_hoist(type(expr)(tuple(
+                expr.children[i] for i in best_group)))
+            if hoisted is not None:
+                return type(expr)((hoisted,) + tuple(
+                    self.rec(child)
+                    for i, child in enumerate(expr.children)
+                    if i not in best_group))
+
+        return type(expr)(tuple(self.rec(child) for child in expr.children))
+
+    map_sum = map_commutative
+    map_product = map_commutative
+
+    def map_compound(self, expr):
+        result = self.try_hoist(expr)
+        if result is not None:
+            return result
+
+        return getattr(IdentityMapper, expr.mapper_method)(self, expr)
+
+    map_quotient = map_compound
+    map_floor_div = map_compound
+    map_remainder = map_compound
+    map_power = map_compound
+    map_call = map_compound
+    map_comparison = map_compound
+    map_logical_not = map_compound
+    map_bitwise_not = map_compound
+    map_bitwise_or = map_compound
+    map_bitwise_and = map_compound
+    map_bitwise_xor = map_compound
+    map_left_shift = map_compound
+    map_right_shift = map_compound
+
+    def map_guarded(self, expr):
+        # Parts of expressions that are only conditionally evaluated may
+        # be protected (e.g. against out-of-bounds access) by the condition.
+        # Only hoist them along with the condition.
+
+        result = self.try_hoist(expr)
+        if result is not None:
+            return result
+
+        return expr
+
+    map_if = map_guarded
+    map_if_positive = map_guarded
+    map_logical_and = map_guarded
+    map_logical_or = map_guarded
+
+    # Array accesses themselves are not worth a temporary, and index
+    # expressions are left alone.
+    def map_subscript(self, expr):
+        return expr
+
+    map_linear_subscript = map_subscript
+
+
+def hoist_loop_invariants(kernel):
+    """Move subexpressions of instructions that do not depend on some
+    of the loops around the instruction into new instructions that
+    compute them into private temporaries outside of those loops. Only
+    subexpressions that read no variables written by any instruction of
+    the kernel are considered, and operands of sums and products may be
+    regrouped in the process.
+
+    This is applied by :func:`loopy.preprocess_kernel` (after reductions
+    have been realized) if :attr:`loopy.Options.hoist_invariants` is set.
+    """
+
+    logger.debug("%s: hoist loop invariants" % kernel.name)
+
+    from loopy.kernel.data import (
+            ExpressionInstruction, TemporaryVariable)
+    from loopy.expression import TypeInferenceMapper
+
+    type_inf_mapper = TypeInferenceMapper(kernel)
+
+    from loopy.schedule import loop_nest_map
+    nest_map = loop_nest_map(kernel)
+
+    loop_priority_before = dict(
+            (iname, frozenset(kernel.loop_priority[:kernel.loop_priority.index(
+                iname)]) if iname in kernel.loop_priority else frozenset())
+            for iname in kernel.all_inames())
+
+    var_name_gen = kernel.get_var_name_generator()
+    new_temporary_variables = kernel.temporary_variables.copy()
+    new_insns = []
+    new_insn_ids = set()
+
+    for insn in kernel.instructions:
+        if (not isinstance(insn, ExpressionInstruction)
+                or insn.predicates):
+            new_insns.append(insn)
+            continue
+
+        hoisted_insns = []
+        hoisted_temps = {}
+
+        def hoist(expr, inames):
+            key = (expr, frozenset(inames))
+            try:
+                return var(hoisted_temps[key])
+            except KeyError:
+                pass
+
+            try:
+                dtype = type_inf_mapper(expr)
+            except TypeInferenceFailure:
+                return None
+
+            temp_name = var_name_gen(insn.id + "_invariant")
+            new_temporary_variables[temp_name] = TemporaryVariable(
+                    name=temp_name,
+                    shape=(),
+                    dtype=dtype,
+                    is_local=False)
+
+            hoisted_insn_id = kernel.make_unique_instruction_id(
+                    based_on=temp_name, extra_used_ids=new_insn_ids)
+            new_insn_ids.add(hoisted_insn_id)
+
+            hoisted_insns.append(ExpressionInstruction(
+                    id=hoisted_insn_id,
+                    assignee=var(temp_name),
+                    expression=expr,
+                    forced_iname_deps=frozenset(inames),
+                    insn_deps=frozenset()))
+
+            hoisted_temps[key] = temp_name
+            return var(temp_name)
+
+        hoister = _InvariantHoister(kernel, kernel.insn_inames(insn), hoist,
+                nest_map, loop_priority_before)
+        new_expression = hoister(insn.expression)
+
+        if not hoisted_insns:
+            new_insns.append(insn)
+            continue
+
+        new_insns.extend(hoisted_insns)
+        new_insns.append(insn.copy(
+            expression=new_expression,
+            forced_iname_deps=(
+                insn.forced_iname_deps | kernel.insn_inames(insn)),
+            insn_deps=(
+                (insn.insn_deps or frozenset())
+                | frozenset(hoisted_insn.id for hoisted_insn in hoisted_insns))))
+
+        logger.debug("%s: hoisted from '%s': %s" % (
+            kernel.name, insn.id,
+            ", ".join(str(hoisted_insn.expression)
+                for hoisted_insn in hoisted_insns)))
+
+    return kernel.copy(
+            instructions=new_insns,
+            temporary_variables=new_temporary_variables)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -51,6 +51,73 @@ class Options(Record):
         Like :attr:`trace_assignments`, but also trace the
         assigned values.
 
+    .. attribute:: hoist_invariants
+
+        Move subexpressions that do not depend on some of the loops
+        surrounding an instruction out of these loops, into private
+        temporaries. See :func:`loopy.licm.hoist_loop_invariants`.
+
+    .. attribute:: strength_reduce_indices
+
+        Maintain the parts of linearized array subscripts that only
+        depend on a sequential loop and the code surrounding it in
+        integer variables that are set up upon loop entry and incremented
+        along with the loop, rather than recomputing the full subscript
+        in every access. Array accesses sharing such a part share the
+        variable.
+
+    .. attribute:: use_vload_vstore
+
+        When vectorizing along an iname (see
+        :class:`loopy.kernel.data.VectorizeTag`), implement accesses to
+        scalar-typed arrays that are contiguous along that iname using
+        OpenCL's ``vloadn``/``vstoren``, rather than requiring a
+        vector-typed axis (see :class:`loopy.kernel.array.VectorArrayDimTag`).
+        If the offset of the first vector entry is known to be a multiple
+        of the vector length (based on strides and offsets), it is passed
+        as the vector offset, otherwise pointer arithmetic is used.
+
+    .. attribute:: share_temporary_storage
+
+        Let local (and private) array temporaries whose lifetimes in the
+        schedule do not overlap share storage, reducing the amount of
+        local memory a kernel requires. See
+        :func:`loopy.storage.share_temporary_storage`.
+
+    .. attribute:: auto_local_size
+
+        A tuple of work group sizes (axis 0 first) to use for inames
+        tagged ``l.auto`` (see :class:`loopy.kernel.data.AutoFitLocalIndexTag`)
+        in kernels without other local axes, or an integer for just axis 0.
+        If *None* (the default), sizes are chosen based on device limits
+        and the kernel's resource use, see
+        :func:`loopy.preprocess.choose_auto_local_size`. See also
+        :func:`loopy.tune_auto_local_size`.
+
+    .. attribute:: domain_check
+
+        How thoroughly to verify after code generation that the
+        generated code executes each instruction for exactly the
+        points of its domain. One of
+
+        * ``"full"`` (or *None*, the default): check every instruction.
+        * ``"sampled"``: check a random subset of
+          :attr:`domain_check_sample_size` instructions.
+        * ``"off"``: do not check.
+
+        Checking is a debugging aid and can take up a sizable share
+        of code generation time.
+
+    .. attribute:: domain_check_sample_size
+
+        The number of instructions to check if :attr:`domain_check`
+        is ``"sampled"``. Defaults to 10 if *None*.
+
+    .. attribute:: domain_check_processes
+
+        If not *None*, the number of worker processes across which
+        the instructions to be checked are spread.
+
     .. rubric:: Invocation-related options
 
     .. attribute:: skip_arg_checks
@@ -119,6 +186,11 @@ class Options(Record):
             annotate_inames=False,
             trace_assignments=False,
             trace_assignment_values=False,
+            hoist_invariants=False, strength_reduce_indices=False,
+            use_vload_vstore=False, share_temporary_storage=False,
+            auto_local_size=None,
+            domain_check=None, domain_check_sample_size=None,
+            domain_check_processes=None,
 
             skip_arg_checks=False, no_numpy=False, return_dict=False,
             write_wrapper=False, highlight_wrapper=False,
@@ -131,6 +203,14 @@ class Options(Record):
                 annotate_inames=annotate_inames,
                 trace_assignments=trace_assignments,
                 trace_assignment_values=trace_assignment_values,
+                hoist_invariants=hoist_invariants,
+                strength_reduce_indices=strength_reduce_indices,
+                use_vload_vstore=use_vload_vstore,
+                share_temporary_storage=share_temporary_storage,
+                auto_local_size=auto_local_size,
+                domain_check=domain_check,
+                domain_check_sample_size=domain_check_sample_size,
+                domain_check_processes=domain_check_processes,
 
                 skip_arg_checks=skip_arg_checks, no_numpy=no_numpy,
                 return_dict=return_dict,
@@ -34,6 +34,8 @@ from pymbolic.mapper.substitutor import make_subst_func
 import numpy as np
 
 from pymbolic import var
+from pymbolic.primitives import Remainder
+from pytools import Record
 
 from loopy.array_buffer_map import (ArrayToBufferMap, NoOpArrayToBufferMap,
         AccessDescriptor)
@@ -136,7 +138,7 @@ class RuleInvocationReplacer(RuleAwareIdentityMapper):
             access_descriptors, array_base_map,
             storage_axis_names, storage_axis_sources,
             non1_storage_axis_names,
-            temporary_name):
+            temporary_name, rolling_axis=None):
         super(RuleInvocationReplacer, self).__init__(rule_mapping_context)
 
         self.subst_name = subst_name
@@ -151,6 +153,7 @@ class RuleInvocationReplacer(RuleAwareIdentityMapper):
         self.non1_storage_axis_names = non1_storage_axis_names
 
         self.temporary_name = temporary_name
+        self.rolling_axis = rolling_axis
 
     def map_substitution(self, name, tag, arguments, expn_state):
         if not (
@@ -200,7 +203,15 @@ class RuleInvocationReplacer(RuleAwareIdentityMapper):
                 ax_index = var(sax_source)
 
             from loopy.isl_helpers import simplify_via_aff
-            ax_index = simplify_via_aff(ax_index - sax_base_idx)
+            if (self.rolling_axis is not None
+                    and sax_name == self.rolling_axis.name):
+                ax_index = Remainder(
+                        simplify_via_aff(
+                            ax_index - self.rolling_axis.first_base_index),
+                        self.rolling_axis.length)
+            else:
+                ax_index = simplify_via_aff(ax_index - sax_base_idx)
+
             stor_subscript.append(ax_index)
 
         new_outer_expr = var(self.temporary_name)
@@ -216,11 +227,214 @@ class RuleInvocationReplacer(RuleAwareIdentityMapper):
 # }}}
 
 
+# {{{ rolling buffers
+
+class RollingAxisInfo(Record):
+    """
+    .. attribute:: name
+
+        The name of the storage axis along which the footprint moves.
+
+    .. attribute:: stride
+
+        The (positive, integer) distance by which the footprint moves along
+        the storage axis per iteration of the rolling iname.
+
+    .. attribute:: length
+
+        The length of the storage axis.
+
+    .. attribute:: first_iteration
+
+        The value of the rolling iname in its first iteration.
+
+    .. attribute:: first_base_index
+
+        The base index of the storage axis in the first iteration of the
+        rolling iname.
+    """
+
+
+def find_rolling_axis(kernel, rolling_iname, storage_axis_names,
+        non1_storage_axis_names, abm):
+    from loopy.symbolic import CoefficientCollector
+    from loopy.isl_helpers import static_max_of_pw_aff, simplify_via_aff
+    from loopy.symbolic import pw_aff_to_expr
+    from loopy.tools import is_integer
+
+    axis_lengths = dict(zip(non1_storage_axis_names, abm.non1_storage_shape))
+
+    rolling_axes = [
+            (saxis, base_index)
+            for saxis, base_index in zip(
+                storage_axis_names, abm.storage_base_indices)
+            if saxis in axis_lengths
+            and rolling_iname in get_dependencies(base_index)]
+
+    if not rolling_axes:
+        raise LoopyError("footprint does not move along with rolling "
+                "iname '%s'" % rolling_iname)
+    if len(rolling_axes) > 1:
+        raise LoopyError("footprint moves along more than one storage axis "
+                "with rolling iname '%s'" % rolling_iname)
+
+    (saxis, base_index), = rolling_axes
+    length = axis_lengths[saxis]
+
+    try:
+        coeffs = CoefficientCollector([rolling_iname])(base_index)
+    except (RuntimeError, NotImplementedError):
+        coeffs = {}
+
+    stride = coeffs.get(var(rolling_iname), 0)
+    if not (is_integer(stride) and stride
+            and rolling_iname not in get_dependencies(coeffs.get(1, 0))):
+        raise LoopyError("footprint does not move by a constant stride along "
+                "with rolling iname '%s'" % rolling_iname)
+
+    if not is_integer(length):
+        raise LoopyError("footprint length along storage axis '%s' is not "
+                "constant" % saxis)
+
+    if not 0 < stride < length:
+        raise LoopyError("consecutive footprints along rolling iname '%s' "
+                "do not overlap" % rolling_iname)
+
+    bounds = kernel.get_iname_bounds(rolling_iname)
+    first_iteration = pw_aff_to_expr(static_max_of_pw_aff(
+        bounds.lower_bound_pw_aff, constants_only=False))
+
+    from pymbolic import substitute
+    return RollingAxisInfo(
+            name=saxis,
+            stride=stride,
+            length=length,
+            first_iteration=first_iteration,
+            first_base_index=simplify_via_aff(substitute(
+                base_index, {var(rolling_iname): first_iteration})))
+
+
+def make_precompute_rolling(kernel, insn_id, temporary_name, rolling_iname,
+        rolling_axis, storage_inames, storage_shape, iname_to_tag):
+    """Restrict the compute instruction *insn_id* (as created by
+    :func:`precompute`) to the part of the footprint that was not
+    present in the previous iteration of *rolling_iname*, and add an
+    instruction that fills the entire buffer ahead of the loop over
+    *rolling_iname*.
+
+    :returns: a tuple of the new kernel and *iname_to_tag*, updated with
+        tags for the inames of the new instruction.
+    """
+
+    compute_insn = kernel.id_to_insn[insn_id]
+    fetch_inames = kernel.insn_inames(compute_insn)
+
+    if rolling_iname not in fetch_inames:
+        raise LoopyError("precompute is not nested inside rolling "
+                "iname '%s'" % rolling_iname)
+
+    from loopy.kernel.tools import check_innermost_sequential_iname
+    check_innermost_sequential_iname(kernel, rolling_iname,
+            fetch_inames - frozenset(storage_inames))
+
+    # {{{ check that the footprint is a box
+
+    domain = (kernel.get_inames_domain(fetch_inames)
+            .project_out_except(fetch_inames, [isl.dim_type.set]))
+
+    box = domain
+    for iname, length in zip(storage_inames, storage_shape):
+        dt, idx = box.get_var_dict()[iname]
+        box = (box
+                .eliminate(dt, idx, 1)
+                .add_constraint(isl.Constraint.ineq_from_names(
+                    box.space, {iname: 1}))
+                .add_constraint(isl.Constraint.ineq_from_names(
+                    box.space, {iname: -1, 1: length-1})))
+
+    if not box.is_subset(domain):
+        raise LoopyError("rolling buffers require a box-shaped footprint "
+                "(see fetch_bounding_box)")
+
+    # }}}
+
+    # {{{ only compute the new slice inside the loop
+
+    new_domains = kernel.domains[:]
+    home_domain_index = kernel.get_home_domain_index(rolling_axis.name)
+    home_domain = new_domains[home_domain_index]
+    new_domains[home_domain_index] = home_domain.add_constraint(
+            isl.Constraint.ineq_from_names(home_domain.space, {
+                rolling_axis.name: 1,
+                1: -(rolling_axis.length - rolling_axis.stride)}))
+
+    # }}}
+
+    # {{{ fill entire buffer ahead of the loop
+
+    var_name_gen = kernel.get_var_name_generator()
+    init_inames = [var_name_gen(iname + "_init") for iname in storage_inames]
+
+    new_domains.append(isl.BasicSet.read_from_str(kernel.isl_context,
+        "{[%s]: %s}" % (
+            ", ".join(init_inames),
+            " and ".join(
+                "0 <= %s < %d" % (iname, length)
+                for iname, length in zip(init_inames, storage_shape)))))
+
+    iname_to_tag = iname_to_tag.copy()
+    for iname, init_iname in zip(storage_inames, init_inames):
+        if iname in iname_to_tag:
+            iname_to_tag[init_iname] = iname_to_tag[iname]
+
+    from loopy.symbolic import SubstitutionMapper
+    subst_dict = dict(
+            (iname, var(init_iname))
+            for iname, init_iname in zip(storage_inames, init_inames))
+    subst_dict[rolling_iname] = rolling_axis.first_iteration
+
+    from loopy.kernel.data import ExpressionInstruction
+    init_insn = ExpressionInstruction(
+            id=kernel.make_unique_instruction_id(based_on=insn_id + "_init"),
+            assignee=var(temporary_name).index(
+                tuple(var(iname) for iname in init_inames)),
+            expression=SubstitutionMapper(make_subst_func(subst_dict))(
+                compute_insn.expression),
+            insn_deps=compute_insn.insn_deps,
+            forced_iname_deps=(
+                compute_insn.forced_iname_deps
+                - frozenset(storage_inames) - frozenset([rolling_iname])))
+
+    # }}}
+
+    new_insns = [init_insn]
+    for insn in kernel.instructions:
+        if insn.id == insn_id:
+            insn = insn.copy(
+                    insn_deps=(
+                        (insn.insn_deps or frozenset())
+                        | frozenset([init_insn.id])))
+
+        elif temporary_name in insn.read_dependency_names():
+            insn = insn.copy(
+                    insn_deps=(
+                        (insn.insn_deps or frozenset())
+                        | frozenset([init_insn.id, insn_id])))
+
+        new_insns.append(insn)
+
+    return (
+            kernel.copy(instructions=new_insns, domains=new_domains),
+            iname_to_tag)
+
+# }}}
+
+
 def precompute(kernel, subst_use, sweep_inames=[], within=None,
         storage_axes=None, temporary_name=None, precompute_inames=None,
         storage_axis_to_tag={}, default_tag="l.auto", dtype=None,
         fetch_bounding_box=False, temporary_is_local=None,
-        insn_id=None):
+        insn_id=None, rolling_iname=None):
     """Precompute the expression described in the substitution rule determined by
     *subst_use* and store it in a temporary array. A precomputation needs two
     things to operate, a list of *sweep_inames* (order irrelevant) and an
@@ -281,6 +495,17 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
         created. If they do already exist, their loop domain is verified
         against the one required for this precomputation.
     :arg insn_id: The ID of the instruction performing the precomputation.
+    :arg rolling_iname: If not *None*, the name of a sequential iname
+        enclosing the precomputation along which the footprint moves by a
+        constant stride along one of the storage axes. The storage is then
+        used as a rolling buffer indexed modulo its length along that axis,
+        and each iteration of *rolling_iname* only computes the part of the
+        footprint that was not present in the previous iteration. The entire
+        buffer is initially filled by an additional instruction ahead of the
+        loop over *rolling_iname*, whose inames are named after the storage
+        axes with an ``_init`` suffix. Requires a box-shaped footprint and
+        that any other sequential inames around the precomputation be nested
+        outside of *rolling_iname*.
 
     If `storage_axes` is not specified, it defaults to the arrangement
     `<direct sweep axes><arguments>` with the direct sweep axes being the
@@ -303,6 +528,9 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
     sweep_inames = list(sweep_inames)
     sweep_inames_set = frozenset(sweep_inames)
 
+    if rolling_iname in sweep_inames_set:
+        raise LoopyError("rolling iname '%s' may not be swept" % rolling_iname)
+
     if isinstance(storage_axes, str):
         storage_axes = [ax.strip() for ax in storage_axes.split(",")]
 
@@ -545,6 +773,12 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
                             "having length 1 but also mapped to existing "
                             "iname '%s'" % (i+1, saxis))
 
+        if rolling_iname is not None:
+            rolling_axis = find_rolling_axis(kernel, rolling_iname,
+                    storage_axis_names, non1_storage_axis_names, abm)
+        else:
+            rolling_axis = None
+
         mod_domain = domch.domain
 
         # {{{ modify the domain, taking into account preexisting inames
@@ -646,6 +880,11 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
         non1_storage_axis_names = []
         abm = NoOpArrayToBufferMap()
 
+        if rolling_iname is not None:
+            raise LoopyError("rolling buffers require storage axes")
+
+        rolling_axis = None
+
     kernel = kernel.copy(domains=new_kernel_domains)
 
     # {{{ set up compute insn
@@ -656,8 +895,18 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
     assignee = var(temporary_name)
 
     if non1_storage_axis_names:
-        assignee = assignee.index(
-                tuple(var(iname) for iname in non1_storage_axis_names))
+        assignee_index = []
+        for iname in non1_storage_axis_names:
+            if rolling_axis is not None and iname == rolling_axis.name:
+                from loopy.isl_helpers import simplify_via_aff
+                assignee_index.append(Remainder(
+                    simplify_via_aff(var(iname) + rolling_axis.stride*(
+                        var(rolling_iname) - rolling_axis.first_iteration)),
+                    rolling_axis.length))
+            else:
+                assignee_index.append(var(iname))
+
+        assignee = assignee.index(tuple(assignee_index))
 
     # {{{ process substitutions on compute instruction
 
@@ -703,7 +952,7 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
             access_descriptors, abm,
             storage_axis_names, storage_axis_sources,
             non1_storage_axis_names,
-            temporary_name)
+            temporary_name, rolling_axis)
 
     kernel = invr.map_kernel(kernel)
     kernel = kernel.copy(
@@ -794,6 +1043,12 @@ def precompute(kernel, subst_use, sweep_inames=[], within=None,
 
     # }}}
 
+    if rolling_axis is not None:
+        kernel, new_iname_to_tag = make_precompute_rolling(
+                kernel, insn_id, temporary_name, rolling_iname, rolling_axis,
+                non1_storage_axis_names, abm.non1_storage_shape,
+                new_iname_to_tag)
+
     from loopy import tag_inames
     return tag_inames(kernel, new_iname_to_tag)
 
@@ -24,7 +24,6 @@ THE SOFTWARE.
 
 
 import six
-import numpy as np
 from loopy.diagnostic import (
         LoopyError, WriteRaceConditionWarning, warn,
         LoopyAdvisory, DependencyTypeInferenceFailure)
@@ -392,11 +391,21 @@ def realize_reduction(kernel, insn_id_filter=None):
 
     If *insn_id_filter* is not given, all reductions in all instructions will
     be realized.
+
+    Reductions over a single iname with a :class:`loopy.LocalIndexTag` are
+    carried out as a tree reduction in local memory. The result of such a
+    reduction is only available to the first work item along the local axis,
+    which is the one that executes the instruction containing the reduction.
+
+    Reductions that amount to a scan (see :ref:`tags`) are realized without
+    recomputing the reduction for each value of the sweep iname.
     """
 
     logger.debug("%s: realize reduction" % kernel.name)
 
     new_insns = []
+    new_domains = kernel.domains[:]
+    new_iname_to_tag = kernel.iname_to_tag.copy()
 
     var_name_gen = kernel.get_var_name_generator()
     new_temporary_variables = kernel.temporary_variables.copy()
@@ -404,21 +413,21 @@ def realize_reduction(kernel, insn_id_filter=None):
     from loopy.expression import TypeInferenceMapper
     type_inf_mapper = TypeInferenceMapper(kernel)
 
-    def map_reduction(expr, rec):
-        # Only expand one level of reduction at a time, going from outermost to
-        # innermost. Otherwise we get the (iname + insn) dependencies wrong.
+    def get_insn_id(based_on):
+        return temp_kernel.make_unique_instruction_id(
+                based_on=based_on,
+                extra_used_ids=set(i.id for i in generated_insns))
+
+    # {{{ sequential
+
+    def map_reduction_seq(expr, rec, arg_dtype):
+        outer_insn_inames = temp_kernel.insn_inames(insn)
 
         from pymbolic import var
 
         target_var_name = var_name_gen("acc_"+"_".join(expr.inames))
         target_var = var(target_var_name)
 
-        try:
-            arg_dtype = type_inf_mapper(expr.expr)
-        except DependencyTypeInferenceFailure:
-            raise LoopyError("failed to determine type of accumulator for "
-                    "reduction '%s'" % expr)
-
         from loopy.kernel.data import ExpressionInstruction, TemporaryVariable
 
         new_temporary_variables[target_var_name] = TemporaryVariable(
@@ -428,18 +437,8 @@ def realize_reduction(kernel, insn_id_filter=None):
                     kernel.target, arg_dtype, expr.inames),
                 is_local=False)
 
-        outer_insn_inames = temp_kernel.insn_inames(insn)
-        bad_inames = frozenset(expr.inames) & outer_insn_inames
-        if bad_inames:
-            raise LoopyError("reduction used within loop(s) that it was "
-                    "supposed to reduce over: " + ", ".join(bad_inames))
-
-        init_id = temp_kernel.make_unique_instruction_id(
-                based_on="%s_%s_init" % (insn.id, "_".join(expr.inames)),
-                extra_used_ids=set(i.id for i in generated_insns))
-
         init_insn = ExpressionInstruction(
-                id=init_id,
+                id=get_insn_id("%s_%s_init" % (insn.id, "_".join(expr.inames))),
                 assignee=target_var,
                 forced_iname_deps=outer_insn_inames - frozenset(expr.inames),
                 insn_deps=frozenset(),
@@ -447,17 +446,14 @@ def realize_reduction(kernel, insn_id_filter=None):
 
         generated_insns.append(init_insn)
 
-        update_id = temp_kernel.make_unique_instruction_id(
-                based_on="%s_%s_update" % (insn.id, "_".join(expr.inames)),
-                extra_used_ids=set(i.id for i in generated_insns))
-
         reduction_insn = ExpressionInstruction(
-                id=update_id,
+                id=get_insn_id(
+                    "%s_%s_update" % (insn.id, "_".join(expr.inames))),
                 assignee=target_var,
                 expression=expr.operation(
                     arg_dtype, target_var, expr.expr, expr.inames),
                 insn_deps=frozenset([init_insn.id]) | insn.insn_deps,
-                forced_iname_deps=temp_kernel.insn_inames(insn) | set(expr.inames))
+                forced_iname_deps=outer_insn_inames | frozenset(expr.inames))
 
         generated_insns.append(reduction_insn)
 
@@ -465,6 +461,534 @@ def realize_reduction(kernel, insn_id_filter=None):
 
         return target_var
 
+    # }}}
+
+    # {{{ local-parallel
+
+    def get_int_iname_size(iname):
+        import islpy as isl
+        from loopy.isl_helpers import static_value_of_pw_aff
+        from loopy.symbolic import aff_to_expr
+
+        try:
+            lower_bound = aff_to_expr(static_value_of_pw_aff(
+                    kernel.get_iname_bounds(
+                        iname, constants_only=True).lower_bound_pw_aff,
+                    constants_only=True))
+            size = kernel.get_constant_iname_length(iname)
+        except (ValueError, isl.Error):
+            lower_bound = None
+
+        if lower_bound != 0:
+            raise LoopyError("local-parallel reduction: iname '%s' must "
+                    "start at zero and have a constant length" % iname)
+
+        return size
+
+    def make_lane_iname(based_on, size, tag):
+        import islpy as isl
+
+        iname = var_name_gen(based_on)
+        new_domains.append(isl.BasicSet.read_from_str(kernel.isl_context,
+                "{[%(iname)s]: 0<=%(iname)s<%(size)d}"
+                % dict(iname=iname, size=size)))
+        new_iname_to_tag[iname] = tag
+        return iname
+
+    def map_reduction_local(expr, rec, arg_dtype, red_iname):
+        red_tag = kernel.iname_to_tag[red_iname]
+        seq_inames = tuple(iname for iname in expr.inames if iname != red_iname)
+
+        size = get_int_iname_size(red_iname)
+
+        outer_insn_inames = temp_kernel.insn_inames(insn)
+        base_iname_deps = outer_insn_inames - frozenset(expr.inames)
+
+        from loopy.kernel.data import LocalIndexTagBase
+        outer_local_inames = tuple(sorted(
+                iname
+                for iname in outer_insn_inames
+                if isinstance(kernel.iname_to_tag.get(iname), LocalIndexTagBase)))
+
+        from pymbolic import var
+        outer_local_iname_vars = tuple(
+                var(iname) for iname in outer_local_inames)
+        outer_local_iname_sizes = tuple(
+                get_int_iname_size(iname)
+                for iname in outer_local_inames)
+
+        result_dtype = expr.operation.result_dtype(
+                    kernel.target, arg_dtype, expr.inames)
+
+        acc_var_name = var_name_gen("acc_"+red_iname)
+        acc_var = var(acc_var_name)
+
+        from loopy.kernel.data import ExpressionInstruction, TemporaryVariable
+
+        new_temporary_variables[acc_var_name] = TemporaryVariable(
+                name=acc_var_name,
+                shape=outer_local_iname_sizes + (size,),
+                dtype=result_dtype,
+                is_local=True)
+
+        neutral = expr.operation.neutral_element(arg_dtype, expr.inames)
+
+        # {{{ initialize all lanes, including those red_iname may not reach
+
+        base_exec_iname = make_lane_iname("red_"+red_iname, size, red_tag)
+
+        init_insn = ExpressionInstruction(
+                id=get_insn_id("%s_%s_init" % (insn.id, red_iname)),
+                assignee=acc_var[
+                    outer_local_iname_vars + (var(base_exec_iname),)],
+                forced_iname_deps=base_iname_deps | frozenset([base_exec_iname]),
+                insn_deps=frozenset(),
+                expression=neutral)
+
+        generated_insns.append(init_insn)
+
+        # }}}
+
+        # Each lane first reduces over the remaining (sequential) inames on
+        # its own. The nested reduction is realized once this instruction
+        # comes back around in the queue.
+        if seq_inames:
+            from loopy.symbolic import Reduction
+            transfer_expr = Reduction(expr.operation, seq_inames, expr.expr)
+        else:
+            transfer_expr = expr.operation(
+                    arg_dtype, neutral, expr.expr, expr.inames)
+
+        transfer_insn = ExpressionInstruction(
+                id=get_insn_id("%s_%s_transfer" % (insn.id, red_iname)),
+                assignee=acc_var[outer_local_iname_vars + (var(red_iname),)],
+                forced_iname_deps=base_iname_deps | frozenset([red_iname]),
+                insn_deps=frozenset([init_insn.id]) | insn.insn_deps,
+                expression=transfer_expr)
+
+        generated_insns.append(transfer_insn)
+
+        # {{{ tree stages
+
+        cur_size = 1
+        while cur_size < size:
+            cur_size *= 2
+
+        prev_id = transfer_insn.id
+        bound = size
+        last_exec_iname = base_exec_iname
+
+        istage = 0
+        while cur_size > 1:
+            new_size = cur_size // 2
+
+            stage_exec_iname = make_lane_iname(
+                    "red_%s_s%d" % (red_iname, istage), bound-new_size, red_tag)
+
+            stage_insn = ExpressionInstruction(
+                    id=get_insn_id("%s_%s_stage_%d"
+                        % (insn.id, red_iname, istage)),
+                    assignee=acc_var[
+                        outer_local_iname_vars + (var(stage_exec_iname),)],
+                    forced_iname_deps=(
+                        base_iname_deps | frozenset([stage_exec_iname])),
+                    insn_deps=frozenset([prev_id]),
+                    expression=expr.operation.combine(
+                        result_dtype,
+                        acc_var[
+                            outer_local_iname_vars + (var(stage_exec_iname),)],
+                        acc_var[
+                            outer_local_iname_vars
+                            + (var(stage_exec_iname) + new_size,)],
+                        expr.inames))
+
+            generated_insns.append(stage_insn)
+            prev_id = stage_insn.id
+            last_exec_iname = stage_exec_iname
+
+            cur_size = new_size
+            bound = cur_size
+            istage += 1
+
+        # }}}
+
+        new_insn_insn_deps.add(prev_id)
+
+        # The last stage leaves the result in the first lane. Execute the
+        # instruction using the result only there.
+        if size > 1:
+            new_insn_forced_inames.add(last_exec_iname)
+        else:
+            new_insn_forced_inames.add(base_exec_iname)
+
+        return acc_var[outer_local_iname_vars + (0,)]
+
+    # }}}
+
+    # {{{ scans
+
+    def get_scan_kind(sweep_iname, scan_iname):
+        """Return *"inclusive"* if the domain of *scan_iname* is
+        ``L <= scan_iname <= sweep_iname``, where *L* is the lower bound of
+        *sweep_iname*, *"exclusive"* if it is
+        ``L <= scan_iname < sweep_iname``, or *None* otherwise.
+
+        The domain is taken within that of the instruction, with the
+        instruction's other inames held fixed. These may not affect the
+        range of *sweep_iname*, and if *sweep_iname* is sequential, it must
+        be the innermost sequential loop around the instruction.
+        """
+
+        import islpy as isl
+        from islpy import dim_type
+        from loopy.isl_helpers import static_value_of_pw_aff
+        from loopy.symbolic import aff_to_expr, ineq_constraint_from_expr
+        from loopy.kernel.data import LocalIndexTag
+        from loopy.kernel.tools import (
+                iname_range_depends_on, check_innermost_sequential_iname)
+        from pymbolic import var
+
+        insn_inames = temp_kernel.insn_inames(insn)
+        other_inames = insn_inames - frozenset([sweep_iname])
+
+        if isinstance(kernel.iname_to_tag.get(sweep_iname), LocalIndexTag):
+            if iname_range_depends_on(temp_kernel, sweep_iname, other_inames):
+                return None
+        else:
+            try:
+                check_innermost_sequential_iname(
+                        temp_kernel, sweep_iname, insn_inames)
+            except LoopyError:
+                return None
+
+        all_inames = insn_inames | frozenset([scan_iname])
+        dom = (temp_kernel.get_inames_domain(all_inames)
+                .project_out_except(all_inames, [dim_type.set]))
+
+        if ((frozenset(dom.get_var_names(dim_type.param)) - other_inames)
+                & temp_kernel.all_inames()):
+            return None
+
+        for iname in other_inames:
+            _, idx = dom.get_var_dict(dim_type.set)[iname]
+            dom = dom.move_dims(
+                    dim_type.param, dom.dim(dim_type.param),
+                    dim_type.set, idx, 1)
+
+        sweep_dom = dom.project_out_except([sweep_iname], [dim_type.set])
+
+        _, sweep_idx = sweep_dom.get_var_dict()[sweep_iname]
+        try:
+            lower_bound = aff_to_expr(static_value_of_pw_aff(
+                    temp_kernel.cache_manager.dim_min(sweep_dom, sweep_idx)
+                    .coalesce(),
+                    constants_only=False))
+        except ValueError:
+            return None
+
+        sweep_dom = isl.align_spaces(sweep_dom, dom)
+        space = dom.get_space()
+
+        for kind, offset in [("inclusive", 0), ("exclusive", 1)]:
+            expected = (sweep_dom
+                    .add_constraint(ineq_constraint_from_expr(
+                        space, var(scan_iname) - lower_bound))
+                    .add_constraint(ineq_constraint_from_expr(
+                        space, var(sweep_iname) - offset - var(scan_iname))))
+
+            if expected.is_equal(dom):
+                return kind
+
+        return None
+
+    def get_scan_info(expr):
+        """Return a tuple *(sweep_iname, kind)* if *expr* is a scan that can
+        be realized as such, or *None* otherwise.
+        """
+
+        from loopy.kernel.data import ForceSequentialTag, LocalIndexTag
+        from loopy.symbolic import get_dependencies
+
+        if len(expr.inames) != 1:
+            return None
+
+        scan_iname, = expr.inames
+        expr_deps = get_dependencies(expr.expr)
+
+        for sweep_iname in sorted(temp_kernel.insn_inames(insn)):
+            if sweep_iname in expr_deps:
+                continue
+
+            sweep_tag = kernel.iname_to_tag.get(sweep_iname)
+            if isinstance(sweep_tag, LocalIndexTag):
+                try:
+                    get_int_iname_size(sweep_iname)
+                except LoopyError:
+                    continue
+            elif not (sweep_tag is None
+                    or isinstance(sweep_tag, ForceSequentialTag)):
+                continue
+
+            kind = get_scan_kind(sweep_iname, scan_iname)
+            if kind is not None:
+                return sweep_iname, kind
+
+        return None
+
+    def get_scan_update(expr, arg_dtype, sweep_iname, operand1):
+        # Update *operand1* with the element at *sweep_iname*.
+        from loopy.symbolic import SubstitutionMapper
+        from pymbolic.mapper.substitutor import make_subst_func
+        from pymbolic import var
+
+        scan_iname, = expr.inames
+        return SubstitutionMapper(
+                make_subst_func({scan_iname: var(sweep_iname)}))(
+                    expr.operation(
+                        arg_dtype, operand1, expr.expr, expr.inames))
+
+    def map_scan_seq(expr, rec, arg_dtype, sweep_iname, kind):
+        outer_insn_inames = temp_kernel.insn_inames(insn)
+        scan_iname, = expr.inames
+
+        from pymbolic import var
+
+        acc_var_name = var_name_gen("acc_"+scan_iname)
+        acc_var = var(acc_var_name)
+
+        from loopy.kernel.data import ExpressionInstruction, TemporaryVariable
+
+        result_dtype = expr.operation.result_dtype(
+                kernel.target, arg_dtype, expr.inames)
+
+        new_temporary_variables[acc_var_name] = TemporaryVariable(
+                name=acc_var_name,
+                shape=(),
+                dtype=result_dtype,
+                is_local=False)
+
+        init_insn = ExpressionInstruction(
+                id=get_insn_id("%s_%s_init" % (insn.id, scan_iname)),
+                assignee=acc_var,
+                forced_iname_deps=outer_insn_inames - frozenset([sweep_iname]),
+                insn_deps=frozenset(),
+                expression=expr.operation.neutral_element(arg_dtype, expr.inames))
+
+        generated_insns.append(init_insn)
+
+        update_deps = frozenset([init_insn.id]) | insn.insn_deps
+        if kind == "exclusive":
+            # Update only after the running value has been used.
+            update_deps = update_deps | frozenset([insn.id])
+
+        update_insn = ExpressionInstruction(
+                id=get_insn_id("%s_%s_update" % (insn.id, scan_iname)),
+                assignee=acc_var,
+                expression=get_scan_update(
+                    expr, arg_dtype, sweep_iname, acc_var),
+                insn_deps=update_deps,
+                forced_iname_deps=outer_insn_inames)
+
+        generated_insns.append(update_insn)
+
+        if kind == "inclusive":
+            new_insn_insn_deps.add(update_insn.id)
+        else:
+            new_insn_insn_deps.add(init_insn.id)
+
+        return acc_var
+
+    def map_scan_local(expr, rec, arg_dtype, sweep_iname, kind):
+        sweep_tag = kernel.iname_to_tag[sweep_iname]
+        scan_iname, = expr.inames
+
+        size = get_int_iname_size(sweep_iname)
+
+        outer_insn_inames = temp_kernel.insn_inames(insn)
+        base_iname_deps = outer_insn_inames - frozenset([sweep_iname])
+
+        from loopy.kernel.data import LocalIndexTagBase
+        outer_local_inames = tuple(sorted(
+                iname
+                for iname in base_iname_deps
+                if isinstance(kernel.iname_to_tag.get(iname), LocalIndexTagBase)))
+
+        from pymbolic import var
+        outer_local_iname_vars = tuple(
+                var(iname) for iname in outer_local_inames)
+        outer_local_iname_sizes = tuple(
+                get_int_iname_size(iname)
+                for iname in outer_local_inames)
+
+        result_dtype = expr.operation.result_dtype(
+                kernel.target, arg_dtype, expr.inames)
+        neutral = expr.operation.neutral_element(arg_dtype, expr.inames)
+
+        def combine(operand1, operand2):
+            return expr.operation.combine(
+                    result_dtype, operand1, operand2, expr.inames)
+
+        npadded = 1
+        while npadded < size:
+            npadded *= 2
+
+        from loopy.kernel.data import ExpressionInstruction, TemporaryVariable
+
+        def make_temporary(based_on, shape, is_local):
+            name = var_name_gen(based_on)
+            new_temporary_variables[name] = TemporaryVariable(
+                    name=name,
+                    shape=shape,
+                    dtype=result_dtype,
+                    is_local=is_local)
+            return var(name)
+
+        acc_var = make_temporary("acc_"+scan_iname,
+                outer_local_iname_sizes + (npadded,), True)
+        elem_var = make_temporary("elem_"+scan_iname, (), False)
+        left_var = make_temporary("left_"+scan_iname, (), False)
+        right_var = make_temporary("right_"+scan_iname, (), False)
+
+        def acc(index):
+            return acc_var[outer_local_iname_vars + (index,)]
+
+        def add_insn(based_on, assignee, expression, exec_iname, deps):
+            new_insn = ExpressionInstruction(
+                    id=get_insn_id("%s_%s_%s" % (insn.id, scan_iname, based_on)),
+                    assignee=assignee,
+                    expression=expression,
+                    forced_iname_deps=base_iname_deps | frozenset([exec_iname]),
+                    insn_deps=frozenset(deps))
+            generated_insns.append(new_insn)
+            return new_insn.id
+
+        # {{{ load elements, pad to a power of two
+
+        elem_id = add_insn("elem", elem_var,
+                get_scan_update(expr, arg_dtype, sweep_iname, neutral),
+                sweep_iname, insn.insn_deps)
+
+        prev_ids = [add_insn("transfer", acc(var(sweep_iname)), elem_var,
+                sweep_iname, [elem_id])]
+
+        if npadded > size:
+            pad_iname = make_lane_iname(
+                    "scan_%s_pad" % scan_iname, npadded-size, sweep_tag)
+            prev_ids.append(add_insn("pad", acc(var(pad_iname) + size),
+                    neutral, pad_iname, []))
+
+        # }}}
+
+        # {{{ up-sweep
+
+        istage = 0
+        stride = 1
+        while stride < npadded:
+            stage_iname = make_lane_iname(
+                    "scan_%s_up%d" % (scan_iname, istage),
+                    npadded // (2*stride), sweep_tag)
+            base = 2*stride*var(stage_iname)
+
+            prev_ids = [add_insn("up_%d" % istage,
+                    acc(base + 2*stride-1),
+                    combine(acc(base + stride-1), acc(base + 2*stride-1)),
+                    stage_iname, prev_ids)]
+
+            stride *= 2
+            istage += 1
+
+        # }}}
+
+        # {{{ down-sweep
+
+        clear_iname = make_lane_iname("scan_%s_clear" % scan_iname, 1, sweep_tag)
+        prev_ids = [add_insn("clear", acc(npadded-1), neutral,
+                clear_iname, prev_ids)]
+
+        istage = 0
+        stride = npadded // 2
+        while stride >= 1:
+            stage_iname = make_lane_iname(
+                    "scan_%s_down%d" % (scan_iname, istage),
+                    npadded // (2*stride), sweep_tag)
+            base = 2*stride*var(stage_iname)
+
+            load_ids = [
+                    add_insn("down_%d_left" % istage, left_var,
+                        acc(base + stride-1), stage_iname, prev_ids),
+                    add_insn("down_%d_right" % istage, right_var,
+                        acc(base + 2*stride-1), stage_iname, prev_ids),
+                    ]
+            prev_ids = [
+                    add_insn("down_%d_store_left" % istage,
+                        acc(base + stride-1), right_var,
+                        stage_iname, load_ids),
+                    add_insn("down_%d_store_right" % istage,
+                        acc(base + 2*stride-1), combine(right_var, left_var),
+                        stage_iname, load_ids),
+                    ]
+
+            stride //= 2
+            istage += 1
+
+        # }}}
+
+        new_insn_insn_deps.update(prev_ids)
+
+        if kind == "inclusive":
+            new_insn_insn_deps.add(elem_id)
+            return combine(acc(var(sweep_iname)), elem_var)
+        else:
+            return acc(var(sweep_iname))
+
+    # }}}
+
+    def map_reduction(expr, rec):
+        # Only expand one level of reduction at a time, going from outermost to
+        # innermost. Otherwise we get the (iname + insn) dependencies wrong.
+
+        try:
+            arg_dtype = type_inf_mapper(expr.expr)
+        except DependencyTypeInferenceFailure:
+            raise LoopyError("failed to determine type of accumulator for "
+                    "reduction '%s'" % expr)
+
+        outer_insn_inames = temp_kernel.insn_inames(insn)
+        bad_inames = frozenset(expr.inames) & outer_insn_inames
+        if bad_inames:
+            raise LoopyError("reduction used within loop(s) that it was "
+                    "supposed to reduce over: " + ", ".join(bad_inames))
+
+        from loopy.kernel.data import LocalIndexTagBase, LocalIndexTag
+
+        scan_info = get_scan_info(expr)
+        if scan_info is not None:
+            sweep_iname, kind = scan_info
+            if isinstance(kernel.iname_to_tag.get(sweep_iname), LocalIndexTag):
+                return map_scan_local(expr, rec, arg_dtype, sweep_iname, kind)
+            else:
+                return map_scan_seq(expr, rec, arg_dtype, sweep_iname, kind)
+
+        local_par_inames = [
+                iname for iname in expr.inames
+                if isinstance(kernel.iname_to_tag.get(iname), LocalIndexTagBase)]
+
+        if not local_par_inames:
+            return map_reduction_seq(expr, rec, arg_dtype)
+
+        if len(local_par_inames) > 1:
+            raise LoopyError("reduction over more than one local-parallel "
+                    "iname ('%s') is not supported"
+                    % ", ".join(local_par_inames))
+
+        red_iname, = local_par_inames
+        if not isinstance(kernel.iname_to_tag[red_iname], LocalIndexTag):
+            raise LoopyError("reduction over automatically tagged local "
+                    "iname '%s' is not supported--assign an explicit "
+                    "local axis" % red_iname)
+
+        return map_reduction_local(expr, rec, arg_dtype, red_iname)
+
     from loopy.symbolic import ReductionCallbackMapper
     cb_mapper = ReductionCallbackMapper(map_reduction)
 
@@ -475,6 +999,7 @@ def realize_reduction(kernel, insn_id_filter=None):
     import loopy as lp
     while insn_queue:
         new_insn_insn_deps = set()
+        new_insn_forced_inames = set()
         generated_insns = []
 
         insn = insn_queue.pop(0)
@@ -495,7 +1020,8 @@ def realize_reduction(kernel, insn_id_filter=None):
                         expression=new_expression,
                         insn_deps=insn.insn_deps
                         | frozenset(new_insn_insn_deps),
-                        forced_iname_deps=temp_kernel.insn_inames(insn))
+                        forced_iname_deps=temp_kernel.insn_inames(insn)
+                        | frozenset(new_insn_forced_inames))
 
             insn_queue = generated_insns + [insn] + insn_queue
 
@@ -504,7 +1030,9 @@ def realize_reduction(kernel, insn_id_filter=None):
 
             temp_kernel = kernel.copy(
                     instructions=new_insns + insn_queue,
-                    temporary_variables=new_temporary_variables)
+                    temporary_variables=new_temporary_variables,
+                    domains=new_domains,
+                    iname_to_tag=new_iname_to_tag)
 
         else:
             # nothing happened, we're done with insn
@@ -514,7 +1042,9 @@ def realize_reduction(kernel, insn_id_filter=None):
 
     return kernel.copy(
             instructions=new_insns,
-            temporary_variables=new_temporary_variables)
+            temporary_variables=new_temporary_variables,
+            domains=new_domains,
+            iname_to_tag=new_iname_to_tag)
 
 # }}}
 
@@ -763,120 +1293,226 @@ def limit_boostability(kernel):
 # }}}
 
 
-# {{{ rank inames by stride
+# {{{ automatic local size
 
-def get_auto_axis_iname_ranking_by_stride(kernel, insn):
-    from loopy.kernel.data import ImageArg, ValueArg
+# Work group size aimed for in the absence of resource constraints
+PREFERRED_AUTO_WORK_GROUP_SIZE = 128
 
-    approximate_arg_values = {}
-    for arg in kernel.args:
-        if isinstance(arg, ValueArg):
-            if arg.approximately is not None:
-                approximate_arg_values[arg.name] = arg.approximately
-            else:
-                raise LoopyError("No approximate arg value specified for '%s'"
-                        % arg.name)
+# Number of work items that should be resident per compute unit to hide
+# memory latency
+TARGET_RESIDENT_WORK_ITEMS = 1024
 
-    # {{{ find all array accesses in insn
+# Bytes of private memory (i.e. registers) per compute unit. OpenCL does
+# not report this, so assume a typical value for GPUs.
+PRIVATE_MEM_PER_COMPUTE_UNIT = 256*1024
 
-    from loopy.symbolic import ArrayAccessFinder
-    ary_acc_exprs = list(ArrayAccessFinder()(insn.expression))
 
-    from pymbolic.primitives import Subscript
+def _get_constant_iname_length_or_none(kernel, iname):
+    import islpy as isl
+    try:
+        return kernel.get_constant_iname_length(iname)
+    except (isl.Error, ValueError):
+        return None
 
-    if isinstance(insn.assignee, Subscript):
-        ary_acc_exprs.append(insn.assignee)
 
-    # }}}
+def _get_auto_local_axis_count(kernel):
+    """Return the number of local axes that can be created for the inames
+    tagged ``l.auto`` in *kernel*, which is limited by the instruction with
+    the fewest such inames, since each instruction has to use all local
+    axes.
+    """
+
+    from loopy.kernel.data import AutoLocalIndexTagBase
+
+    result = None
+    for insn in kernel.instructions:
+        auto_iname_count = sum(
+                1 for iname in kernel.insn_inames(insn)
+                if isinstance(kernel.iname_to_tag.get(iname),
+                    AutoLocalIndexTagBase))
 
-    # {{{ filter array accesses to only the global ones
+        if result is None or auto_iname_count < result:
+            result = auto_iname_count
 
-    global_ary_acc_exprs = []
+    return min(result or 0, 3)
 
-    for aae in ary_acc_exprs:
-        ary_name = aae.aggregate.name
-        arg = kernel.arg_dict.get(ary_name)
-        if arg is None:
+
+def _get_private_mem_use(kernel):
+    import loopy as lp
+    from loopy.tools import is_integer
+    from pytools import product
+
+    result = 0
+    for tv in six.itervalues(kernel.temporary_variables):
+        if tv.is_local is True:
             continue
 
-        if isinstance(arg, ImageArg):
+        if (tv.dtype is None or tv.dtype is lp.auto
+                or not isinstance(tv.shape, tuple)):
+            # not yet known
             continue
 
-        global_ary_acc_exprs.append(aae)
+        size = product(tv.shape)
+        if is_integer(size):
+            result += size*tv.dtype.itemsize
+
+    return result
 
-    # }}}
 
-    # {{{ figure out automatic-axis inames
+def _predict_auto_axis_inames(kernel, axis_count):
+    """Return the inames that :func:`assign_automatic_axes` is expected to
+    map to the first *axis_count* newly created local axes.
+    """
 
     from loopy.kernel.data import AutoLocalIndexTagBase
-    auto_axis_inames = set(
-            iname
-            for iname in kernel.insn_inames(insn)
-            if isinstance(kernel.iname_to_tag.get(iname),
-                AutoLocalIndexTagBase))
+    from loopy.cost_model import get_auto_axis_iname_ranking
 
-    # }}}
+    for insn in kernel.instructions:
+        auto_axis_inames = [
+                iname
+                for iname in kernel.insn_inames(insn)
+                if isinstance(kernel.iname_to_tag.get(iname),
+                    AutoLocalIndexTagBase)]
+
+        if not auto_axis_inames:
+            continue
 
-    # {{{ figure out which iname should get mapped to local axis 0
+        ranking = get_auto_axis_iname_ranking(kernel, insn)
+        if ranking is None:
+            ranking = sorted(auto_axis_inames)
 
-    # maps inames to "aggregate stride"
-    aggregate_strides = {}
+        return ranking[:axis_count]
 
-    from loopy.symbolic import CoefficientCollector
-    from pymbolic.primitives import Variable
+    return []
 
-    for aae in global_ary_acc_exprs:
-        index_expr = aae.index
-        if not isinstance(index_expr, tuple):
-            index_expr = (index_expr,)
 
-        ary_name = aae.aggregate.name
-        arg = kernel.arg_dict.get(ary_name)
+def _distribute_local_size(kernel, work_group_size, axis_count, limits):
+    """Distribute the work items of a group of *work_group_size* among
+    *axis_count* axes, giving as many as useful (given the length of the
+    iname expected to be mapped to it) to axis 0, then axis 1, and so on.
+    """
 
-        if arg.dim_tags is None:
-            from warnings import warn
-            warn("Strides for '%s' are not known. Local axis assignment "
-                    "is likely suboptimal." % arg.name)
-            ary_strides = [1] * len(index_expr)
-        else:
-            ary_strides = []
-            from loopy.kernel.array import FixedStrideArrayDimTag
-            for dim_tag in arg.dim_tags:
-                if isinstance(dim_tag, FixedStrideArrayDimTag):
-                    ary_strides.append(dim_tag.stride)
+    axis_inames = _predict_auto_axis_inames(kernel, axis_count)
 
-        # {{{ construct iname_to_stride_expr
+    result = []
+    remaining = work_group_size
+    for axis in range(axis_count):
+        size = min(remaining, limits.max_work_item_sizes[axis])
 
-        iname_to_stride_expr = {}
-        for iexpr_i, stride in zip(index_expr, ary_strides):
-            if stride is None:
-                continue
-            coeffs = CoefficientCollector()(iexpr_i)
-            for var, coeff in six.iteritems(coeffs):
-                if (isinstance(var, Variable)
-                        and var.name in auto_axis_inames):
-                    # excludes '1', i.e.  the constant
-                    new_stride = coeff*stride
-                    old_stride = iname_to_stride_expr.get(var.name, None)
-                    if old_stride is None or new_stride < old_stride:
-                        iname_to_stride_expr[var.name] = new_stride
+        length = None
+        if axis < len(axis_inames):
+            length = _get_constant_iname_length_or_none(
+                    kernel, axis_inames[axis])
 
-        # }}}
+        if length is not None:
+            rounded_length = 1
+            while rounded_length < length:
+                rounded_length *= 2
 
-        from pymbolic import evaluate
-        for iname, stride_expr in six.iteritems(iname_to_stride_expr):
-            stride = evaluate(stride_expr, approximate_arg_values)
-            aggregate_strides[iname] = aggregate_strides.get(iname, 0) + stride
+            size = min(size, rounded_length)
 
-    if aggregate_strides:
-        very_large_stride = np.iinfo(np.int32).max
+        result.append(size)
+        remaining = max(1, remaining // size)
 
-        return sorted((iname for iname in kernel.insn_inames(insn)),
-                key=lambda iname: aggregate_strides.get(iname, very_large_stride))
-    else:
-        return None
+    return tuple(result)
 
-    # }}}
+
+def choose_auto_local_size(kernel, axis_count=None, device=None,
+        work_group_size=None):
+    """Return a tuple of work group sizes (axis 0 first) for the inames tagged
+    ``l.auto`` in *kernel*, to be used if it has no other local axes.
+
+    The work group size starts out at :data:`PREFERRED_AUTO_WORK_GROUP_SIZE`.
+    If the local memory used by each group (see
+    :meth:`loopy.LoopKernel.local_mem_use`) limits how many groups can be
+    resident on a compute unit, it is raised to keep
+    :data:`TARGET_RESIDENT_WORK_ITEMS` resident. If the private memory
+    used by each work item is large, it is lowered to make the work items
+    fit into :data:`PRIVATE_MEM_PER_COMPUTE_UNIT`. It is then limited by
+    the maximum work group size of *device* (or the device of *kernel*'s
+    target, if any) and rounded down to a power of two.
+
+    :arg axis_count: the number of local axes to create. Defaults to
+        as many as each instruction has inames tagged ``l.auto``, at most
+        three.
+    :arg work_group_size: if given, use this work group size instead of
+        choosing one.
+    """
+
+    if axis_count is None:
+        axis_count = _get_auto_local_axis_count(kernel)
+
+    from loopy.tiling import _get_device_limits, MAX_TILE_WORK_GROUP_SIZE
+    limits = _get_device_limits(kernel, device)
+
+    if work_group_size is None:
+        work_group_size = PREFERRED_AUTO_WORK_GROUP_SIZE
+
+        local_mem_use = kernel.local_mem_use()
+        if local_mem_use:
+            resident_groups = max(1,
+                    limits.usable_local_mem_size // local_mem_use)
+            work_group_size = max(work_group_size,
+                    TARGET_RESIDENT_WORK_ITEMS // resident_groups)
+
+        private_mem_use = _get_private_mem_use(kernel)
+        if private_mem_use:
+            work_group_size = min(work_group_size,
+                    PRIVATE_MEM_PER_COMPUTE_UNIT // private_mem_use)
+
+        work_group_size = min(work_group_size,
+                limits.max_work_group_size, MAX_TILE_WORK_GROUP_SIZE)
+
+    work_group_size = max(1, work_group_size)
+    rounded_work_group_size = 1
+    while 2*rounded_work_group_size <= work_group_size:
+        rounded_work_group_size *= 2
+
+    return _distribute_local_size(
+            kernel, rounded_work_group_size, axis_count, limits)
+
+
+def get_auto_local_size_candidates(kernel, device=None):
+    """Return a list of tuples of work group sizes to try for the inames
+    tagged ``l.auto`` in *kernel*, starting with the one chosen by
+    :func:`choose_auto_local_size`.
+    """
+
+    result = [choose_auto_local_size(kernel, device=device)]
+
+    from loopy.tiling import _get_device_limits
+    max_work_group_size = _get_device_limits(
+            kernel, device).max_work_group_size
+
+    work_group_size = 32
+    while work_group_size <= min(max_work_group_size, 512):
+        candidate = choose_auto_local_size(kernel, device=device,
+                work_group_size=work_group_size)
+        if candidate not in result:
+            result.append(candidate)
+
+        work_group_size *= 2
+
+    return result
+
+
+def _get_auto_local_size(kernel):
+    axis_count = _get_auto_local_axis_count(kernel)
+    if not axis_count:
+        return ()
+
+    auto_local_size = kernel.options.auto_local_size
+    if auto_local_size is None:
+        auto_local_size = choose_auto_local_size(kernel, axis_count)
+    elif isinstance(auto_local_size, int):
+        auto_local_size = (auto_local_size,)
+
+    auto_local_size = tuple(auto_local_size)[:axis_count]
+
+    logger.info("%s: local size for automatic axes: %s" % (
+        kernel.name, ", ".join(str(size) for size in auto_local_size)))
+
+    return auto_local_size
 
 # }}}
 
@@ -896,6 +1532,10 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
         _, local_size = kernel.get_grid_sizes_as_exprs(
                 ignore_auto=True)
 
+        if not local_size:
+            # No local axes to fit into--create them.
+            local_size = _get_auto_local_size(kernel)
+
     # {{{ axis assignment helper function
 
     def assign_axis(recursion_axis, iname, axis=None):
@@ -904,7 +1544,7 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
 
         If *axis* is None, find a suitable axis automatically.
         """
-        desired_length = kernel.get_constant_iname_length(iname)
+        desired_length = _get_constant_iname_length_or_none(kernel, iname)
 
         if axis is None:
             # {{{ find a suitable axis
@@ -918,7 +1558,8 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
                     test_axis += 1
                     continue
 
-                if local_size[test_axis] < desired_length:
+                if (desired_length is None
+                        or local_size[test_axis] < desired_length):
                     shorter_possible_axes.append(test_axis)
                     test_axis += 1
                     continue
@@ -942,7 +1583,7 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
             new_tag = None
         else:
             new_tag = LocalIndexTag(axis)
-            if desired_length > local_size[axis]:
+            if desired_length is None or desired_length > local_size[axis]:
                 from loopy import split_iname
 
                 # Don't be tempted to switch the outer tag to unroll--this may
@@ -967,9 +1608,11 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
     # {{{ main assignment loop
 
     # assignment proceeds in one phase per axis, each time assigning the
-    # smallest-stride available iname to the current axis
+    # available iname with the cheapest memory access (according to
+    # loopy.cost_model) to the current axis
 
     import loopy as lp
+    from loopy.cost_model import get_auto_axis_iname_ranking
 
     for insn in kernel.instructions:
         if not isinstance(insn, lp.ExpressionInstruction):
@@ -995,7 +1638,7 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
             # "valid" pass: try to assign a given axis
 
             if axis not in assigned_local_axes:
-                iname_ranking = get_auto_axis_iname_ranking_by_stride(kernel, insn)
+                iname_ranking = get_auto_axis_iname_ranking(kernel, insn)
                 if iname_ranking is not None:
                     for iname in iname_ranking:
                         prev_tag = kernel.iname_to_tag.get(iname)
@@ -1007,7 +1650,11 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
             #  numbered "valid" passes--assign the remainder by length.
 
             # assign longest auto axis inames first
-            auto_axis_inames.sort(key=kernel.get_constant_iname_length, reverse=True)
+            def get_length_key(iname):
+                length = _get_constant_iname_length_or_none(kernel, iname)
+                return (length is None, length or 0)
+
+            auto_axis_inames.sort(key=get_length_key, reverse=True)
 
             if auto_axis_inames:
                 return assign_axis(axis, auto_axis_inames.pop())
@@ -1026,7 +1673,7 @@ def assign_automatic_axes(kernel, axis=0, local_size=None):
 # }}}
 
 
-preprocess_cache = PersistentDict("loopy-preprocess-cache-v2-"+DATA_MODEL_VERSION,
+preprocess_cache = PersistentDict("loopy-preprocess-cache-v5-"+DATA_MODEL_VERSION,
         key_builder=LoopyKeyBuilder())
 
 
@@ -1080,9 +1727,17 @@ def preprocess_kernel(kernel, device=None):
 
     kernel = realize_reduction(kernel)
 
+    # Ordering restriction:
+    # hoist_loop_invariants must happen after realize_reduction so that
+    # subexpressions can be moved out of the loops implementing reductions.
+
+    if kernel.options.hoist_invariants:
+        from loopy.licm import hoist_loop_invariants
+        kernel = hoist_loop_invariants(kernel)
+
     # Ordering restriction:
     # duplicate_private_temporaries_for_ilp because reduction accumulators
-    # need to be duplicated by this.
+    # and hoisted invariants need to be duplicated by this.
 
     kernel = duplicate_private_temporaries_for_ilp_and_vec(kernel)
     kernel = mark_local_temporaries(kernel)
@@ -122,53 +122,128 @@ def generate_sub_sched_items(schedule, start_idx):
     assert False
 
 
-def find_active_inames_at(kernel, sched_index):
-    active_inames = []
+class ScheduleTables(Record):
+    """Information about each schedule item in a kernel's schedule, each
+    attribute being a list indexed by schedule index. Obtain via
+    :meth:`loopy.LoopKernel.get_schedule_tables`.
+
+    .. attribute:: active_inames
+
+        A :class:`frozenset` of the inames of the loops enclosing the
+        schedule item.
+
+    .. attribute:: loop_end
+
+        For :class:`EnterLoop`, the index just past the matching
+        :class:`LeaveLoop`. For all other schedule items, the index just
+        past the item itself.
+
+    .. attribute:: has_barrier_within
+
+        Whether the schedule item is a :class:`Barrier` or a loop
+        containing one.
+
+    .. attribute:: used_inames_within
+
+        A :class:`frozenset` of the inames of all instructions run by the
+        schedule item.
+
+    .. attribute:: required_predicates
+
+        The intersection of the predicates of all instructions run by the
+        schedule item (empty if it contains a barrier), or *None* if it
+        contains no instructions or barriers.
+    """
+
+
+def compute_schedule_tables(kernel):
+    """Compute a :class:`ScheduleTables` instance for *kernel*'s schedule
+    in a single pass.
+    """
+    schedule = kernel.schedule
+    nitems = len(schedule)
+
+    active_inames = [None]*nitems
+    loop_end = [None]*nitems
+    has_barrier = [False]*nitems
+    used_inames = [None]*nitems
+    required_predicates = [None]*nitems
+
+    loop_stack = []
+    active = frozenset()
+
+    def merge_into_enclosing_loop(i):
+        if not loop_stack:
+            return
+
+        loop_idx = loop_stack[-1]
+        has_barrier[loop_idx] = has_barrier[loop_idx] or has_barrier[i]
+        used_inames[loop_idx] |= used_inames[i]
+
+        if required_predicates[i] is not None:
+            if required_predicates[loop_idx] is None:
+                required_predicates[loop_idx] = required_predicates[i]
+            else:
+                required_predicates[loop_idx] = (
+                        required_predicates[loop_idx] & required_predicates[i])
+
+    for i, sched_item in enumerate(schedule):
+        active_inames[i] = active
+        loop_end[i] = i+1
 
-    from loopy.schedule import EnterLoop, LeaveLoop
-    for sched_item in kernel.schedule[:sched_index]:
         if isinstance(sched_item, EnterLoop):
-            active_inames.append(sched_item.iname)
-        if isinstance(sched_item, LeaveLoop):
-            active_inames.pop()
+            used_inames[i] = set()
+            loop_stack.append(i)
+            active = active | frozenset([sched_item.iname])
 
-    return set(active_inames)
+        elif isinstance(sched_item, LeaveLoop):
+            used_inames[i] = frozenset()
 
+            loop_idx = loop_stack.pop()
+            loop_end[loop_idx] = i+1
+            used_inames[loop_idx] = frozenset(used_inames[loop_idx])
+            active = active_inames[loop_idx]
+            merge_into_enclosing_loop(loop_idx)
 
-def has_barrier_within(kernel, sched_index):
-    sched_item = kernel.schedule[sched_index]
-
-    if isinstance(sched_item, EnterLoop):
-        loop_contents, _ = gather_schedule_subloop(
-                kernel.schedule, sched_index)
-        from pytools import any
-        return any(isinstance(subsched_item, Barrier)
-                for subsched_item in loop_contents)
-    elif isinstance(sched_item, Barrier):
-        return True
-    else:
-        return False
+        elif isinstance(sched_item, RunInstruction):
+            used_inames[i] = kernel.insn_inames(sched_item.insn_id)
+            required_predicates[i] = \
+                    kernel.id_to_insn[sched_item.insn_id].predicates
+            merge_into_enclosing_loop(i)
 
+        elif isinstance(sched_item, Barrier):
+            used_inames[i] = frozenset()
+            has_barrier[i] = True
+            required_predicates[i] = frozenset()
+            merge_into_enclosing_loop(i)
 
-def find_used_inames_within(kernel, sched_index):
-    sched_item = kernel.schedule[sched_index]
-
-    if isinstance(sched_item, EnterLoop):
-        loop_contents, _ = gather_schedule_subloop(
-                kernel.schedule, sched_index)
-        run_insns = [subsched_item
-                for subsched_item in loop_contents
-                if isinstance(subsched_item, RunInstruction)]
-    elif isinstance(sched_item, RunInstruction):
-        run_insns = [sched_item]
-    else:
+        else:
+            raise RuntimeError("unexpected schedule item type: %s"
+                    % type(sched_item))
+
+    assert not loop_stack
+
+    return ScheduleTables(
+            active_inames=active_inames,
+            loop_end=loop_end,
+            has_barrier_within=has_barrier,
+            used_inames_within=used_inames,
+            required_predicates=required_predicates)
+
+
+def find_active_inames_at(kernel, sched_index):
+    if sched_index >= len(kernel.schedule):
         return set()
 
-    result = set()
-    for sched_item in run_insns:
-        result.update(kernel.insn_inames(sched_item.insn_id))
+    return set(kernel.get_schedule_tables().active_inames[sched_index])
 
-    return result
+
+def has_barrier_within(kernel, sched_index):
+    return kernel.get_schedule_tables().has_barrier_within[sched_index]
+
+
+def find_used_inames_within(kernel, sched_index):
+    return set(kernel.get_schedule_tables().used_inames_within[sched_index])
 
 
 def loop_nest_map(kernel):
@@ -1036,11 +1111,12 @@ def generate_loop_schedules(kernel, debug_args={}):
         raise LoopyError("cannot schedule a kernel that has not been "
                 "preprocessed")
 
-    loop_priority = kernel.loop_priority
-
     from loopy.check import pre_schedule_checks
     pre_schedule_checks(kernel)
 
+    from loopy.cost_model import get_default_loop_priority
+    loop_priority = get_default_loop_priority(kernel)
+
     schedule_count = 0
 
     debug = ScheduleDebugger(**debug_args)
@@ -1129,7 +1205,7 @@ def generate_loop_schedules(kernel, debug_args={}):
 # }}}
 
 
-schedule_cache = PersistentDict("loopy-schedule-cache-v4-"+DATA_MODEL_VERSION,
+schedule_cache = PersistentDict("loopy-schedule-cache-v5-"+DATA_MODEL_VERSION,
         key_builder=LoopyKeyBuilder())
 
 
@@ -252,7 +252,10 @@ def count(kernel, bset):
 def get_op_poly(knl):
     from loopy.preprocess import preprocess_kernel, infer_unknown_types
     knl = infer_unknown_types(knl, expect_completion=True)
-    knl = preprocess_kernel(knl)
+
+    from loopy.kernel import kernel_state
+    if knl.state == kernel_state.INITIAL:
+        knl = preprocess_kernel(knl)
 
     op_poly = 0
     op_counter = ExpressionOpCounter(knl)
@@ -0,0 +1,316 @@
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import six
+
+from loopy.schedule import EnterLoop, RunInstruction, Barrier
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ temporary lifetimes
+
+def _get_temporary_accesses(kernel):
+    """Return a :class:`dict` mapping names of temporaries to lists of
+    tuples ``(sched_index, insn, is_read, is_written)``, in schedule order.
+    """
+
+    result = {}
+    for sched_index, sched_item in enumerate(kernel.schedule):
+        if not isinstance(sched_item, RunInstruction):
+            continue
+
+        insn = kernel.id_to_insn[sched_item.insn_id]
+        read_vars = insn.read_dependency_names()
+        written_vars = set(insn.assignee_var_names())
+
+        for name in read_vars | written_vars:
+            if name not in kernel.temporary_variables:
+                continue
+
+            result.setdefault(name, []).append(
+                    (sched_index, insn, name in read_vars, name in written_vars))
+
+    return result
+
+
+def _get_read_indices(insn, name):
+    """Return a list of the index tuples with which *insn* reads the
+    temporary *name*, or *None* if they cannot be determined.
+    """
+
+    from loopy.kernel.data import ExpressionInstruction
+    from loopy.symbolic import ArrayAccessFinder
+
+    if not isinstance(insn, ExpressionInstruction):
+        return None
+
+    accesses = ArrayAccessFinder(name)(insn.expression)
+    for _, index in insn.assignees_and_indices():
+        accesses = accesses | ArrayAccessFinder(name)(index)
+
+    if not accesses:
+        # read without a subscript
+        return None
+
+    return [
+            access.index if isinstance(access.index, tuple)
+            else (access.index,)
+            for access in accesses]
+
+
+def _get_written_indices(insn, name):
+    from loopy.kernel.data import ExpressionInstruction
+
+    if not isinstance(insn, ExpressionInstruction):
+        return None
+
+    return [
+            index if isinstance(index, tuple) else (index,)
+            for assignee_name, index in insn.assignees_and_indices()
+            if assignee_name == name]
+
+
+def _may_carry_values(name, accesses):
+    """Whether the value of the temporary *name* may be carried from one
+    trip through a loop to the next, given its *accesses* (as returned by
+    :func:`_get_temporary_accesses`) within the loop.
+
+    This is assumed to be not the case if the first access within the loop
+    body is an unconditional assignment, and every read within the body
+    uses exactly the same index as an assignment earlier in the same trip.
+    (As with all other instructions, assignments are then assumed to
+    assign every entry that is read later in the same trip.)
+    """
+
+    _, insn, is_read, is_written = accesses[0]
+    if is_read or not is_written or insn.predicates:
+        return True
+
+    written_indices = []
+    for _, insn, is_read, is_written in accesses:
+        if is_read:
+            read_indices = _get_read_indices(insn, name)
+            if read_indices is None or not all(
+                    index in written_indices for index in read_indices):
+                return True
+
+        if is_written:
+            new_written_indices = _get_written_indices(insn, name)
+            if new_written_indices is None:
+                return True
+
+            written_indices.extend(new_written_indices)
+
+    return False
+
+
+def get_temporary_live_intervals(kernel):
+    """For each temporary accessed in the (scheduled) *kernel*, find the
+    range of schedule indices during which it holds a value that may still
+    be read.
+
+    :returns: a :class:`dict` mapping temporary names to tuples
+        ``(start, end)`` of (inclusive) indices into
+        :attr:`loopy.LoopKernel.schedule`.
+
+    A lifetime that extends into (or out of) a loop is extended to the
+    whole loop. A lifetime within a loop body is extended to the whole
+    loop unless :func:`_may_carry_values` rules out that values are carried
+    across trips.
+    """
+
+    sched_tables = kernel.get_schedule_tables()
+
+    loops = [
+            (sched_index, sched_tables.loop_end[sched_index] - 1)
+            for sched_index, sched_item in enumerate(kernel.schedule)
+            if isinstance(sched_item, EnterLoop)]
+
+    result = {}
+    for name, accesses in six.iteritems(_get_temporary_accesses(kernel)):
+        start = accesses[0][0]
+        end = accesses[-1][0]
+
+        changed = True
+        while changed:
+            changed = False
+
+            for loop_start, loop_end in loops:
+                if loop_end < start or end < loop_start:
+                    # disjoint
+                    continue
+
+                if start <= loop_start and loop_end <= end:
+                    # loop contained in lifetime
+                    continue
+
+                if loop_start < start and end < loop_end:
+                    # lifetime contained in loop body
+                    if not _may_carry_values(name, [
+                            access for access in accesses
+                            if loop_start < access[0] < loop_end]):
+                        continue
+
+                start = min(start, loop_start)
+                end = max(end, loop_end)
+                changed = True
+
+        result[name] = (start, end)
+
+    return result
+
+# }}}
+
+
+# {{{ storage sharing
+
+def _has_barrier_between(kernel, sched_tables, before, after):
+    """Whether all work items of a group pass a local barrier between
+    schedule indices *before* and *after* (exclusive), i.e. there is a
+    barrier not nested in any loop deeper than the ones surrounding
+    both.
+    """
+
+    active_inames = (
+            sched_tables.active_inames[before]
+            & sched_tables.active_inames[after])
+
+    return any(
+            isinstance(sched_item, Barrier)
+            and sched_item.kind == "local"
+            and sched_tables.active_inames[sched_index] <= active_inames
+            for sched_index, sched_item in enumerate(
+                kernel.schedule[before+1:after], before+1))
+
+
+def _is_eligible_for_sharing(kernel, tv):
+    from loopy.tools import is_integer
+    from loopy.kernel.array import VectorArrayDimTag
+
+    if tv.base_storage is not None or tv.is_local not in [True, False]:
+        return False
+
+    # Scalars (and vectors) are better off in registers.
+    if not tv.shape or all(
+            isinstance(dim_tag, VectorArrayDimTag)
+            for dim_tag in tv.dim_tags or ()):
+        return False
+
+    if not all(is_integer(s) for s in tv.shape):
+        return False
+
+    # Storage of opaque or structured types cannot be reinterpreted.
+    if tv.dtype.fields is not None and not kernel.target.is_vector_dtype(
+            tv.dtype):
+        return False
+
+    return len(list(tv.decl_info(kernel.target, is_written=True,
+        index_dtype=kernel.index_dtype))) == 1
+
+
+def share_temporary_storage(kernel):
+    """Let array temporaries of the scheduled *kernel* whose lifetimes
+    (as found by :func:`get_temporary_live_intervals`) do not overlap
+    share storage, by setting their
+    :attr:`loopy.TemporaryVariable.base_storage`. Local and private
+    temporaries are considered separately. Two local temporaries only
+    share storage if a local barrier is executed between their
+    lifetimes, so that all work items of a group are done with one before
+    any of them starts on the other. (No barriers are added.)
+
+    This is applied by :func:`loopy.generate_code` if
+    :attr:`loopy.Options.share_temporary_storage` is set.
+    """
+
+    logger.debug("%s: share temporary storage" % kernel.name)
+
+    sched_tables = kernel.get_schedule_tables()
+    live_intervals = get_temporary_live_intervals(kernel)
+    var_name_gen = kernel.get_var_name_generator()
+
+    new_temporary_variables = kernel.temporary_variables.copy()
+
+    for is_local in [True, False]:
+        names = sorted(
+                (name for name, tv in six.iteritems(kernel.temporary_variables)
+                    if tv.is_local == is_local
+                    and name in live_intervals
+                    and _is_eligible_for_sharing(kernel, tv)),
+                key=lambda name: (live_intervals[name], name))
+
+        # Each storage group is a list of names, where the last one has
+        # the lifetime ending last.
+        groups = []
+        for name in names:
+            start, end = live_intervals[name]
+            nbytes = kernel.temporary_variables[name].nbytes
+
+            best_group = None
+            best_growth = None
+            for group in groups:
+                last_end = live_intervals[group[-1]][1]
+                if last_end >= start:
+                    continue
+
+                if is_local and not _has_barrier_between(
+                        kernel, sched_tables, last_end, start):
+                    continue
+
+                group_nbytes = max(
+                        kernel.temporary_variables[member].nbytes
+                        for member in group)
+                growth = max(nbytes - group_nbytes, 0)
+                if best_growth is None or growth < best_growth:
+                    best_group = group
+                    best_growth = growth
+
+            if best_group is not None:
+                best_group.append(name)
+            else:
+                groups.append([name])
+
+        for group in groups:
+            if len(group) < 2:
+                continue
+
+            storage_name = var_name_gen(
+                    "local_storage" if is_local else "private_storage")
+
+            logger.debug("%s: %s share storage '%s'" % (
+                kernel.name, ", ".join(group), storage_name))
+
+            for name in group:
+                new_temporary_variables[name] = \
+                        new_temporary_variables[name].copy(
+                                base_storage=storage_name)
+
+    return kernel.copy(temporary_variables=new_temporary_variables)
+
+# }}}
+
+# vim: foldmethod=marker
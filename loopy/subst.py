@@ -138,8 +138,10 @@ def extract_subst(kernel, subst_name, template, parameters=()):
             CallbackMapper, WalkMapper, IdentityMapper)
     dfmapper = CallbackMapper(gather_exprs, WalkMapper())
 
+    from loopy.kernel.data import ExpressionInstruction
     for insn in kernel.instructions:
-        dfmapper(insn.expression)
+        if isinstance(insn, ExpressionInstruction):
+            dfmapper(insn.expression)
 
     for sr in six.itervalues(kernel.substitutions):
         dfmapper(sr.expression)
@@ -176,8 +178,9 @@ def extract_subst(kernel, subst_name, template, parameters=()):
     new_insns = []
 
     for insn in kernel.instructions:
-        new_expr = cbmapper(insn.expression)
-        new_insns.append(insn.copy(expression=new_expr))
+        if isinstance(insn, ExpressionInstruction):
+            insn = insn.copy(expression=cbmapper(insn.expression))
+        new_insns.append(insn)
 
     from loopy.kernel.data import SubstitutionRule
     new_substs = {
@@ -243,7 +246,11 @@ class TemporaryToSubstChanger(RuleAwareIdentityMapper):
     def map_subscript(self, expr, expn_state):
         if (expr.aggregate.name == self.temp_name
                 and expr.aggregate.name not in expn_state.arg_context):
-            result = self.transform_access(expr.index, expn_state)
+            index = expr.index
+            if not isinstance(index, tuple):
+                index = (index,)
+
+            result = self.transform_access(index, expn_state)
             if result is not None:
                 return result
 
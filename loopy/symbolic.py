@@ -871,6 +871,21 @@ class CoefficientCollector(CoefficientCollectorBase):
     def map_subscript(self, expr):
         raise RuntimeError("cannot gather coefficients--indirect addressing in use")
 
+    def map_remainder(self, expr):
+        if (self.target_names is not None
+                and not get_dependencies(expr) & set(self.target_names)):
+            # e.g. a stride that depends on a parameter
+            return {1: expr}
+
+        raise NotImplementedError(
+                "cannot gather coefficients--floor division in use")
+
+    def map_floor_div(self, expr):
+        if expr.denominator == 1:
+            return self.rec(expr.numerator)
+
+        return self.map_remainder(expr)
+
 # }}}
 
 
@@ -87,12 +87,56 @@ class CTarget(TargetBase):
 
         # {{{ declare temporaries
 
-        body.extend(
-                idi.cgen_declarator
-                for tv in six.itervalues(kernel.temporary_variables)
-                for idi in tv.decl_info(
+        from cgen import (
+                ArrayOf, AlignedAttribute, Initializer, Pointer, Const, Value)
+        from cgen.opencl import CLLocal
+        from loopy.codegen import POD
+
+        temp_decls = []
+        base_storage_to_nbytes = {}
+        base_storage_to_align_bytes = {}
+        base_storage_to_is_local = {}
+
+        for tv in six.itervalues(kernel.temporary_variables):
+            decl_info = tv.decl_info(
                     kernel.target,
-                    is_written=True, index_dtype=kernel.index_dtype))
+                    is_written=True, index_dtype=kernel.index_dtype)
+
+            if tv.base_storage is None:
+                temp_decls.extend(idi.cgen_declarator for idi in decl_info)
+                continue
+
+            idi, = decl_info
+
+            def wrap_local(decl):
+                if tv.is_local:
+                    return CLLocal(decl)
+                else:
+                    return decl
+
+            cast_type = wrap_local(Pointer(POD(self, idi.dtype, ""))).inline()
+            temp_decls.append(Initializer(
+                wrap_local(Pointer(Const(POD(self, idi.dtype, tv.name)))),
+                "(%s) %s" % (cast_type, tv.base_storage)))
+
+            base_storage_to_nbytes[tv.base_storage] = max(
+                    base_storage_to_nbytes.get(tv.base_storage, 0),
+                    tv.nbytes)
+            base_storage_to_align_bytes[tv.base_storage] = max(
+                    base_storage_to_align_bytes.get(tv.base_storage, 1),
+                    idi.dtype.itemsize)
+            base_storage_to_is_local[tv.base_storage] = tv.is_local
+
+        for name in sorted(base_storage_to_nbytes):
+            decl = AlignedAttribute(
+                    base_storage_to_align_bytes[name],
+                    ArrayOf(Value("char", name), base_storage_to_nbytes[name]))
+            if base_storage_to_is_local[name]:
+                decl = CLLocal(decl)
+
+            body.append(decl)
+
+        body.extend(temp_decls)
 
         # }}}
 
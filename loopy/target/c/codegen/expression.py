@@ -138,7 +138,62 @@ class LoopyCCodeMapper(RecursiveMapper):
                     self.rec(expr.aggregate, PREC_CALL, type_context), expr.name),
                 enclosing_prec, PREC_CALL)
 
+    def get_vector_memory_access(self, expr):
+        """If *expr* is an array access to be implemented using
+        ``vloadn``/``vstoren`` in the current vectorizing state (see
+        :attr:`loopy.Options.use_vload_vstore`), return a tuple
+        ``(n, offset, pointer)`` of code for their arguments. Otherwise,
+        return *None*.
+        """
+
+        vinf = self.codegen_state.vectorization_info
+        if vinf is None or not self.kernel.options.use_vload_vstore:
+            return None
+
+        from pymbolic.primitives import Subscript, Variable
+        if not (isinstance(expr, Subscript)
+                and isinstance(expr.aggregate, Variable)):
+            return None
+
+        ary = (self.kernel.arg_dict.get(expr.aggregate.name)
+                or self.kernel.temporary_variables.get(expr.aggregate.name))
+
+        from loopy.kernel.array import ArrayBase
+        if not isinstance(ary, ArrayBase):
+            return None
+
+        index = expr.index
+        if not isinstance(index, tuple):
+            index = (index,)
+
+        from loopy.kernel.array import get_vector_memory_access_info
+        from pymbolic import evaluate
+
+        access_info = get_vector_memory_access_info(
+                self.kernel.target, ary, index,
+                lambda expr: evaluate(expr, self.codegen_state.var_subst_map),
+                vinf.iname, vinf.length)
+
+        if access_info is None:
+            return None
+
+        from pymbolic.mapper.stringifier import PREC_SUM
+        if access_info.aligned_offset is not None:
+            return (access_info.vector_length,
+                    self.rec(access_info.aligned_offset, PREC_NONE, 'i'),
+                    access_info.array_name)
+        else:
+            return (access_info.vector_length,
+                    "0",
+                    "%s + %s" % (
+                        access_info.array_name,
+                        self.rec(access_info.base_subscript, PREC_SUM, 'i')))
+
     def map_subscript(self, expr, enclosing_prec, type_context):
+        vector_access = self.get_vector_memory_access(expr)
+        if vector_access is not None:
+            return "vload%d(%s, %s)" % vector_access
+
         def base_impl(expr, enclosing_prec, type_context):
             return self.parenthesize_if_needed(
                     "%s[%s]" % (
@@ -212,6 +267,12 @@ class LoopyCCodeMapper(RecursiveMapper):
 
             else:
                 subscript, = access_info.subscripts
+
+                if self.codegen_state.induction_vars:
+                    from loopy.codegen.induction import rewrite_subscript
+                    subscript = rewrite_subscript(self.kernel, subscript,
+                            self.codegen_state.induction_vars)
+
                 result = self.parenthesize_if_needed(
                         "%s[%s]" % (
                             access_info.array_name,
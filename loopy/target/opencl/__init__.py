@@ -103,6 +103,19 @@ def _register_vector_types(dtype_registry):
 # }}}
 
 
+# {{{ event type
+
+#: A stand-in :class:`numpy.dtype` for the opaque OpenCL type ``event_t``,
+#: used for temporaries holding the events of asynchronous copies.
+event_dtype = np.dtype([("loopy_event_t", np.uintp)])
+
+
+def _register_event_type(dtype_registry):
+    dtype_registry.get_or_register_dtype("event_t", event_dtype)
+
+# }}}
+
+
 # {{{ function mangler
 
 def opencl_function_mangler(target, name, arg_dtypes):
@@ -227,11 +240,12 @@ class OpenCLTarget(CTarget):
                 ["signed long", "signed long int", "long int"], np.int64)
 
         _register_vector_types(result)
+        _register_event_type(result)
 
         return result
 
     def is_vector_dtype(self, dtype):
-        return list(vec.types.values())
+        return dtype in list(vec.types.values())
 
     def get_vector_dtype(self, base, count):
         return vec.types[base, count]
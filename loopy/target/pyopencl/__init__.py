@@ -29,7 +29,7 @@ from six.moves import range
 
 import numpy as np
 
-from loopy.target.opencl import OpenCLTarget
+from loopy.target.opencl import OpenCLTarget, _register_event_type
 
 import pyopencl as cl
 import pyopencl.characterize as cl_char
@@ -37,6 +37,9 @@ import pyopencl.characterize as cl_char
 # This ensures the dtype registry is populated.
 import pyopencl.tools  # noqa
 
+from pyopencl.compyte.dtypes import TYPE_REGISTRY as _TYPE_REGISTRY
+_register_event_type(_TYPE_REGISTRY)
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -260,8 +263,7 @@ class PyOpenCLTarget(OpenCLTarget):
         check_sizes(kernel, self.device)
 
     def get_dtype_registry(self):
-        from pyopencl.compyte.dtypes import TYPE_REGISTRY
-        return TYPE_REGISTRY
+        return _TYPE_REGISTRY
 
     def is_vector_dtype(self, dtype):
         from pyopencl.array import vec
@@ -0,0 +1,402 @@
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2015 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import six
+
+from pytools import Record
+
+from loopy.diagnostic import LoopyError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ device limits
+
+# Used in the absence of a device. Modest enough for most OpenCL devices.
+DEFAULT_MAX_WORK_GROUP_SIZE = 256
+DEFAULT_LOCAL_MEM_SIZE = 16384
+DEFAULT_SIMD_GROUP_SIZE = 32
+
+# Larger work groups rarely pay off, even where they are allowed.
+MAX_TILE_WORK_GROUP_SIZE = 256
+
+
+class _DeviceLimits(Record):
+    """
+    .. attribute:: max_work_group_size
+    .. attribute:: max_work_item_sizes
+    .. attribute:: usable_local_mem_size
+    .. attribute:: simd_group_size
+
+        May be *None* if unknown.
+
+    .. attribute:: compute_units
+    """
+
+
+def _get_device_limits(kernel, device):
+    if device is None:
+        device = getattr(kernel.target, "device", None)
+
+    if device is None:
+        return _DeviceLimits(
+                max_work_group_size=DEFAULT_MAX_WORK_GROUP_SIZE,
+                max_work_item_sizes=[DEFAULT_MAX_WORK_GROUP_SIZE]*3,
+                usable_local_mem_size=DEFAULT_LOCAL_MEM_SIZE,
+                simd_group_size=DEFAULT_SIMD_GROUP_SIZE,
+                compute_units=1)
+
+    from pyopencl.characterize import (
+            usable_local_mem_size, get_simd_group_size)
+
+    return _DeviceLimits(
+            max_work_group_size=device.max_work_group_size,
+            max_work_item_sizes=device.max_work_item_sizes,
+            usable_local_mem_size=usable_local_mem_size(device),
+            simd_group_size=get_simd_group_size(device, 4),
+            compute_units=device.max_compute_units)
+
+# }}}
+
+
+# {{{ tile size selection
+
+class TileSizes(Record):
+    """The result of :func:`choose_tile_sizes`.
+
+    .. attribute:: tile_sizes
+
+        A :class:`dict` mapping the tiled inames to their tile sizes.
+
+    .. attribute:: reduction_tile_size
+
+        The tile size of the reduction iname, or *None*.
+
+    .. attribute:: work_group_size
+
+    .. attribute:: local_mem_use
+
+        The estimated number of bytes of local memory used by
+        the prefetched operands.
+
+    .. attribute:: usable_local_mem_size
+
+        The number of bytes of local memory assumed available.
+    """
+
+
+def _get_constant_length(kernel, iname):
+    from loopy.isl_helpers import static_max_of_pw_aff
+    from loopy.symbolic import pw_aff_to_expr
+    import islpy as isl
+
+    try:
+        size = pw_aff_to_expr(static_max_of_pw_aff(
+            kernel.get_iname_bounds(iname, constants_only=True).size,
+            constants_only=True))
+    except (ValueError, isl.Error, NotImplementedError):
+        return None
+
+    from loopy.tools import is_integer
+    if is_integer(size):
+        return int(size)
+    else:
+        return None
+
+
+def _get_tile_operands(kernel, inames, reduction_iname, operands):
+    """Return a :class:`dict` mapping the names of the arrays to be
+    prefetched to the set of (tiled and reduction) inames their accesses
+    depend on.
+    """
+
+    tiled_inames = frozenset(inames)
+    all_inames = tiled_inames
+    if reduction_iname is not None:
+        all_inames = all_inames | frozenset([reduction_iname])
+
+    from loopy.kernel.tools import find_tile_operands
+    tile_operands = find_tile_operands(kernel, all_inames)
+
+    if operands is None:
+        # Only arrays of which each work group uses some entries in more
+        # than one work item are worth fetching.
+        return dict(
+                (name, operand_inames)
+                for name, operand_inames in six.iteritems(tile_operands)
+                if operand_inames
+                and not tiled_inames <= operand_inames)
+
+    if isinstance(operands, str):
+        operands = [s.strip() for s in operands.split(",")]
+
+    for name in operands:
+        if name not in tile_operands:
+            raise LoopyError("'%s' is not a read-only array read within "
+                    "the tile" % name)
+
+    return dict((name, tile_operands[name]) for name in operands)
+
+
+def _estimate_local_mem_use(kernel, tile_operands, iname_to_size):
+    from pytools import product
+
+    result = 0
+    for name, operand_inames in six.iteritems(tile_operands):
+        dtype = kernel.arg_dict[name].dtype
+        itemsize = dtype.itemsize if dtype is not None else 8
+
+        result += itemsize * product(
+                iname_to_size[iname] for iname in operand_inames)
+
+    return result
+
+
+def choose_tile_sizes(kernel, inames, reduction_iname=None, operands=None,
+        device=None):
+    """Choose tile sizes for :func:`tile` (see there for the meaning of
+    the arguments), based on the properties of *device* (or, if *None*,
+    the device of *kernel*'s target, if any).
+
+    Among the power-of-two tile sizes whose work groups fit on the device
+    and whose prefetched operands (as estimated) fit into local memory,
+    prefer ones that give each compute unit at least one work group
+    (if the loop lengths are known), then ones with work group sizes
+    that are a multiple of the SIMD group size, then larger and then more
+    nearly square tiles. The tile size of *reduction_iname* is chosen
+    as the smallest of the other tile sizes.
+
+    :returns: a :class:`TileSizes` instance.
+    """
+
+    if isinstance(inames, str):
+        inames = [s.strip() for s in inames.split(",")]
+
+    limits = _get_device_limits(kernel, device)
+    tile_operands = _get_tile_operands(
+            kernel, inames, reduction_iname, operands)
+
+    max_work_group_size = min(
+            limits.max_work_group_size, MAX_TILE_WORK_GROUP_SIZE)
+
+    lengths = [_get_constant_length(kernel, iname) for iname in inames]
+    reduction_length = None
+    if reduction_iname is not None:
+        reduction_length = _get_constant_length(kernel, reduction_iname)
+
+    def get_candidates(axis, length):
+        limit = min(max_work_group_size, limits.max_work_item_sizes[axis])
+        size = 1
+        while size <= limit:
+            yield size
+            if length is not None and size >= length:
+                break
+            size *= 2
+
+    from itertools import product as cartesian_product
+    from pytools import product
+
+    best = None
+    best_score = None
+
+    # The last iname is mapped to local axis 0.
+    for sizes in cartesian_product(*[
+            list(get_candidates(len(inames)-1-i, length))
+            for i, length in enumerate(lengths)]):
+        work_group_size = product(sizes)
+        if work_group_size > max_work_group_size:
+            continue
+
+        iname_to_size = dict(zip(inames, sizes))
+
+        reduction_tile_size = None
+        if reduction_iname is not None:
+            reduction_tile_size = min(sizes)
+            if reduction_length is not None:
+                reduction_tile_size = min(reduction_tile_size, reduction_length)
+            iname_to_size[reduction_iname] = reduction_tile_size
+
+        local_mem_use = _estimate_local_mem_use(
+                kernel, tile_operands, iname_to_size)
+        if local_mem_use > limits.usable_local_mem_size:
+            continue
+
+        if all(length is not None for length in lengths):
+            ngroups = product(
+                    (length + size - 1) // size
+                    for length, size in zip(lengths, sizes))
+            enough_groups = ngroups >= limits.compute_units
+        else:
+            enough_groups = True
+
+        simd_aligned = (
+                limits.simd_group_size is None
+                or work_group_size % limits.simd_group_size == 0)
+
+        score = (
+                enough_groups,
+                simd_aligned,
+                work_group_size,
+                -(max(sizes) // min(sizes)),
+                tuple(reversed(sizes)))
+
+        if best_score is None or score > best_score:
+            best_score = score
+            best = TileSizes(
+                    tile_sizes=dict(zip(inames, sizes)),
+                    reduction_tile_size=reduction_tile_size,
+                    work_group_size=work_group_size,
+                    local_mem_use=local_mem_use,
+                    usable_local_mem_size=limits.usable_local_mem_size)
+
+    if best is None:
+        raise LoopyError("no tile sizes fit the device")
+
+    return best
+
+# }}}
+
+
+# {{{ tiling
+
+def tile(kernel, inames, tile_sizes=None, reduction_iname=None,
+        reduction_tile_size=None, operands=None, device=None):
+    """Tile the loop nest over *inames* across work groups and work
+    items, and prefetch the data shared among the work items of a
+    group into local memory.
+
+    Each of *inames* is split, with the outer part mapped to a group axis
+    and the inner part mapped to the corresponding local axis. (The last
+    iname is mapped to axis 0.) If *reduction_iname* is given, it is split,
+    too, and the tiles of the operands used in each trip through its outer
+    loop are prefetched (using :func:`loopy.add_prefetch`) and kept in local
+    memory.
+
+    :arg inames: a list of up to three inames, or a comma-separated string
+        of them.
+    :arg tile_sizes: a list of tile sizes, one per iname in *inames*, or a
+        :class:`dict` mapping inames to tile sizes. If *None*, choose tile
+        sizes using :func:`choose_tile_sizes`.
+    :arg reduction_tile_size: defaults to the smallest of the tile sizes.
+    :arg operands: a list of names of arrays read within the tile to be
+        prefetched, or *None* to prefetch those whose accesses depend on
+        some, but not all, of *inames* (and whose entries are thus used by
+        multiple work items of a group).
+    :arg device: a :class:`pyopencl.Device` that is used to choose tile
+        sizes, if they are not given.
+
+    The estimated local memory use is logged at level ``INFO``.
+    """
+
+    if isinstance(inames, str):
+        inames = [s.strip() for s in inames.split(",")]
+
+    inames = list(inames)
+    if not 1 <= len(inames) <= 3:
+        raise LoopyError("can tile from one to three inames, not %d"
+                % len(inames))
+
+    for iname in inames + (
+            [reduction_iname] if reduction_iname is not None else []):
+        if iname not in kernel.all_inames():
+            raise LoopyError("unknown iname '%s'" % iname)
+
+    if tile_sizes is None:
+        sizes = choose_tile_sizes(kernel, inames,
+                reduction_iname=reduction_iname, operands=operands,
+                device=device)
+        tile_sizes = sizes.tile_sizes
+        if reduction_tile_size is None:
+            reduction_tile_size = sizes.reduction_tile_size
+
+    elif not isinstance(tile_sizes, dict):
+        tile_sizes = list(tile_sizes)
+        if len(tile_sizes) != len(inames):
+            raise LoopyError("expected %d tile sizes, got %d"
+                    % (len(inames), len(tile_sizes)))
+
+        tile_sizes = dict(zip(inames, tile_sizes))
+
+    if reduction_iname is not None and reduction_tile_size is None:
+        reduction_tile_size = min(six.itervalues(tile_sizes))
+
+    tile_operands = _get_tile_operands(
+            kernel, inames, reduction_iname, operands)
+
+    iname_to_size = tile_sizes.copy()
+    if reduction_iname is not None:
+        iname_to_size[reduction_iname] = reduction_tile_size
+
+    logger.info("%s: tile %s by %s: estimated local memory use %d bytes" % (
+        kernel.name, ", ".join(inames),
+        ", ".join(str(tile_sizes[iname]) for iname in inames),
+        _estimate_local_mem_use(kernel, tile_operands, iname_to_size)))
+
+    import loopy as lp
+
+    # {{{ split
+
+    iname_to_inner = {}
+    for i, iname in enumerate(inames):
+        axis = len(inames) - 1 - i
+
+        vng = kernel.get_var_name_generator()
+        inner_iname = vng(iname+"_inner")
+        iname_to_inner[iname] = inner_iname
+
+        kernel = lp.split_iname(kernel, iname, tile_sizes[iname],
+                inner_iname=inner_iname,
+                outer_tag="g.%d" % axis, inner_tag="l.%d" % axis)
+
+    if reduction_iname is not None:
+        vng = kernel.get_var_name_generator()
+        outer_iname = vng(reduction_iname+"_outer")
+        inner_iname = vng(reduction_iname+"_inner")
+        iname_to_inner[reduction_iname] = inner_iname
+
+        kernel = lp.split_iname(kernel, reduction_iname, reduction_tile_size,
+                outer_iname=outer_iname, inner_iname=inner_iname)
+
+        kernel = lp.set_loop_priority(kernel,
+                [outer_iname, inner_iname] + [
+                    iname for iname in kernel.loop_priority
+                    if iname not in [outer_iname, inner_iname]])
+
+    # }}}
+
+    for name in sorted(tile_operands):
+        kernel = lp.add_prefetch(kernel, name,
+                sweep_inames=[
+                    iname_to_inner[iname]
+                    for iname in inames + [reduction_iname]
+                    if iname in tile_operands[name]])
+
+    return kernel
+
+# }}}
+
+# vim: foldmethod=marker
@@ -1634,6 +1634,45 @@ def test_conditional(ctx_factory):
                 ))
 
 
+def test_conditional_hoist_group(ctx_factory):
+    # A run of instructions sharing a predicate sits inside the bounds check
+    # from the split. Both conditionals should be hoisted around the group.
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{ [i]: 0<=i<n }",
+            """
+                <> x = a[i] {id=read_a}
+                <> p = x < 0 {id=pred,dep=read_a,inames=i}
+                x = 2*x {id=twice,dep=pred,if=p}
+                x = x+1 {id=plus,dep=twice,if=p}
+                <> y = x*x {id=sq,dep=plus,if=p}
+                x = x + y {id=add_y,dep=sq,if=p}
+                out[i] = x {dep=add_y}
+                """,
+            [
+                lp.GlobalArg("a", np.float32, shape=lp.auto),
+                lp.GlobalArg("out", np.float32, shape=lp.auto),
+                "..."
+                ])
+
+    knl = lp.split_iname(knl, "i", 16)
+
+    code, _ = lp.generate_code(
+            lp.get_one_scheduled_kernel(lp.preprocess_kernel(knl)))
+    assert code.count("if (p)") == 1
+
+    a = np.random.randn(100).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=len(a))
+
+    x = a.copy()
+    p = x < 0
+    x[p] = 2*x[p] + 1
+    x[p] += x[p]**2
+    assert np.allclose(out, x)
+
+
 def test_ilp_loop_bound(ctx_factory):
     # The salient bit of this test is that a joint bound on (outer, inner)
     # from a split occurs in a setting where the inner loop has been ilp'ed.
@@ -1706,6 +1745,590 @@ def test_slab_decomposition_does_not_double_execute(ctx_factory):
         assert (a_ref == a_knl).get().all()
 
 
+@pytest.mark.parametrize("outer_tag", ["for", "g.0"])
+def test_automatic_slab_decomposition(ctx_factory, outer_tag):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<m }",
+        "out[i,j] = 2*a[i,j]",
+        assumptions="n,m>=1")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+
+    knl = lp.split_iname(knl, "i", 4, slabs="auto", inner_tag="unr",
+            outer_tag=outer_tag)
+    knl = lp.split_iname(knl, "j", 3, slabs="auto")
+    knl = lp.set_loop_priority(knl, "i_outer,j_outer,j_inner")
+
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    assert "bulk slab for 'i_outer'" in code
+    assert "bulk slab for 'j_outer'" in code
+
+    queue = cl.CommandQueue(ctx)
+    for n, m in [(1, 1), (4, 3), (13, 7), (16, 12)]:
+        a = np.random.rand(n, m).astype(np.float32)
+        evt, (out,) = knl(queue, a=a, n=n, m=m)
+        assert np.array_equal(out, 2*a)
+
+
+@pytest.mark.parametrize("options", [
+    dict(domain_check="full"),
+    dict(domain_check="sampled", domain_check_sample_size=1),
+    dict(domain_check_processes=2),
+    ])
+def test_domain_check_levels(options):
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<m }",
+        """
+        out[i] = 2*a[i] {id=first}
+        out2[i,j] = 3*a[i] {id=second}
+        """,
+        assumptions="n,m>=1")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+    knl = lp.set_options(knl, **options)
+
+    from loopy.check import check_implemented_domains
+
+    # restrict 'first' to i <= 2, 'second' to j <= 2
+    bad_impl_domains = {}
+    for insn_id, iname in [("first", "i"), ("second", "j")]:
+        insn_inames = knl.insn_inames(insn_id)
+        domain = knl.get_inames_domain(insn_inames)
+        bad_impl_domains[insn_id] = [
+                domain & lp.isl_helpers.make_slab(
+                    domain.space, iname, 0, 3)]
+
+        with pytest.raises(lp.LoopyError):
+            check_implemented_domains(knl, bad_impl_domains)
+
+    assert check_implemented_domains(
+            lp.set_options(knl, domain_check="off"), bad_impl_domains)
+
+    code_knl = lp.get_one_scheduled_kernel(lp.preprocess_kernel(knl))
+    assert lp.generate_code(code_knl)[0] == lp.generate_code(
+            lp.set_options(code_knl, domain_check="off"))[0]
+
+
+def test_hoist_loop_invariants(ctx_factory):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<m }",
+        """
+        out[i,j] = a[i]*scale*b[j] + sqrt(a[i])
+        out2[i] = sum(j, 2*a[i]*scale*b[j])
+        """,
+        assumptions="n,m>=1")
+    knl = lp.add_and_infer_dtypes(knl,
+            dict(a=np.float32, b=np.float32, scale=np.float32))
+    knl = lp.set_loop_priority(knl, "i,j")
+    knl = lp.set_options(knl, hoist_invariants=True)
+
+    pknl = lp.preprocess_kernel(knl)
+    hoisted = [insn for insn in pknl.instructions if "_invariant" in insn.id]
+    assert len(hoisted) == 3
+    for insn in hoisted:
+        assert pknl.insn_inames(insn) == frozenset(["i"])
+
+    queue = cl.CommandQueue(ctx)
+    n, m = 5, 7
+    a = np.random.rand(n).astype(np.float32)
+    b = np.random.rand(m).astype(np.float32)
+    evt, (out, out2) = knl(queue, a=a, b=b, scale=np.float32(1.5), n=n, m=m)
+
+    assert np.allclose(out, 1.5*np.outer(a, b) + np.sqrt(a)[:, np.newaxis])
+    assert np.allclose(out2, 2*1.5*a*b.sum())
+
+
+def test_strength_reduce_indices(ctx_factory):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{ [i,j,k]: 0<=i<n and 0<=j<m and 0<=k<3 }",
+        "out[i,j,k] = a[i,j,k] + a[i,j,2-k] + b[j,i]",
+        assumptions="n,m>=1")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32, b=np.float32))
+    knl = lp.set_loop_priority(knl, "i,j,k")
+    knl = lp.set_options(knl, strength_reduce_indices=True)
+
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    assert "j_offset_0 = i_offset" in code
+    assert "out[k_offset_0]" in code
+
+    queue = cl.CommandQueue(ctx)
+    n, m = 5, 7
+    a = np.random.rand(n, m, 3).astype(np.float32)
+    b = np.random.rand(m, n).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, b=b, n=n, m=m)
+
+    assert np.array_equal(out, a + a[:, :, ::-1] + b.T[:, :, np.newaxis])
+
+
+def test_strength_reduce_indices_with_temporary_index(ctx_factory):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<m }",
+        """
+        <> t = idx[i, j]
+        out[i, j] = a[t, j] + a[i, j]
+        """,
+        [
+            lp.GlobalArg("a", np.float32, shape="n,m"),
+            lp.GlobalArg("idx", np.int32, shape="n,m"),
+            "..."],
+        assumptions="n,m>=1")
+    knl = lp.set_loop_priority(knl, "i,j")
+    knl = lp.set_options(knl, strength_reduce_indices=True)
+
+    # t changes within the loop and may not be used upon loop entry.
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    import re
+    for line in code.split("\n"):
+        if "for (" in line:
+            assert not re.search(r"\bt\b", line)
+
+    queue = cl.CommandQueue(ctx)
+    n, m = 5, 7
+    a = np.random.rand(n, m).astype(np.float32)
+    idx = np.random.randint(0, n, (n, m)).astype(np.int32)
+    evt, (out,) = knl(queue, a=a, idx=idx, n=n, m=m)
+
+    assert np.array_equal(out, a[idx, np.arange(m)] + a)
+
+
+def test_vload_vstore(ctx_factory):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<16 }",
+        "out[i,j] = 2*a[i,j] + b[i] + c[i,j+1]",
+        assumptions="n>=1")
+    knl = lp.add_and_infer_dtypes(knl,
+            dict(a=np.float32, b=np.float32, c=np.float32))
+    knl = lp.split_iname(knl, "j", 4, inner_tag="vec")
+    knl = lp.set_options(knl, use_vload_vstore=True)
+
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    assert "vstore4(" in code
+    assert "vload4(4 * i + " in code
+    # not known to be aligned
+    assert "vload4(0, c + " in code
+
+    queue = cl.CommandQueue(ctx)
+    n = 5
+    a = np.random.rand(n, 16).astype(np.float32)
+    b = np.random.rand(n).astype(np.float32)
+    c = np.random.rand(n, 17).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, b=b, c=c, n=n)
+
+    assert np.allclose(out, 2*a + b[:, np.newaxis] + c[:, 1:])
+
+
+def test_prefetch_vector_width(ctx_factory):
+    ctx = ctx_factory()
+
+    n = 32
+    knl = lp.make_kernel(
+        "{ [i,j,k]: 0<=i,j,k<%d }" % n,
+        "c[i, j] = sum(k, a[i, k]*b[k, j])")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32, b=np.float32))
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.1")
+    knl = lp.split_iname(knl, "j", 16, outer_tag="g.1", inner_tag="l.0")
+    knl = lp.split_iname(knl, "k", 16)
+
+    with pytest.raises(lp.LoopyError):
+        lp.add_prefetch(knl, "a", ["k_inner", "i_inner"], default_tag=None,
+                fetch_vector_width=3)
+
+    knl = lp.add_prefetch(knl, "a", ["k_inner", "i_inner"], default_tag=None,
+            dim_arg_names=["a_i", "a_k"], fetch_vector_width=4)
+    knl = lp.add_prefetch(knl, "b", ["j_inner", "k_inner"], default_tag=None,
+            dim_arg_names=["b_k", "b_j"], fetch_vector_width=4)
+    knl = lp.tag_inames(knl, dict(
+        a_i="l.1", a_k_outer="l.0", b_k="l.1", b_j_outer="l.0"))
+
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    assert "vstore4(vload4(" in code
+
+    queue = cl.CommandQueue(ctx)
+    a = np.random.rand(n, n).astype(np.float32)
+    b = np.random.rand(n, n).astype(np.float32)
+    evt, (c,) = knl(queue, a=a, b=b)
+
+    assert np.allclose(c, a.dot(b), rtol=1e-4)
+
+
+@pytest.mark.parametrize("double_buffer", [False, True])
+def test_async_prefetch(ctx_factory, double_buffer):
+    ctx = ctx_factory()
+
+    n = 64
+    knl = lp.make_kernel(
+        "{ [i,j,k]: 0<=i,j,k<%d }" % n,
+        "c[i, j] = sum(k, a[i, k]*b[k, j])")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32, b=np.float32))
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.1")
+    knl = lp.split_iname(knl, "j", 16, outer_tag="g.1", inner_tag="l.0")
+    knl = lp.split_iname(knl, "k", 16)
+
+    double_buffer_iname = "k_outer" if double_buffer else None
+    knl = lp.add_prefetch(knl, "a", ["k_inner", "i_inner"],
+            async_copy=True, double_buffer_iname=double_buffer_iname)
+    knl = lp.add_prefetch(knl, "b", ["j_inner", "k_inner"],
+            async_copy=True, double_buffer_iname=double_buffer_iname)
+
+    if double_buffer:
+        assert knl.temporary_variables["a_fetch_0"].shape == (2, 16, 16)
+
+    code = lp.generate_code(lp.get_one_scheduled_kernel(
+        lp.preprocess_kernel(knl)))[0]
+    assert "async_work_group_copy(" in code
+    assert "wait_group_events(" in code
+
+    queue = cl.CommandQueue(ctx)
+    a = np.random.rand(n, n).astype(np.float32)
+    b = np.random.rand(n, n).astype(np.float32)
+    evt, (c,) = knl(queue, a=a, b=b)
+
+    assert np.allclose(c, a.dot(b), rtol=1e-4)
+
+
+def test_rolling_prefetch(ctx_factory):
+    ctx = ctx_factory()
+
+    m = 64
+    knl = lp.make_kernel(
+        "{ [i,j]: 0<=i<n and 0<=j<%d }" % m,
+        "out[i, j] = u[i, j] + 2*u[i+1, j] + u[i+2, j]",
+        [
+            lp.GlobalArg("u", np.float32, shape=("n+2", m)),
+            lp.GlobalArg("out", np.float32, shape=("n", m)),
+            lp.ValueArg("n", np.int32),
+            ],
+        assumptions="n>=1")
+    knl = lp.split_iname(knl, "j", 16, outer_tag="g.0", inner_tag="l.0")
+
+    with pytest.raises(lp.LoopyError):
+        lp.add_prefetch(knl, "u", ["j_inner"], default_tag=None,
+                rolling_iname="j_outer")
+
+    knl = lp.add_prefetch(knl, "u", ["j_inner"], default_tag=None,
+            dim_arg_names=["u_i", "u_j"], rolling_iname="i")
+    knl = lp.tag_inames(knl, dict(u_j="l.0", u_j_init="l.0"))
+
+    from loopy.isl_helpers import static_max_of_pw_aff
+    from loopy.symbolic import pw_aff_to_expr
+
+    def get_length(iname):
+        return pw_aff_to_expr(static_max_of_pw_aff(
+            knl.get_iname_bounds(iname).size, constants_only=True))
+
+    # only one new row is fetched per iteration of i
+    assert get_length("u_i") == 1
+    assert get_length("u_i_init") == 3
+
+    queue = cl.CommandQueue(ctx)
+    n = 37
+    u = np.random.rand(n+2, m).astype(np.float32)
+    evt, (out,) = knl(queue, u=u, n=n)
+
+    assert np.allclose(out, u[:-2] + 2*u[1:-1] + u[2:])
+
+
+def test_share_temporary_storage(ctx_factory):
+    ctx = ctx_factory()
+
+    knl = lp.make_kernel(
+        "{[i,j,k,l]: 0<=i,j,k,l<16}",
+        """
+        <> a[i] = x[i]
+        <> c[j] = a[15-j] + a[j]
+        <> b[k] = 2*c[15-k]
+        out[l] = b[15-l]
+        """)
+    knl = lp.add_and_infer_dtypes(knl, dict(x=np.float32))
+    knl = lp.tag_inames(knl, dict(i="l.0", j="l.0", k="l.0", l="l.0"))
+    knl = lp.set_options(knl, share_temporary_storage=True)
+
+    sched_knl = lp.get_one_scheduled_kernel(lp.preprocess_kernel(knl))
+
+    from loopy.storage import share_temporary_storage
+    shared_knl = share_temporary_storage(sched_knl)
+
+    # a is dead (behind a barrier) by the time b is written, c is not
+    temps = shared_knl.temporary_variables
+    assert temps["a"].base_storage is not None
+    assert temps["a"].base_storage == temps["b"].base_storage
+    assert temps["c"].base_storage is None
+    assert shared_knl.local_mem_use() == 2*16*4 < sched_knl.local_mem_use()
+
+    queue = cl.CommandQueue(ctx)
+    x = np.random.rand(16).astype(np.float32)
+    evt, (out,) = knl(queue, x=x)
+
+    assert np.allclose(out, 2*(x + x[::-1]))
+
+
+def test_share_temporary_storage_loop_carried(ctx_factory):
+    ctx = ctx_factory()
+
+    # t[i-1] is read in the trip after it was written, so t must not share
+    # storage with s.
+    knl = lp.make_kernel(
+        "{[i]: 1<=i<8}",
+        """
+        t[i] = a[i]
+        out[i] = t[i] + t[i-1]
+        s[i] = 5*a[i]
+        out2[i] = s[i]
+        """,
+        [
+            lp.GlobalArg("a", np.float32, shape=8),
+            lp.GlobalArg("out,out2", np.float32, shape=8),
+            lp.TemporaryVariable("t", np.float32, shape=(8,), is_local=False),
+            lp.TemporaryVariable("s", np.float32, shape=(8,), is_local=False),
+            ])
+    knl = lp.set_options(knl, share_temporary_storage=True)
+
+    sched_knl = lp.get_one_scheduled_kernel(lp.preprocess_kernel(knl))
+
+    from loopy.storage import share_temporary_storage
+    temps = share_temporary_storage(sched_knl).temporary_variables
+    assert (temps["t"].base_storage is None
+            or temps["t"].base_storage != temps["s"].base_storage)
+
+    queue = cl.CommandQueue(ctx)
+    a = np.arange(8).astype(np.float32)
+    out = cl.array.zeros(queue, 8, np.float32)
+    out2 = cl.array.zeros(queue, 8, np.float32)
+    knl(queue, a=a, out=out, out2=out2)
+
+    # t[0] is never written
+    assert np.allclose(out.get()[2:], a[2:] + a[1:-1])
+    assert np.allclose(out2.get()[1:], 5*a[1:])
+
+
+def test_register_tile(ctx_factory):
+    ctx = ctx_factory()
+
+    n = 64
+    knl = lp.make_kernel(
+        "{[i,j,k]: 0<=i,j,k<%d}" % n,
+        "c[i, j] = sum(k, a[i, k]*b[k, j])")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32, b=np.float32))
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0")
+    knl = lp.split_iname(knl, "j", 16, outer_tag="g.1")
+    knl = lp.register_tile(knl, "i_inner,j_inner", 4,
+            outer_tags={"i_inner": "l.1", "j_inner": "l.0"})
+
+    assert knl.loop_priority[:2] == ["i_inner_outer", "j_inner_outer"]
+
+    temps = lp.preprocess_kernel(knl).temporary_variables
+    a_fetch, = [tv for name, tv in six.iteritems(temps) if "a_fetch" in name]
+    b_fetch, = [tv for name, tv in six.iteritems(temps) if "b_fetch" in name]
+    for tv in [a_fetch, b_fetch]:
+        assert tv.shape == (4,)
+        assert not tv.is_local
+    assert temps["acc_k"].shape == (4, 4)
+
+    queue = cl.CommandQueue(ctx)
+    a = np.random.rand(n, n).astype(np.float32)
+    b = np.random.rand(n, n).astype(np.float32)
+    evt, (c,) = knl(queue, a=a, b=b)
+
+    assert np.allclose(c, np.dot(a, b), rtol=1e-4)
+
+
+def test_tile(ctx_factory):
+    ctx = ctx_factory()
+    dev = ctx.devices[0]
+
+    n = 64
+    knl = lp.make_kernel(
+        "{[i,j,k]: 0<=i,j,k<%d}" % n,
+        "c[i, j] = sum(k, a[i, k]*b[k, j])")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32, b=np.float32))
+
+    sizes = lp.choose_tile_sizes(knl, "i,j", reduction_iname="k", device=dev)
+    assert sizes.work_group_size <= dev.max_work_group_size
+    assert sizes.local_mem_use <= sizes.usable_local_mem_size
+
+    queue = cl.CommandQueue(ctx)
+    a = np.random.rand(n, n).astype(np.float32)
+    b = np.random.rand(n, n).astype(np.float32)
+
+    for tile_sizes in [None, [8, 16]]:
+        tiled_knl = lp.tile(knl, "i,j", tile_sizes, reduction_iname="k",
+                device=dev)
+
+        if tile_sizes is not None:
+            assert (lp.preprocess_kernel(tiled_knl).local_mem_use()
+                    == 4*(8*8 + 8*16))
+        else:
+            assert (lp.preprocess_kernel(tiled_knl).local_mem_use()
+                    == sizes.local_mem_use)
+
+        evt, (c,) = tiled_knl(queue, a=a, b=b)
+        assert np.allclose(c, np.dot(a, b), rtol=1e-4)
+
+
+def test_cost_model_loop_priority_and_axes(ctx_factory):
+    ctx = ctx_factory()
+
+    # The second index of 'a' has unit stride, so 'i' should be innermost.
+    knl = lp.make_kernel(
+        "{[i,j]: 0<=i,j<n}",
+        "out[j, i] = 2*a[j, i]")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+
+    from loopy.cost_model import get_default_loop_priority
+    assert get_default_loop_priority(lp.preprocess_kernel(knl)) == ["j", "i"]
+
+    sched_knl = lp.get_one_scheduled_kernel(lp.preprocess_kernel(knl))
+    assert sched_knl.schedule[0].iname == "j"
+
+    queue = cl.CommandQueue(ctx)
+    a = np.random.rand(20, 20).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=a.shape[0])
+    assert np.allclose(out, 2*a)
+
+    # For a column-major array, the first axis of the fetch should end up
+    # on local axis 0.
+    knl = lp.make_kernel(
+        "{[i,j]: 0<=i,j<n}",
+        "out[i, j] = 2*a[i, j]",
+        [lp.GlobalArg("a", np.float32, shape="n,n", order="F"), "..."])
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.1")
+    knl = lp.split_iname(knl, "j", 16, outer_tag="g.1", inner_tag="l.0")
+    knl = lp.add_prefetch(knl, "a", ["i_inner", "j_inner"],
+            dim_arg_names=["a_i", "a_j"])
+
+    tags = lp.preprocess_kernel(knl).iname_to_tag
+    assert tags["a_i"] == lp.kernel.data.LocalIndexTag(0)
+    assert tags["a_j"] == lp.kernel.data.LocalIndexTag(1)
+
+    a = np.asfortranarray(np.random.rand(50, 50).astype(np.float32))
+    evt, (out,) = knl(queue, a=a, n=a.shape[0])
+    assert np.allclose(out, 2*a)
+
+
+def test_auto_local_size(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+        "{[i,j]: 0<=i<n and 0<=j<8}",
+        "out[i, j] = 2*a[i, j]")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+    knl = lp.tag_inames(knl, dict(i="l.auto", j="l.auto"))
+
+    # 'j' has unit stride and goes on axis 0, 'i' gets the remaining
+    # work items.
+    pknl = lp.preprocess_kernel(knl)
+    assert pknl.iname_to_tag["j"] == lp.kernel.data.LocalIndexTag(0)
+    _, local_size = pknl.get_grid_sizes_as_exprs()
+    assert local_size[0] == 8
+    assert local_size[1] > 1
+
+    a = np.random.rand(100, 8).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=100)
+    assert np.allclose(out, 2*a)
+
+    # resource use
+    from loopy.preprocess import choose_auto_local_size
+
+    def make_kernel_with_temp(temp):
+        return lp.tag_inames(
+                lp.make_kernel("{[i]: 0<=i<n}", "out[i] = 2*a[i]",
+                    [lp.GlobalArg("a,out", np.float32, shape="n"), "...",
+                        temp]),
+                dict(i="l.auto"))
+
+    plain_size = choose_auto_local_size(make_kernel_with_temp(
+        lp.TemporaryVariable("t", np.float32, shape=(1,), is_local=False)))
+    local_heavy_size = choose_auto_local_size(make_kernel_with_temp(
+        lp.TemporaryVariable("t", np.float32, shape=(4096,), is_local=True)))
+    private_heavy_size = choose_auto_local_size(make_kernel_with_temp(
+        lp.TemporaryVariable("t", np.float32, shape=(2048,), is_local=False)))
+
+    assert local_heavy_size[0] > plain_size[0]
+    assert private_heavy_size[0] < plain_size[0]
+
+    # tuning
+    tuned_knl = lp.tune_auto_local_size(knl, queue, parameters=dict(n=1000),
+            candidates=[(8, 4), (8, 16)], use_database=False)
+    assert tuned_knl.options.auto_local_size in [(8, 4), (8, 16)]
+
+    evt, (out,) = tuned_knl(queue, a=a, n=100)
+    assert np.allclose(out, 2*a)
+
+
+def test_fuse_kernels_eliminate_intermediates(ctx_factory):
+    ctx = ctx_factory()
+
+    knl_a = lp.make_kernel("{[i]: 0<=i<n}", "tmp[i] = 2*x[i]")
+    knl_b = lp.make_kernel("{[i]: 0<=i<n}", "y[i] = tmp[i] + 1")
+    knl_c = lp.make_kernel("{[i]: 0<=i<n}", "z[i] = y[i]*y[i]")
+    knl_shift = lp.make_kernel("{[j]: 0<=j<n-1}", "w[j] = y[j+1]")
+
+    with pytest.raises(lp.LoopyError):
+        lp.fuse_kernels([knl_a, knl_b, knl_shift],
+                eliminate_intermediates=["y"])
+
+    knl = lp.fuse_kernels([knl_a, knl_b, knl_c], eliminate_intermediates=True)
+
+    # tmp is read once and substituted, y is read twice and kept in a
+    # private scalar.
+    assert set(arg.name for arg in knl.args) == set(["n", "x", "z"])
+    assert knl.temporary_variables["y"].shape == ()
+
+    knl = lp.add_and_infer_dtypes(knl, dict(x=np.float32))
+    knl = lp.set_options(knl, return_dict=True)
+
+    queue = cl.CommandQueue(ctx)
+    x = np.random.rand(20).astype(np.float32)
+    evt, out = knl(queue, x=x, n=20)
+
+    assert np.allclose(out["z"], (2*x + 1)**2)
+
+
+def test_compiled_program(ctx_factory):
+    ctx = ctx_factory()
+
+    knl_twice = lp.make_kernel("{[i]: 0<=i<n}", "y[i] = 2*x[i]",
+            name="twice")
+    knl_incr = lp.make_kernel("{[i]: 0<=i<n}", "y[i] = x[i] + 1",
+            name="incr")
+    knl_twice = lp.add_and_infer_dtypes(knl_twice, dict(x=np.float64))
+    knl_incr = lp.add_and_infer_dtypes(knl_incr, dict(x=np.float64))
+
+    with pytest.raises(lp.LoopyError):
+        lp.CompiledProgram(ctx, [knl_twice, knl_twice])
+
+    prg = lp.CompiledProgram(ctx, [knl_twice, knl_incr])
+
+    code = prg.get_code()
+    assert code.count("__kernel") == 2
+    assert code.count("cl_khr_fp64") == 1
+
+    assert (prg["twice"].cl_kernel_info().cl_kernel.program
+            == prg["incr"].cl_kernel_info().cl_kernel.program)
+
+    queue = cl.CommandQueue(ctx)
+    x = np.random.rand(10)
+    evt, (y_twice,) = prg["twice"](queue, x=x, n=10)
+    evt, (y_incr,) = prg["incr"](queue, x=x, n=10)
+
+    assert np.allclose(y_twice, 2*x)
+    assert np.allclose(y_incr, x + 1)
+
+
 def test_multiple_writes_to_local_temporary():
     # Loopy would previously only handle barrier insertion correctly if exactly
     # one instruction wrote to each local temporary. This tests that multiple
@@ -2091,6 +2714,406 @@ def test_vectorize(ctx_factory):
             ref_knl, ctx, knl,
             parameters=dict(n=30))
 
+
+def test_invoker_module_cache(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[i] = 2*a[i]")
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.0")
+
+    a = np.arange(10, dtype=np.float32)
+
+    with lp.CacheMode(True):
+        evt, (out,) = knl(queue, a=a, n=len(a))
+        assert np.array_equal(out, 2*a)
+
+        cknl = lp.CompiledKernel(ctx, knl)
+        kernel_info = cknl.cl_kernel_info(
+                frozenset([("a", np.dtype(np.float32))]))
+
+        from os.path import dirname
+        from loopy.compiled import get_invoker_module_dir
+        assert (dirname(kernel_info.invoker.__code__.co_filename)
+                == get_invoker_module_dir())
+
+    with lp.CacheMode(False):
+        evt, (out,) = knl(queue, a=a, n=len(a))
+        assert np.array_equal(out, 2*a)
+
+
+def test_call_batched(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[i] = 2*a[i] + s")
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.0")
+
+    a_list = [np.random.rand(20).astype(np.float32) for i in range(3)]
+
+    cknl = lp.CompiledKernel(ctx, knl)
+    evts, outputs = cknl.call_batched(queue, [
+        dict(a=a, n=len(a), s=np.float32(1))
+        for a in a_list])
+
+    assert len(evts) == len(a_list)
+    for a, (out,) in zip(a_list, outputs):
+        assert np.allclose(out, 2*a + 1)
+
+    with pytest.raises(TypeError):
+        cknl.call_batched(queue, [
+            dict(a=a_list[0], n=20, s=np.float32(1)),
+            dict(a=a_list[0][:10], n=10, s=np.float32(1)),
+            ])
+
+
+def test_to_batched(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[i] = 2*a[i] + s")
+    knl = lp.split_iname(knl, "i", 16, outer_tag="g.0", inner_tag="l.0")
+
+    with pytest.raises(lp.LoopyError):
+        lp.to_batched(knl, "nbatches", ["a"])
+
+    bknl = lp.to_batched(knl, "nbatches", ["a", "out"])
+
+    a = np.random.rand(3, 20).astype(np.float32)
+    evt, (out,) = bknl(queue, a=a, n=a.shape[1], nbatches=a.shape[0],
+            s=np.float32(1))
+
+    assert np.allclose(out, 2*a + 1)
+
+
+def test_event_dependency_tracker(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx,
+            properties=cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE)
+
+    knl_double = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "b[i] = 2*a[i]")
+    knl_double = lp.split_iname(knl_double, "i", 16,
+            outer_tag="g.0", inner_tag="l.0")
+
+    knl_incr = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "c[i] = b[i] + 1")
+    knl_incr = lp.split_iname(knl_incr, "i", 16,
+            outer_tag="g.0", inner_tag="l.0")
+
+    import pyopencl.array as cl_array
+    a = cl_array.to_device(queue, np.random.rand(20).astype(np.float32))
+
+    tracker = lp.EventDependencyTracker()
+
+    evt_double, (b,) = knl_double(queue, a=a, n=20, dependency_tracker=tracker)
+
+    wait_for = tracker.get_wait_for(queue, [b.base_data], [])
+    assert [evt.int_ptr for evt in wait_for] == [evt_double.int_ptr]
+
+    evt_incr, (c,) = knl_incr(queue, b=b, n=20, dependency_tracker=tracker)
+
+    # overwriting b must wait for its writer and its reader, unless they
+    # have completed (and were forgotten)
+    wait_for = set(
+            evt.int_ptr
+            for evt in tracker.get_wait_for(queue, [], [b.base_data]))
+    complete = cl.command_execution_status.COMPLETE
+    for evt in [evt_double, evt_incr]:
+        assert (evt.int_ptr in wait_for
+                or evt.command_execution_status == complete)
+    assert wait_for <= set([evt_double.int_ptr, evt_incr.int_ptr])
+
+    evt_incr.wait()
+    assert np.allclose(c.get(), 2*a.get() + 1)
+
+    # completed launches are forgotten upon recording the next one
+    queue.finish()
+    evt_double, (b,) = knl_double(queue, a=a, n=20, dependency_tracker=tracker)
+    evt_double.wait()
+    assert set(tracker.last_write_events) == set([b.base_data.int_ptr])
+    assert set(tracker.read_events) == set([a.base_data.int_ptr])
+
+
+def test_autotune(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[i] = 2*a[i]")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+
+    def split(knl, group_size):
+        if group_size > 256:
+            raise lp.LoopyError("group too large")
+
+        return lp.split_iname(knl, "i", group_size,
+                outer_tag="g.0", inner_tag="l.0")
+
+    tuned_knl, variants = lp.autotune(knl, split,
+            dict(group_size=[16, 32, 1024]), queue,
+            parameters=dict(n=1000), timing_rounds=2,
+            use_database=False, return_variants=True)
+
+    assert len(variants) == 3
+    assert variants[-1].params == dict(group_size=1024)
+    assert variants[-1].elapsed is None
+    assert variants[0].kernel is tuned_knl
+    assert all(variant.elapsed is not None for variant in variants[:2])
+
+    # store to and retrieve from the tuning database
+    from loopy.autotune import get_tuning_db, _get_db_key
+    parameter_space = dict(group_size=[16, 32])
+    try:
+        del get_tuning_db()[_get_db_key(
+            knl, split, parameter_space, dict(n=1000), queue.device)]
+    except KeyError:
+        pass
+
+    lp.autotune(knl, split, parameter_space, queue,
+            parameters=dict(n=1000), timing_rounds=2)
+    db_knl, variants = lp.autotune(knl, split, parameter_space, queue,
+            parameters=dict(n=1000), timing_rounds=2,
+            return_variants=True)
+
+    assert variants == []
+    assert db_knl.iname_to_tag["i_inner"] == lp.kernel.data.LocalIndexTag(0)
+
+
+def test_benchmark(ctx_factory, tmpdir):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[i] = 2*a[i]")
+    knl = lp.add_and_infer_dtypes(knl, dict(a=np.float32))
+    knl = lp.split_iname(knl, "i", 128, outer_tag="g.0", inner_tag="l.0")
+
+    from loopy.benchmark import (benchmark, save_benchmarks, load_benchmarks,
+            compare_benchmarks)
+
+    n = 1024
+    result = benchmark(knl, queue, parameters=dict(n=n), timing_rounds=5)
+
+    assert result.rounds == 5
+    assert result.event_min <= result.event_median
+    assert result.flops == n
+    assert result.bytes_moved == 2*4*n
+    assert result.gflops_per_s > 0
+
+    filename = str(tmpdir.join("bench.json"))
+    save_benchmarks([result], filename)
+    baseline = load_benchmarks(filename)
+    assert baseline[0]["label"] == knl.name
+
+    faster_baseline = [dict(baseline[0], event_median=result.event_median/4)]
+    comparison, = compare_benchmarks([result], faster_baseline)
+    assert comparison.is_regression
+    comparison, = compare_benchmarks([result], baseline)
+    assert not comparison.is_regression
+
+
+@pytest.mark.parametrize("red_op, np_red_op", [
+    ("sum", np.sum),
+    ("max", np.max),
+    ])
+def test_local_parallel_reduction(ctx_factory, red_op, np_red_op):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i,j]: 0<=i<n and 0<=j<1000}",
+            "out[i] = %s(j, a[i,j])" % red_op,
+            [
+                lp.GlobalArg("a", np.float32, shape=("n", 1000)),
+                lp.GlobalArg("out", np.float32, shape="n"),
+                lp.ValueArg("n", np.int32),
+                ])
+
+    knl = lp.split_iname(knl, "i", 4, outer_tag="g.0", inner_tag="l.1")
+    knl = lp.split_iname(knl, "j", 100, inner_tag="l.0")
+
+    a = np.random.randn(20, 1000).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=20)
+
+    assert np.allclose(out, np_red_op(a, axis=1), rtol=1e-5, atol=1e-4)
+
+
+def test_local_parallel_argmax(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i,k]: 0<=i<300 and 0<=k<1}",
+            [
+                "<> result = argmax(i, fabs(a[i]))",
+                "max_idx[0] = result.index {inames=k}",
+                "max_val[0] = result.value {inames=k}",
+                ],
+            [
+                lp.GlobalArg("a", np.float32, shape=300),
+                lp.GlobalArg("max_idx", np.int32, shape=1),
+                lp.GlobalArg("max_val", np.float32, shape=1),
+                ])
+    knl = lp.tag_inames(knl, dict(i="l.0", k="l.0"))
+
+    a = np.random.randn(300).astype(np.float32)
+    evt, (max_idx, max_val) = knl(queue, a=a)
+
+    assert max_idx[0] == np.argmax(np.abs(a))
+    assert max_val[0] == np.max(np.abs(a))
+
+
+def test_forced_sequential_iname_not_made_local(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i,j]: 0<=i<n and 0<=j<16}",
+            "out[i] = sum(j, a[i,j])",
+            [
+                lp.GlobalArg("a", np.float32, shape=("n", 16)),
+                lp.GlobalArg("out", np.float32, shape="n"),
+                lp.ValueArg("n", np.int32),
+                ])
+
+    from loopy.kernel.data import ForceSequentialTag
+    knl = lp.tag_inames(knl, dict(i=ForceSequentialTag(), j=ForceSequentialTag()))
+
+    with pytest.raises(ValueError):
+        lp.tag_inames(knl, dict(i="l.0"))
+
+    # reduction inames may be made local-parallel
+    knl = lp.tag_inames(knl, dict(j="l.0"))
+
+    a = np.random.rand(10, 16).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=10)
+
+    assert np.allclose(out, a.sum(axis=1), rtol=1e-5)
+
+
+@pytest.mark.parametrize(("red_op", "np_red_op"), [
+    ("sum", np.sum),
+    ("max", np.max),
+    ])
+def test_two_stage_reduction(ctx_factory, red_op, np_red_op):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            "out[0] = %s(i, a[i]) {id=red}" % red_op,
+            [
+                lp.GlobalArg("a", np.float32, shape="n"),
+                lp.GlobalArg("out", np.float32, shape=1),
+                lp.ValueArg("n", np.int32),
+                ],
+            assumptions="n>=1")
+
+    knl = lp.TwoStageReductionKernel(ctx, knl, "red",
+            num_groups=8, group_size=32)
+
+    # not a multiple of num_groups*group_size
+    a = np.random.randn(10007).astype(np.float32)
+    evt, (out,) = knl(queue, a=a, n=a.size)
+
+    assert np.allclose(out[0], np_red_op(a), rtol=1e-4)
+
+
+def test_two_stage_argmax(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<n}",
+            [
+                "<> result = argmax(i, fabs(a[i])) {id=red}",
+                "max_idx[0] = result.index",
+                ],
+            [
+                lp.GlobalArg("a", np.float32, shape="n"),
+                lp.GlobalArg("max_idx", np.int32, shape=1),
+                lp.ValueArg("n", np.int32),
+                ],
+            assumptions="n>=1")
+
+    knl = lp.TwoStageReductionKernel(ctx, knl, "red",
+            num_groups=8, group_size=32)
+
+    a = np.random.randn(10007).astype(np.float32)
+    evt, (max_idx,) = knl(queue, a=a)
+
+    assert max_idx[0] == np.argmax(np.abs(a))
+
+
+@pytest.mark.parametrize(("kind", "scan_cond"), [
+    ("inclusive", "j<=i"),
+    ("exclusive", "j<i"),
+    ])
+@pytest.mark.parametrize("sweep_tag", [None, "l.0"])
+def test_scan(ctx_factory, kind, scan_cond, sweep_tag):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    # not a power of two
+    n = 100
+
+    knl = lp.make_kernel(
+            [
+                "{[i]: 0<=i<%d}" % n,
+                "{[j]: 0<=j and %s}" % scan_cond,
+                ],
+            "out[i] = sum(j, a[j])",
+            [
+                lp.GlobalArg("a", np.float32, shape=n),
+                lp.GlobalArg("out", np.float32, shape=n),
+                ])
+    knl = lp.tag_inames(knl, dict(i=sweep_tag))
+
+    a = np.random.rand(n).astype(np.float32)
+    evt, (out,) = knl(queue, a=a)
+
+    ref = np.cumsum(a)
+    if kind == "exclusive":
+        ref = np.concatenate([[0], ref[:-1]])
+
+    assert np.allclose(out, ref, rtol=1e-5)
+
+
+def test_triangular_reduction_not_a_scan(ctx_factory):
+    # The range of the 'sweep' candidate i depends on k, so this is not a scan
+    # along i.
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+
+    n = 20
+
+    knl = lp.make_kernel(
+            "{[i,j,k]: 0<=i<%d and 0<=j<=i and 0<=k<=i}" % n,
+            "out[i,k] = sum(j, a[j,k])",
+            [
+                lp.GlobalArg("a", np.float32, shape=(n, n)),
+                lp.GlobalArg("out", np.float32, shape=(n, n)),
+                ])
+
+    a = np.random.rand(n, n).astype(np.float32)
+    out = cl.array.zeros(queue, (n, n), np.float32)
+    knl(queue, a=a, out=out)
+
+    ref = np.tril(np.cumsum(a, axis=0))
+    assert np.allclose(out.get(), ref, rtol=1e-5)
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         exec(sys.argv[1])